@@ -0,0 +1,301 @@
+#! /usr/bin/python3
+#
+# module_exiftool_benchmarks
+#
+# Micro-benchmarks for the ExifTool handler (module_exiftool_python3.py).
+# Run all benchmarks, or only those named, with
+#
+#   python3 module_exiftool_benchmarks.py [benchmark_name ...]
+#
+import os, shutil, subprocess, sys, tempfile, timeit, yaml
+
+import module_exiftool_python3
+
+test_image_file_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "testimage.jpg")
+#
+###
+#
+def show_timing(description, total_seconds, number_of_calls):
+    print("  {:<40} {:>10.1f} us per call".format(
+        description, 1.0e6 * total_seconds / number_of_calls))
+#
+###
+#
+# Compares the former YAML parsing of ExifTool's JSON output with the JSON
+# decoding now used by Handler.extract.
+#
+def benchmark_extraction_parsing(number_of_calls=1000):
+    handler = module_exiftool_python3.Handler()
+    try:
+        exit_code, exiftool_return_string = handler.run_exiftool_command(
+            handler.return_exiftool_extraction_arguments(test_image_file_path))
+    except OSError:
+        exit_code = 1
+    if exit_code != 0:
+        print("  ExifTool is required for this benchmark.")
+        return
+
+    print("  {} bytes of ExifTool output for {}".format(
+        len(exiftool_return_string),
+        os.path.basename(test_image_file_path)))
+
+    total_seconds = timeit.timeit(
+        lambda: yaml.load(exiftool_return_string, Loader=yaml.SafeLoader)[0],
+        number=number_of_calls)
+    show_timing("yaml.SafeLoader", total_seconds, number_of_calls)
+
+    total_seconds = timeit.timeit(
+        lambda: handler.return_handler("json_decoder").decode(
+            exiftool_return_string.decode("utf8"))[0],
+        number=number_of_calls)
+    show_timing("json", total_seconds, number_of_calls)
+
+    if handler.return_handler("orjson") is not None:
+        total_seconds = timeit.timeit(
+            lambda: handler.return_parsed_extraction_output(
+                exiftool_return_string),
+            number=number_of_calls)
+        show_timing("orjson", total_seconds, number_of_calls)
+#
+###
+#
+# Compares building the recognised tags lookup tables from a synthetic
+# recognised tags file with loading them from the binary cache file.
+#
+def benchmark_recognised_tags_loading(number_of_tags=5000, number_of_calls=20):
+    handler = module_exiftool_python3.Handler()
+    working_directory = tempfile.mkdtemp(prefix="exiftool_handler_")
+    try:
+        source_file_path = os.path.join(
+            working_directory, "module_exiftool_recognised_tags.dat")
+        cache_file_path = os.path.join(
+            working_directory, "module_exiftool_recognised_tags.cache")
+        source_file = open(source_file_path, "w")
+        source_file.write("# Synthetic recognised tags file\n")
+        for tag_number in range(number_of_tags):
+            source_file.write("{} Group{}:Tag{}\n".format(
+                "+" if tag_number % 3 == 0 else " ",
+                tag_number % 50,
+                tag_number // 2))
+        source_file.close()
+        print("  {} tags".format(number_of_tags))
+
+        def load_without_cache():
+            if os.path.isfile(cache_file_path):
+                os.remove(cache_file_path)
+            handler.load_recognised_tags(source_file_path)
+
+        total_seconds = timeit.timeit(
+            load_without_cache, number=number_of_calls)
+        show_timing("without cache", total_seconds, number_of_calls)
+
+        handler.load_recognised_tags(source_file_path)
+        total_seconds = timeit.timeit(
+            lambda: handler.load_recognised_tags(source_file_path),
+            number=number_of_calls)
+        show_timing("with cache", total_seconds, number_of_calls)
+    finally:
+        shutil.rmtree(working_directory, ignore_errors=True)
+#
+###
+#
+# Compares parsing capture times from file names one at a time with
+# datetime.strptime against Handler.return_file_name_substitutions, which
+# parses the names of a whole batch at once.
+#
+def benchmark_file_name_substitutions(number_of_files=20000, number_of_calls=5):
+    import datetime
+    handler = module_exiftool_python3.Handler()
+    working_directory = tempfile.mkdtemp(prefix="exiftool_handler_")
+    try:
+        template_file_path = os.path.join(working_directory, "template.yaml")
+        template_file = open(template_file_path, "w")
+        template_file.write("- template_id: file_name_substitutions\n")
+        template_file.write("- XMP-xmp:CreateDate: \"{__capturetime__:%Y:%m:%d %H:%M:%S}\"\n")
+        template_file.write("- XMP-dc:Source: \"{__instrument__}\"\n")
+        template_file.close()
+        template_id = handler.load_a_template(template_file_path)
+    finally:
+        shutil.rmtree(working_directory, ignore_errors=True)
+
+    start_time = datetime.datetime(2022, 12, 1)
+    file_paths = [
+        "/data/ncas-cam-3/images/{:%Y%m%d/%H/%Y%m%d%H%M%S}-ncas-cam-3.jpg".format(
+            start_time + datetime.timedelta(seconds=file_number))
+        for file_number in range(number_of_files)]
+    print("  {} file names".format(number_of_files))
+
+    def parse_one_at_a_time():
+        for file_path in file_paths:
+            file_name = os.path.basename(file_path)
+            capture_time = datetime.datetime.strptime(
+                file_name[:14], "%Y%m%d%H%M%S")
+            instrument = file_name[15:].rsplit(".", 1)[0]
+
+    total_seconds = timeit.timeit(parse_one_at_a_time, number=number_of_calls)
+    show_timing("strptime per file", total_seconds, number_of_calls * number_of_files)
+
+    total_seconds = timeit.timeit(
+        lambda: handler.return_file_name_substitutions(template_id, file_paths),
+        number=number_of_calls)
+    show_timing("return_file_name_substitutions", total_seconds, number_of_calls * number_of_files)
+#
+###
+#
+# Compares loading a directory of synthetic templates one at a time with
+# Handler.load_a_template against Handler.load_templates_from_directory,
+# both without and with the compiled template cache.
+#
+def benchmark_template_loading(number_of_templates=50, number_of_calls=5):
+    working_directory = tempfile.mkdtemp(prefix="exiftool_handler_")
+    try:
+        template_file_paths = []
+        for template_number in range(number_of_templates):
+            template_file_path = os.path.join(
+                working_directory, "template_{}.yaml".format(template_number))
+            template_file = open(template_file_path, "w")
+            template_file.write("- template_id: template_{}\n".format(template_number))
+            template_file.write("- XMP-dc:Title: \"Title {}\"\n".format(template_number))
+            template_file.write("- XMP-dc:Subject: [\"one\", \"two\", \"{site}\"]\n")
+            template_file.write("- XMP-dc:Creator: \"{creator}\"\n")
+            template_file.write("- XMP-dc:Rights: \"Copyright {__utcnow__:%Y}\"\n")
+            template_file.close()
+            template_file_paths.append(template_file_path)
+        print("  {} templates".format(number_of_templates))
+
+        def load_one_at_a_time():
+            handler = module_exiftool_python3.Handler()
+            for template_file_path in template_file_paths:
+                handler.load_a_template(template_file_path)
+
+        def load_without_cache():
+            for file_name in os.listdir(working_directory):
+                if file_name.endswith(".cache.json"):
+                    os.remove(os.path.join(working_directory, file_name))
+            module_exiftool_python3.Handler().load_templates_from_directory(
+                working_directory)
+
+        total_seconds = timeit.timeit(
+            load_one_at_a_time, number=number_of_calls)
+        show_timing("load_a_template", total_seconds, number_of_calls)
+
+        total_seconds = timeit.timeit(
+            load_without_cache, number=number_of_calls)
+        show_timing("from directory without cache", total_seconds, number_of_calls)
+
+        module_exiftool_python3.Handler().load_templates_from_directory(
+            working_directory)
+        total_seconds = timeit.timeit(
+            lambda: module_exiftool_python3.Handler().load_templates_from_directory(
+                working_directory),
+            number=number_of_calls)
+        show_timing("from directory with cache", total_seconds, number_of_calls)
+    finally:
+        shutil.rmtree(working_directory, ignore_errors=True)
+#
+###
+#
+# Measures the time taken to import the handler module and create a
+# Handler, as an embed-only process would, and lists any of the modules that
+# are meant to be imported lazily that were imported. The standard library
+# modules that the handler module imports at start-up are imported before
+# the timing starts, so that the time measured is that of the module itself,
+# which does not depend on how quickly a machine imports the standard
+# library. Each measurement is made in a fresh interpreter, after one that
+# writes the module's bytecode cache, and the best of several is returned.
+#
+eagerly_imported_module_names = [
+    "codecs", "collections", "datetime", "itertools", "json", "os", "pickle",
+    "re", "shutil", "subprocess", "sys", "tempfile", "threading", "time"]
+lazily_imported_module_names = [
+    "asyncio", "multiprocessing", "platform", "string", "textwrap",
+    "xml.etree.ElementTree", "yaml"]
+import_time_budget_milliseconds = 20.0
+
+def return_import_time_measurement(number_of_interpreters=5):
+    measurement_code = "; ".join([
+        "import {}".format(", ".join(eagerly_imported_module_names)),
+        "start_time = time.perf_counter()",
+        "import module_exiftool_python3",
+        "module_exiftool_python3.Handler()",
+        "elapsed_time = time.perf_counter() - start_time",
+        "print(1000.0 * elapsed_time)",
+        "print(' '.join(sorted(name for name in {} if name in sys.modules)))".format(
+            lazily_imported_module_names)])
+
+    environment = dict(os.environ)
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+    best_milliseconds = None
+    for interpreter_number in range(number_of_interpreters + 1):
+        measurement_lines = subprocess.check_output(
+            [sys.executable, "-c", measurement_code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=environment).decode("utf8").splitlines()
+        milliseconds = float(measurement_lines[0])
+        if ((interpreter_number > 0) and
+            ((best_milliseconds is None) or (milliseconds < best_milliseconds))):
+            best_milliseconds = milliseconds
+        if len(measurement_lines) > 1:
+            unexpectedly_imported_module_names = measurement_lines[1].split()
+        else:
+            unexpectedly_imported_module_names = []
+
+    return best_milliseconds, unexpectedly_imported_module_names
+#
+###
+#
+# Checks the import time measured by return_import_time_measurement against
+# a budget. Returns False if the check fails. tests/test_import_time.py
+# checks only the lazy imports, since the time depends on the machine's load.
+#
+def benchmark_import_time(
+        budget_milliseconds=import_time_budget_milliseconds,
+        number_of_interpreters=5):
+
+    best_milliseconds, unexpectedly_imported_module_names = \
+        return_import_time_measurement(number_of_interpreters)
+
+    print("  {:<40} {:>10.1f} ms (budget {:.1f} ms)".format(
+        "import and Handler()", best_milliseconds, budget_milliseconds))
+
+    check_passed = True
+    if best_milliseconds > budget_milliseconds:
+        print("  FAILED: the import time budget was exceeded.")
+        check_passed = False
+    if len(unexpectedly_imported_module_names) > 0:
+        print("  FAILED: modules imported eagerly: {}".format(
+            ", ".join(unexpectedly_imported_module_names)))
+        check_passed = False
+
+    return check_passed
+#
+###
+#
+benchmarks = {
+    "extraction_parsing": benchmark_extraction_parsing,
+    "file_name_substitutions": benchmark_file_name_substitutions,
+    "import_time": benchmark_import_time,
+    "recognised_tags_loading": benchmark_recognised_tags_loading,
+    "template_loading": benchmark_template_loading}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        benchmark_names = sys.argv[1:]
+    else:
+        benchmark_names = sorted(benchmarks)
+
+    for benchmark_name in benchmark_names:
+        if benchmark_name not in benchmarks:
+            print('Benchmark "{}" is not recognised. Choose from: {}.'.format(
+                benchmark_name, ", ".join(sorted(benchmarks))))
+            sys.exit(1)
+
+    all_checks_passed = True
+    for benchmark_name in benchmark_names:
+        print(benchmark_name)
+        if benchmarks[benchmark_name]() == False:
+            all_checks_passed = False
+
+    if not all_checks_passed:
+        sys.exit(1)
@@ -7,13 +7,117 @@
 # 
 # Last updated 2022/10/12
 #
-import datetime, os, platform, subprocess, string, sys, textwrap, yaml
+import codecs, collections, datetime, itertools, json, os, pickle, re, shutil, subprocess, sys, tempfile, threading, time
+#
+# The modules needed only for display, template loading, parallel or
+# asynchronous operation and native XMP handling (asyncio, multiprocessing,
+# platform, string, textwrap, xml.etree.ElementTree, yaml and the optional
+# orjson) are imported where they are first used. This keeps start-up fast
+# for short-lived, embed-only processes.
+#
+###
+#
+# The per-call state of a Handler: the scratch variables written by its
+# methods while they run, and the extracted and prepared metadata. Each
+# thread has its own context, created from the initial values of the
+# per-call variables the first time the thread uses the Handler.
+#
+class HandlerContext(threading.local):
+    def __init__(self, initial_variables):
+        import copy
+        self.variables = copy.deepcopy(initial_variables)
+        self.metadata = {"extracted": {}, "prepared": {}}
+#
+###
+#
+# The variables of a Handler. Shared variables are held in the dictionary
+# itself, while those named in "per_call_variable_names" are read from and
+# written to the HandlerContext of the calling thread, so that existing
+# lookups of self.variables need not change.
+#
+class HandlerVariables(dict):
+    def __init__(self, shared_variables, context):
+        dict.__init__(self, shared_variables)
+        self.per_call_variable_names = \
+            frozenset(shared_variables["per_call_variable_names"])
+        self.context = context
+#
+###
+#
+    def __missing__(self, variable_name):
+        return self.context.variables[variable_name]
+#
+###
+#
+    def __setitem__(self, variable_name, value):
+        if variable_name in self.per_call_variable_names:
+            self.context.variables[variable_name] = value
+        else:
+            dict.__setitem__(self, variable_name, value)
+#
+###
+#
+    def __contains__(self, variable_name):
+        if variable_name in self.per_call_variable_names:
+            return variable_name in self.context.variables
+        return dict.__contains__(self, variable_name)
+#
+###
+#
+# The outcome of embedding metadata in one file, returned by the batch and
+# asynchronous embedding methods when should_return_results is True. The
+# status is "embedded", "skipped" (the file was already tagged, according
+# to the journal or its embedded fingerprint) or "failed", in which case
+# error_code is one of "metadata_not_prepared", "invalid_file_path",
+# "file_not_ready", "extraction_failed" (its existing metadata could not be
+# read for the overwrite check), "tag_overwrite" or "exiftool_failed", and
+# is otherwise "". tags_written holds the full tag names written and
+# overwritten_tags those that the file already had, or None if the file was
+# not checked for overwrites. The stage timings are in seconds. For the
+# batch methods the ExifTool time of a batch is shared equally between its
+# files, and prepared metadata shared by several files are timed for the
+# first only.
+# See Handler.return_embedding_results_summary for aggregation.
+#
+class EmbeddingResult():
+    __slots__ = (
+        "file_path", "status", "error_code", "tags_written",
+        "overwritten_tags", "prepare_seconds", "check_seconds",
+        "write_seconds")
+
+    def __init__(
+            self, file_path, status, error_code="", tags_written=(),
+            overwritten_tags=None, prepare_seconds=0.0, check_seconds=0.0,
+            write_seconds=0.0):
+        self.file_path = file_path
+        self.status = status
+        self.error_code = error_code
+        self.tags_written = tags_written
+        self.overwritten_tags = overwritten_tags
+        self.prepare_seconds = prepare_seconds
+        self.check_seconds = check_seconds
+        self.write_seconds = write_seconds
+#
+###
+#
+    @property
+    def exit_code(self):
+        if self.status == "failed":
+            return 1
+        return 0
+#
+###
+#
+    def __repr__(self):
+        return "EmbeddingResult({!r}, {!r}, error_code={!r}, tags_written={})".format(
+            self.file_path, self.status, self.error_code,
+            len(self.tags_written))
 #
 ###
 #
 class Handler():
     def __init__(self):
-        self.variables = {
+        variables = {
             "no_general_error_has_been_registered": True ,
             "no_template_error_has_been_registered": True ,
             "string_types": [str],
@@ -29,6 +133,15 @@ class Handler():
             "standard_tag_names": [
                 "XMP-xmp:MetadataDate", "XMP-xmp:ModifyDate"],
             "global_substitution_keys": ["__utcnow__", "__utcnowstr__"],
+            "file_name_pattern": re.compile(
+                r"^(?P<capturetime>\d{14})-(?P<instrument>.+?)\.[^.]*$"),
+            "capture_time_format": "%Y%m%d%H%M%S",
+            "capture_time_slices": {
+                "Y": (0, 4), "m": (4, 6), "d": (6, 8),
+                "H": (8, 10), "M": (10, 12), "S": (12, 14)},
+            "capture_time_length": 14,
+            "file_substitution_keys": [
+                "__capturetime__", "__capturetimestr__", "__instrument__"],
             "datetime_format": {
                 "none": "{:%Y:%m:%d %H:%M:%S}",
                 "Z": "{:%Y:%m:%d %H:%M:%S}Z"},
@@ -40,9 +153,177 @@ class Handler():
             "metadata_datetime_string": {},
             "python_version": sys.version_info[0],
             "display_wrapped_line_format": "    {}",
-            "operating_system": platform.system()
+            "operating_system": None,
+            "exiftool_process": None,
+            "exiftool_command_number": 0,
+            "stay_open_exiftool_arguments": [
+                "exiftool", "-stay_open", "True", "-@", "-"],
+            "section_status_pattern": re.compile(r"^=(.*)=section(\d+)$"),
+            "json_separator_characters": " \t\r\n[],",
+            "maximum_number_of_paths_per_extraction": 500,
+            "registered_error_messages": None,
+            "number_of_shards_per_worker": 4,
+            "journal": None,
+            "journal_file_path": "",
+            "maximum_number_of_paths_per_journal_lookup": 500,
+            "fingerprint_tag_name": "XMP-exiftoolhandler:Fingerprint",
+            "fingerprint_prefix": "exiftool-handler:",
+            "exiftool_config_file_path": os.path.abspath(
+                __file__[:__file__.rfind("_python")] + "_user_defined_tags.config"),
+            "exiftool_argument_cache": {},
+            "validated_substitution_key_sets": {},
+            "maximum_number_of_files_per_chunk": 500,
+            "template_file_name_extensions": (".yaml", ".yml"),
+            "recognised_tags_source": None,
+            "replaceable_template_file_path": "",
+            "per_call_variable_names": [
+                "no_general_error_has_been_registered",
+                "no_template_error_has_been_registered",
+                "registered_error_messages",
+                "source_of_metadata",
+                "unrecognised_tags",
+                "metadata_datetime",
+                "metadata_datetime_string",
+                "supplied_tag_name",
+                "supplied_tag_name_is_valid",
+                "supplied_tag_name_is_recognised",
+                "supplied_tag_name_type",
+                "supplied_tag_name_supports_multiple_values",
+                "full_tag_name_for_supplied_tag_name",
+                "short_tag_name_for_supplied_tag_name",
+                "reason_for_supplied_tag_name_invalidity",
+                "supplied_tag_value_is_valid",
+                "tag_value_contains_multiple_values",
+                "substitutions",
+                "substitutions_for_prepared_metadata",
+                "prepared_metadata_mode",
+                "source_of_prepared_metadata_value",
+                "display_order_of_options",
+                "show_options_format",
+                "display_unwrapped_line_format",
+                "display_maximum_length_for_unwrapped_line",
+                "replaceable_template_file_path"],
+            "recognised_tags_variable_names": [
+                "tag_supports_multiple_values",
+                "full_tag_name_for_unambiguous_short_tag_name",
+                "group_name_for_unambiguous_short_tag_name",
+                "group_names_for_ambiguous_short_tag_name",
+                "recognised_tags_order"],
+            "prepared_metadata_cache": collections.OrderedDict(),
+            "prepared_metadata_cache_hits": 0,
+            "prepared_metadata_cache_misses": 0,
+            "file_readiness_stability_window": 0.5,
+            "file_readiness_maximum_wait": 10.0,
+            "jpeg_file_name_extensions": (".jpg", ".jpeg", ".jpe"),
+            "jpeg_start_of_image_marker": b"\xff\xd8",
+            "jpeg_end_of_image_marker": b"\xff\xd9",
+            "jpeg_tail_length": 64,
+            "jpeg_xmp_identifier": b"http://ns.adobe.com/xap/1.0/\x00",
+            "jpeg_extended_xmp_identifier": b"http://ns.adobe.com/xmp/extension/\x00",
+            "maximum_jpeg_segment_length": 65535,
+            "xmp_packet_padding": (" " * 99 + "\n") * 24,
+            "xmp_toolkit": "module_exiftool_python3",
+            "xmp_namespaces": {
+                "x": "adobe:ns:meta/",
+                "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+                "xml": "http://www.w3.org/XML/1998/namespace",
+                "dc": "http://purl.org/dc/elements/1.1/",
+                "exiftoolhandler": "https://github.com/dahooper/exiftool-handler/ns/1.0/",
+                "photoshop": "http://ns.adobe.com/photoshop/1.0/",
+                "xmp": "http://ns.adobe.com/xap/1.0/",
+                "xmpRights": "http://ns.adobe.com/xap/1.0/rights/"},
+            "xmp_date_pattern": re.compile(
+                r"^(\d{4}):(\d{2}):(\d{2})( \d{2}:\d{2}:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:\d{2})?$"),
+            "exif_identifier": b"Exif\x00\x00",
+            "native_exif_tags": {
+                "IFD0": {
+                    0x010E: "ImageDescription",
+                    0x010F: "Make",
+                    0x0110: "Model",
+                    0x0131: "Software",
+                    0x0132: "ModifyDate",
+                    0x013B: "Artist",
+                    0x8298: "Copyright"},
+                "ExifIFD": {
+                    0x9003: "DateTimeOriginal",
+                    0x9004: "CreateDate",
+                    0x9010: "OffsetTime",
+                    0x9011: "OffsetTimeOriginal",
+                    0x9012: "OffsetTimeDigitized",
+                    0x9286: "UserComment",
+                    0x9290: "SubSecTime",
+                    0x9291: "SubSecTimeOriginal",
+                    0x9292: "SubSecTimeDigitized",
+                    0xA420: "ImageUniqueID",
+                    0xA430: "OwnerName",
+                    0xA431: "SerialNumber",
+                    0xA433: "LensMake",
+                    0xA434: "LensModel",
+                    0xA435: "LensSerialNumber"}},
+            "exif_ifd_pointer_tag": 0x8769,
+            "json_number_pattern": re.compile(
+                r"^-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?$"),
+            "json_exponent_pattern": re.compile(rb"[0-9][eE][-+]?[0-9]"),
+            "yaml_float_pattern": re.compile(
+                r"^[-+]?[0-9][0-9_]*\.[0-9_]*([eE][-+][0-9]+)?$"),
+            "xmp_exiftool_date_pattern": re.compile(
+                r"^(\d{4})-(\d{2})-(\d{2})(T(\d{2}:\d{2}(:\d{2}(\.\d+)?)?))?(Z|[+-]\d{2}:\d{2})?$"),
+            "native_xmp_properties": {
+                "XMP-dc:Contributor": ["dc", "contributor", "bag", False],
+                "XMP-dc:Coverage": ["dc", "coverage", "simple", False],
+                "XMP-dc:Creator": ["dc", "creator", "seq", False],
+                "XMP-dc:Date": ["dc", "date", "seq", True],
+                "XMP-dc:Description": ["dc", "description", "lang_alt", False],
+                "XMP-dc:Format": ["dc", "format", "simple", False],
+                "XMP-dc:Identifier": ["dc", "identifier", "simple", False],
+                "XMP-dc:Language": ["dc", "language", "bag", False],
+                "XMP-dc:Publisher": ["dc", "publisher", "bag", False],
+                "XMP-dc:Relation": ["dc", "relation", "bag", False],
+                "XMP-dc:Rights": ["dc", "rights", "lang_alt", False],
+                "XMP-dc:Source": ["dc", "source", "simple", False],
+                "XMP-dc:Subject": ["dc", "subject", "bag", False],
+                "XMP-dc:Title": ["dc", "title", "lang_alt", False],
+                "XMP-dc:Type": ["dc", "type", "bag", False],
+                "XMP-exiftoolhandler:Fingerprint": ["exiftoolhandler", "Fingerprint", "simple", False],
+                "XMP-photoshop:AuthorsPosition": ["photoshop", "AuthorsPosition", "simple", False],
+                "XMP-photoshop:CaptionWriter": ["photoshop", "CaptionWriter", "simple", False],
+                "XMP-photoshop:Category": ["photoshop", "Category", "simple", False],
+                "XMP-photoshop:City": ["photoshop", "City", "simple", False],
+                "XMP-photoshop:Country": ["photoshop", "Country", "simple", False],
+                "XMP-photoshop:Credit": ["photoshop", "Credit", "simple", False],
+                "XMP-photoshop:DateCreated": ["photoshop", "DateCreated", "simple", True],
+                "XMP-photoshop:Headline": ["photoshop", "Headline", "simple", False],
+                "XMP-photoshop:Instructions": ["photoshop", "Instructions", "simple", False],
+                "XMP-photoshop:Source": ["photoshop", "Source", "simple", False],
+                "XMP-photoshop:State": ["photoshop", "State", "simple", False],
+                "XMP-photoshop:SupplementalCategories": ["photoshop", "SupplementalCategories", "bag", False],
+                "XMP-photoshop:TransmissionReference": ["photoshop", "TransmissionReference", "simple", False],
+                "XMP-xmp:CreateDate": ["xmp", "CreateDate", "simple", True],
+                "XMP-xmp:CreatorTool": ["xmp", "CreatorTool", "simple", False],
+                "XMP-xmp:Label": ["xmp", "Label", "simple", False],
+                "XMP-xmp:MetadataDate": ["xmp", "MetadataDate", "simple", True],
+                "XMP-xmp:ModifyDate": ["xmp", "ModifyDate", "simple", True],
+                "XMP-xmp:Nickname": ["xmp", "Nickname", "simple", False],
+                "XMP-xmpRights:Owner": ["xmpRights", "Owner", "bag", False],
+                "XMP-xmpRights:UsageTerms": ["xmpRights", "UsageTerms", "lang_alt", False],
+                "XMP-xmpRights:WebStatement": ["xmpRights", "WebStatement", "simple", False]}
         }
 #
+# The scratch variables written by each call, and the extracted and prepared
+# metadata, are held in a per-thread context (see HandlerContext), so that
+# one Handler may be used by many threads at once. The remaining variables,
+# the templates and the options are shared. They are only read while
+# metadata are extracted and embedded, apart from the caches, the
+# persistent ExifTool process and the journal, which are guarded by the
+# locks in self.locks. Options should be set before a Handler is shared.
+#
+        per_call_variables = {}
+        for variable_name in variables["per_call_variable_names"]:
+            if variable_name in variables:
+                per_call_variables[variable_name] = variables.pop(variable_name)
+        self.context = HandlerContext(per_call_variables)
+        self.variables = HandlerVariables(variables, self.context)
+#
 ###
 #
 # Python 2: unblock the following code line
@@ -73,57 +354,127 @@ class Handler():
                 "value": 1},
             "show_data_types": {
                 "permissible_values": [False, True],
-                "value": True} }
-
-        self.variables["display_order_of_options"] = \
-            sorted ( self.options.keys() )
-        maximum_length_of_option_name = 0
-        for option_name in self.variables["display_order_of_options"]:
-            length_of_option_name = len(option_name)
-            if length_of_option_name > maximum_length_of_option_name:
-                maximum_length_of_option_name = length_of_option_name
-        self.variables["show_options_format"] = \
-            " {:>" + str(maximum_length_of_option_name) + "}: {:<5} {}"
+                "value": True},
+            "persistent_exiftool": {
+                "permissible_values": [False, True],
+                "value": False},
+            "xmp_writer": {
+                "permissible_values": ["exiftool", "native"],
+                "value": "exiftool"},
+            "native_jpeg_reader": {
+                "permissible_values": [False, True],
+                "value": False},
+            "blind_write": {
+                "permissible_values": [False, True],
+                "value": False},
+            "extraction_profile": {
+                "permissible_values": ["full", "template_only", "fast"],
+                "value": "full"},
+            "fast_scan_level": {
+                "permissible_values": [1, 2],
+                "value": 1},
+            "prepared_metadata_cache_size": {
+                "permissible_values": "integers >= 0",
+                "minimum_value": 0,
+                "value": 0},
+            "check_file_readiness": {
+                "permissible_values": [False, True],
+                "value": False},
+            "embed_fingerprint": {
+                "permissible_values": [False, True],
+                "value": False} }
 
-        self.handlers = {
-            "indented_message": textwrap.TextWrapper(
-                width = 78,
-                initial_indent = "",
-                subsequent_indent = "  "),
-            "unindented_message": textwrap.TextWrapper(
-                width = 78,
-                initial_indent = "",
-                subsequent_indent = ""),
-            "string": string.Formatter()}
+        self.handlers = {}
+        self.locks = {
+            "templates": threading.RLock(),
+            "exiftool_process": threading.RLock(),
+            "prepared_metadata_cache": threading.Lock(),
+            "journal": threading.Lock()}
 
-        self.metadata = {"extracted": {}, "prepared": {}}
         self.templates = {}
 
         self.load_recognised_tags()
 #
 ###
+#
+    def return_handler(self, handler_name):
+        if handler_name not in self.handlers:
+            if handler_name == "indented_message":
+                import textwrap
+                self.handlers[handler_name] = textwrap.TextWrapper(
+                    width = 78,
+                    initial_indent = "",
+                    subsequent_indent = "  ")
+            elif handler_name == "unindented_message":
+                import textwrap
+                self.handlers[handler_name] = textwrap.TextWrapper(
+                    width = 78,
+                    initial_indent = "",
+                    subsequent_indent = "")
+            elif handler_name == "string":
+                import string
+                self.handlers[handler_name] = string.Formatter()
+            elif handler_name == "yaml_loader":
+#
+# libyaml's CSafeLoader is used if PyYAML has been built with it, since it
+# parses templates several times faster than the pure-Python SafeLoader.
+#
+                import yaml
+                self.handlers[handler_name] = getattr(
+                    yaml, "CSafeLoader", yaml.SafeLoader)
+            elif handler_name == "json_decoder":
+                self.handlers[handler_name] = json.JSONDecoder(
+                    parse_float=self.return_yaml_compatible_float)
+            elif handler_name == "orjson":
+#
+# orjson is optional. If it is installed it is used to decode ExifTool's JSON
+# output more quickly.
+#
+                try:
+                    import orjson
+                except ImportError:
+                    orjson = None
+                self.handlers[handler_name] = orjson
+
+        return self.handlers[handler_name]
+#
+###
+#
+# The extracted and prepared metadata of the calling thread.
+#
+    @property
+    def metadata(self):
+        return self.context.metadata
+#
+###
 #
     def register_a_general_error(self, function_name, message):
         self.variables["no_general_error_has_been_registered"] = False
+        if self.variables["registered_error_messages"] is not None:
+            self.variables["registered_error_messages"].append(
+                "{}(). {}".format(function_name, message))
         if self.options["verbosity_level"]["value"] > 0:
             expanded_message = "\033[1mGENERAL ERROR\033[0m {}.{}.{}(). {}".format(
                 self.__class__.__module__, 
                 self.__class__.__name__, 
                 function_name, 
                 message)
-            print(self.handlers["indented_message"].fill(expanded_message))
+            print(self.return_handler("indented_message").fill(expanded_message))
 #
 ###
 #
     def register_a_template_error(self, function_name, message):
         self.variables["no_template_error_has_been_registered"] = False
+        if self.variables["registered_error_messages"] is not None:
+            self.variables["registered_error_messages"].append(
+                "{}(). {}".format(function_name, message))
         if self.options["verbosity_level"]["value"] > 0:
             expanded_message = "\033[1mTEMPLATE ERROR\033[0m {}.{}.{}(). {}".format(
                 self.__class__.__module__, 
                 self.__class__.__name__, 
                 function_name, 
                 message)
-            print(self.handlers["indented_message"].fill(expanded_message))
+            print(self.return_handler("indented_message").fill(expanded_message))
 #
 ###
 #
@@ -134,11 +485,21 @@ class Handler():
                 self.__class__.__name__, 
                 function_name, 
                 message)
-            print(self.handlers["indented_message"].fill(expanded_message))
+            print(self.return_handler("indented_message").fill(expanded_message))
 #
 ###
 #
     def show_options(self):
+        self.variables["display_order_of_options"] = \
+            sorted ( self.options.keys() )
+        maximum_length_of_option_name = 0
+        for option_name in self.variables["display_order_of_options"]:
+            length_of_option_name = len(option_name)
+            if length_of_option_name > maximum_length_of_option_name:
+                maximum_length_of_option_name = length_of_option_name
+        self.variables["show_options_format"] = \
+            " {:>" + str(maximum_length_of_option_name) + "}: {:<5} {}"
+
         print("")
         print(self.variables["show_options_format"].format(
             "Option", "Value", "Permissible Values"))
@@ -164,7 +525,24 @@ class Handler():
                 'An unrecognised option name was supplied.')
             self.show_options()
 
-        elif option_value not in self.options[option_name]["permissible_values"]:
+        elif (("minimum_value" in self.options[option_name]) and
+              (type(option_value) != int)):
+            self.register_a_general_error(
+                function_name, 
+                'The supplied value for option "{}" must be an integer.'.format(option_name))
+            self.show_options()
+
+        elif (("minimum_value" in self.options[option_name]) and
+              (option_value < self.options[option_name]["minimum_value"])):
+            self.register_a_general_error(
+                function_name, 
+                'The supplied value for option "{}" may not be less than {}.'.format(
+                    option_name,
+                    self.options[option_name]["minimum_value"]))
+            self.show_options()
+
+        elif (("minimum_value" not in self.options[option_name]) and
+              (option_value not in self.options[option_name]["permissible_values"])):
             self.register_a_general_error(
                 function_name, 
                 'The supplied value for option "{}" is not permissible.'.format(option_name))
@@ -172,10 +550,21 @@ class Handler():
 
         else:
             self.options[option_name]["value"] = option_value
+            self.variables["exiftool_argument_cache"] = {}
+            self.variables["prepared_metadata_cache"].clear()
+
+            if option_name == "persistent_exiftool" and not option_value:
+                self.close()
+            if option_name == "embed_fingerprint":
+                self.close()
 #
 ###
 #
-    def load_recognised_tags(self):
+# The lookup tables built from the recognised tags file are cached in a
+# binary file alongside it, and reused for as long as the modification time
+# and size of the recognised tags file are unchanged.
+#
+    def load_recognised_tags(self, source_file_path=None):
         function_name = "load_recognised_tags"
 
         self.variables["no_general_error_has_been_registered"] = True
@@ -184,8 +573,17 @@ class Handler():
         self.variables["group_name_for_unambiguous_short_tag_name"] = {}
         self.variables["group_names_for_ambiguous_short_tag_name"] = {}
 
-        final_character_index = __file__ .rfind("_python")
-        source_file_path = __file__[:final_character_index] + "_recognised_tags.dat"
+        if source_file_path is None:
+            final_character_index = __file__ .rfind("_python")
+            source_file_path = __file__[:final_character_index] + "_recognised_tags.dat"
+
+        self.variables["recognised_tags_source"] = (
+            os.path.abspath(source_file_path),
+            self.return_recognised_tags_cache_details(source_file_path)[1])
+
+        if self.load_recognised_tags_from_cache(source_file_path):
+            return
+
         if not os.path.isfile(source_file_path):
             self.register_a_general_error(function_name, 'Source file "{}" is not available.'.format(source_file_path))
         else:
@@ -240,6 +638,8 @@ class Handler():
             self.variables["recognised_tags_order"] = \
                 sorted( self.variables["tag_supports_multiple_values"].keys() )
 
+            self.save_recognised_tags_to_cache(source_file_path)
+
         else:
             self.variables["tag_supports_multiple_values"] = {}
             self.variables["full_tag_name_for_unambiguous_short_tag_name"] = {}
@@ -247,6 +647,85 @@ class Handler():
             self.variables["group_names_for_ambiguous_short_tag_name"] = {}
 #
 ###
+#
+    def return_recognised_tags_cache_details(self, source_file_path):
+        cache_file_path = os.path.splitext(source_file_path)[0] + ".cache"
+        try:
+            source_file_status = os.stat(source_file_path)
+        except OSError:
+            return cache_file_path, None
+
+        cache_key = (
+            sys.version_info[:2],
+            source_file_status.st_mtime_ns,
+            source_file_status.st_size)
+
+        return cache_file_path, cache_key
+#
+###
+#
+    def load_recognised_tags_from_cache(self, source_file_path):
+        cache_file_path, cache_key = \
+            self.return_recognised_tags_cache_details(source_file_path)
+        if cache_key is None:
+            return False
+
+        try:
+            cache_file = open(cache_file_path, "rb")
+            try:
+                cached_details = pickle.load(cache_file)
+            finally:
+                cache_file.close()
+        except Exception:
+            return False
+
+        if ((type(cached_details) != dict) or
+            (cached_details.get("cache_key") != cache_key)):
+            return False
+
+        for variable_name in self.variables["recognised_tags_variable_names"]:
+            if variable_name not in cached_details:
+                return False
+
+        for variable_name in self.variables["recognised_tags_variable_names"]:
+            self.variables[variable_name] = cached_details[variable_name]
+
+        return True
+#
+###
+#
+    def save_recognised_tags_to_cache(self, source_file_path):
+        cache_file_path, cache_key = \
+            self.return_recognised_tags_cache_details(source_file_path)
+        if cache_key is None:
+            return
+
+        cached_details = {"cache_key": cache_key}
+        for variable_name in self.variables["recognised_tags_variable_names"]:
+            cached_details[variable_name] = self.variables[variable_name]
+
+        temporary_file_path = None
+        try:
+            file_descriptor, temporary_file_path = tempfile.mkstemp(
+                dir=os.path.dirname(cache_file_path), suffix=".tmp")
+            temporary_file = os.fdopen(file_descriptor, "wb")
+            try:
+                pickle.dump(
+                    cached_details, temporary_file, pickle.HIGHEST_PROTOCOL)
+            finally:
+                temporary_file.close()
+            os.replace(temporary_file_path, cache_file_path)
+            temporary_file_path = None
+        except OSError:
+            pass
+        finally:
+            if temporary_file_path is not None:
+                try:
+                    os.remove(temporary_file_path)
+                except OSError:
+                    pass
+#
+###
 #
     def show_recognised_tags(self):
         print("")
@@ -275,65 +754,358 @@ class Handler():
 #
 ###
 #
-    def load_a_template(self, file_path):
+    def load_a_template(
+            self, file_path, should_replace_existing_template=False,
+            parsed_template=None):
+
         function_name = "load_a_template"
 
         self.variables["no_template_error_has_been_registered"] = True
-        self.variables["templates"]["__latest__"] = {
-            "template_id": "",
-            "supplied_tag_name_for_entry": [],
-            "full_tag_name_for_entry": [],
-            "entry_indices_of_unrecognised_tags": [],
-            "usage_details_for_substitution_key": {}}
-
-        if not os.path.isfile(file_path):
-            self.register_a_general_error(
-                function_name, 
-                'Supplied file path "{}" is invalid.'.format(file_path))
-        else:
-            self.variables["templates"]["__latest__"]["file_path"] = \
+        if should_replace_existing_template:
+            self.variables["replaceable_template_file_path"] = \
                 os.path.abspath(file_path)
-            self.variables["templates"]["__latest__"]["file_name"] = \
-                os.path.basename(file_path)
-            try:
-                self.templates["__latest__"] = yaml.load(
-                    open(file_path, "r"), 
-                    Loader=yaml.SafeLoader)
-            except yaml.YAMLError as exception_message:
-                self.register_a_template_error(
+        else:
+            self.variables["replaceable_template_file_path"] = ""
+
+        with self.locks["templates"]:
+            self.variables["templates"]["__latest__"] = {
+                "template_id": "",
+                "supplied_tag_name_for_entry": [],
+                "full_tag_name_for_entry": [],
+                "entry_indices_of_unrecognised_tags": [],
+                "usage_details_for_substitution_key": {}}
+
+            if not os.path.isfile(file_path):
+                self.register_a_general_error(
                     function_name, 
-                    "Template file failed yaml parsing.")
-                print(exception_message)
+                    'Supplied file path "{}" is invalid.'.format(file_path))
             else:
-                self.check_latest_template_for_conformity()
-
-        if self.variables["no_template_error_has_been_registered"]:
-            self.scan_latest_template_for_substitutions()
-            template_id = \
-                self.variables["templates"]["__latest__"]["template_id"]
-            self.templates[template_id] = \
-                self.templates.pop("__latest__")
-            self.variables["templates"][template_id] = \
-                self.variables["templates"].pop("__latest__")
-
-            number_of_unrecognised_tags = len(self.variables["templates"][template_id]["entry_indices_of_unrecognised_tags"])
-            if number_of_unrecognised_tags > 0:
-                self.show_a_warning_message(
+                self.variables["templates"]["__latest__"]["file_path"] = \
+                    os.path.abspath(file_path)
+                self.variables["templates"]["__latest__"]["file_name"] = \
+                    os.path.basename(file_path)
+                template_was_parsed = True
+                if parsed_template is None:
+                    import yaml
+                    try:
+                        parsed_template = yaml.load(
+                            open(file_path, "r"), 
+                            Loader=self.return_handler("yaml_loader"))
+                    except yaml.YAMLError as exception_message:
+                        self.register_a_template_error(
+                            function_name, 
+                            "Template file failed yaml parsing.")
+                        print(exception_message)
+                        template_was_parsed = False
+
+                if template_was_parsed:
+                    self.templates["__latest__"] = parsed_template
+                    self.check_latest_template_for_conformity()
+
+            if self.variables["no_template_error_has_been_registered"]:
+                self.scan_latest_template_for_substitutions()
+                self.compile_template("__latest__")
+                template_id = \
+                    self.variables["templates"]["__latest__"]["template_id"]
+                self.install_template(
                     function_name,
-                    '{} unrecognised tags have been given in template "{}". These cannot be used to embed unless a relevant entry is given in the accompanying file "module_exiftool_recognised_tags.dat".'.format(
-                        number_of_unrecognised_tags,
-                        template_id))
-                unrecognised_tag_number = 1
-                for entry_index in self.variables["templates"][template_id]["entry_indices_of_unrecognised_tags"]:
-                    print("     [{}] {}".format(
-                        unrecognised_tag_number,
-                        self.variables["templates"][template_id]["supplied_tag_name_for_entry"][entry_index]))
-
-                    unrecognised_tag_number += 1
-
-            return template_id
-        else:
-            return ""
+                    template_id,
+                    self.templates.pop("__latest__"),
+                    self.variables["templates"].pop("__latest__"))
+
+                return template_id
+            else:
+                return ""
+#
+###
+#
+# Makes a loaded and compiled template available under its identifier,
+# replacing any template already loaded with that identifier, and discards
+# the cached values that were derived from the replaced template. The
+# template details are replaced in a single step, so that other threads see
+# either the former or the new template.
+#
+    def install_template(
+            self, function_name, template_id, template, template_details):
+
+        template_details["compiled_per_file_entries"] = \
+            self.return_per_file_entries(template_details)
+        self.templates[template_id] = template
+        self.variables["templates"][template_id] = template_details
+        self.variables["exiftool_argument_cache"].pop(template_id, None)
+        self.variables["validated_substitution_key_sets"].pop(template_id, None)
+        with self.locks["prepared_metadata_cache"]:
+            self.variables["prepared_metadata_cache"].clear()
+
+        number_of_unrecognised_tags = len(template_details["entry_indices_of_unrecognised_tags"])
+        if number_of_unrecognised_tags > 0:
+            self.show_a_warning_message(
+                function_name,
+                '{} unrecognised tags have been given in template "{}". These cannot be used to embed unless a relevant entry is given in the accompanying file "module_exiftool_recognised_tags.dat".'.format(
+                    number_of_unrecognised_tags,
+                    template_id))
+            unrecognised_tag_number = 1
+            for entry_index in template_details["entry_indices_of_unrecognised_tags"]:
+                print("     [{}] {}".format(
+                    unrecognised_tag_number,
+                    template_details["supplied_tag_name_for_entry"][entry_index]))
+
+                unrecognised_tag_number += 1
+#
+###
+#
+# Each template file loaded by load_templates_from_directory is cached, with
+# its compiled details, in a JSON file alongside it with the extension
+# ".cache.json". A cached template is used if the Python version and the
+# recognised tags are unchanged and either the modification time and size
+# of the template file are unchanged or, failing that, its content hash is.
+# The file state recorded for a template is (modification time, size,
+# content hash).
+#
+    def return_template_cache_details(self, file_path):
+        cache_file_path = os.path.splitext(file_path)[0] + ".cache.json"
+        cache_key = json.dumps([
+            list(sys.version_info[:2]),
+            self.variables["recognised_tags_source"]])
+
+        return cache_file_path, cache_key
+#
+###
+#
+# JSON has no tuples, so the compiled entries and the file state of a cached
+# template are converted back to the tuples that compile_template and
+# load_templates_from_directory use.
+#
+    def load_template_from_cache(self, file_path, file_status):
+        cache_file_path, cache_key = \
+            self.return_template_cache_details(file_path)
+
+        try:
+            cache_file = open(cache_file_path, "r", encoding="utf8")
+            try:
+                cached_details = json.load(cache_file)
+            finally:
+                cache_file.close()
+        except (IOError, OSError, ValueError):
+            return None
+
+        if ((type(cached_details) != dict) or
+            (cached_details.get("cache_key") != cache_key) or
+            ("template" not in cached_details) or
+            (type(cached_details.get("template_details")) != dict) or
+            ("file_state" not in cached_details["template_details"])):
+            return None
+
+        template_details = cached_details["template_details"]
+        try:
+            for entries_name in ["compiled_dynamic_entries",
+                                 "compiled_time_dependent_entries"]:
+                template_details[entries_name] = [
+                    (supplied_tag_name, full_tag_name, tag_value_is_list,
+                     [tuple(compiled_value) for compiled_value in compiled_values])
+                    for supplied_tag_name, full_tag_name, tag_value_is_list, compiled_values
+                    in template_details[entries_name]]
+            file_state = tuple(template_details["file_state"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        if file_state[:2] != (file_status.st_mtime_ns, file_status.st_size):
+            try:
+                content_hash = return_template_file_content_hash(file_path)
+            except (IOError, OSError):
+                return None
+            if content_hash != file_state[2]:
+                return None
+            file_state = \
+                (file_status.st_mtime_ns, file_status.st_size, content_hash)
+        template_details["file_state"] = file_state
+
+        return cached_details
+#
+###
+#
+# The compiled entries that depend on the file name pattern are not cached,
+# as they are recomputed when a template is installed. A template whose
+# values cannot be represented in JSON is not cached.
+#
+    def save_template_to_cache(self, file_path, template, template_details):
+        cache_file_path, cache_key = \
+            self.return_template_cache_details(file_path)
+
+        cached_template_details = dict(template_details)
+        cached_template_details.pop("compiled_per_file_entries", None)
+        try:
+            cache_text = json.dumps({
+                "cache_key": cache_key,
+                "template": template,
+                "template_details": cached_template_details},
+                ensure_ascii=False)
+        except (TypeError, ValueError):
+            return
+
+        temporary_file_path = None
+        try:
+            file_descriptor, temporary_file_path = tempfile.mkstemp(
+                dir=os.path.dirname(cache_file_path), suffix=".tmp")
+            temporary_file = os.fdopen(file_descriptor, "w", encoding="utf8")
+            try:
+                temporary_file.write(cache_text)
+            finally:
+                temporary_file.close()
+            os.replace(temporary_file_path, cache_file_path)
+            temporary_file_path = None
+        except OSError:
+            pass
+        finally:
+            if temporary_file_path is not None:
+                try:
+                    os.remove(temporary_file_path)
+                except OSError:
+                    pass
+#
+###
+#
+# Removes a loaded template, and the cached values derived from it.
+#
+    def unload_a_template(self, template_id):
+        with self.locks["templates"]:
+            self.templates.pop(template_id, None)
+            self.variables["templates"].pop(template_id, None)
+            self.variables["exiftool_argument_cache"].pop(template_id, None)
+            self.variables["validated_substitution_key_sets"].pop(template_id, None)
+        with self.locks["prepared_metadata_cache"]:
+            self.variables["prepared_metadata_cache"].clear()
+#
+###
+#
+# Loads every template file (".yaml" or ".yml") in a directory. Templates
+# already loaded from a file whose modification time and size are unchanged
+# are kept as they are, and those found in the template cache are used
+# without parsing. The remaining files are parsed, checked, compiled and
+# cached. They are parsed in this process, as starting a pool of worker
+# processes costs more than parsing even dozens of small templates. A
+# template whose file has changed replaces the one loaded from it before,
+# and if its identifier has changed, the template with the former
+# identifier is unloaded, as are templates whose files have been removed
+# from the directory. Calling this method again therefore reloads changed
+# templates into a running process. A template with the same identifier as
+# one loaded from a different file is rejected. Returns a dictionary of
+# template identifiers, keyed on template file path, with "" for files that
+# could not be loaded.
+#
+    def load_templates_from_directory(self, directory_path):
+
+        function_name = "load_templates_from_directory"
+        self.variables["no_general_error_has_been_registered"] = True
+
+        if not os.path.isdir(directory_path):
+            self.register_a_general_error(
+                function_name, 
+                'Supplied directory path "{}" is invalid.'.format(
+                    directory_path))
+            return {}
+
+        directory_path = os.path.abspath(directory_path)
+        template_file_paths = []
+        for file_name in sorted(os.listdir(directory_path)):
+            file_path = os.path.join(directory_path, file_name)
+            if (file_name.lower().endswith(self.variables["template_file_name_extensions"]) and
+                os.path.isfile(file_path)):
+                template_file_paths.append(file_path)
+
+        with self.locks["templates"]:
+            loaded_template_id_for_file_path = {}
+            for template_id in self.variables["templates"]:
+                if template_id != "__latest__":
+                    loaded_template_id_for_file_path[
+                        self.variables["templates"][template_id].get("file_path")] = \
+                        template_id
+
+            template_id_for_file_path = {}
+            file_status_for_file_path = {}
+            file_paths_to_parse = []
+            for file_path in template_file_paths:
+                try:
+                    file_status = os.stat(file_path)
+                except OSError:
+                    template_id_for_file_path[file_path] = ""
+                    continue
+                file_status_for_file_path[file_path] = file_status
+
+                if file_path in loaded_template_id_for_file_path:
+                    template_id = loaded_template_id_for_file_path[file_path]
+                    loaded_file_state = \
+                        self.variables["templates"][template_id].get("file_state")
+                    if ((loaded_file_state is not None) and
+                        (loaded_file_state[:2] == (file_status.st_mtime_ns, file_status.st_size))):
+                        template_id_for_file_path[file_path] = template_id
+                        continue
+
+                cached_details = self.load_template_from_cache(file_path, file_status)
+                if cached_details is None:
+                    file_paths_to_parse.append(file_path)
+                    continue
+
+                template_id = cached_details["template_details"]["template_id"]
+                if ((template_id in self.variables["templates"]) and
+                    (self.variables["templates"][template_id].get("file_path") != file_path)):
+                    self.register_a_template_error(
+                        function_name, 
+                        'A template with identifier "{}" has already been loaded.'.format(
+                            template_id))
+                    template_id_for_file_path[file_path] = ""
+                    continue
+
+                self.install_template(
+                    function_name,
+                    template_id,
+                    cached_details["template"],
+                    cached_details["template_details"])
+                template_id_for_file_path[file_path] = template_id
+
+            for file_path in file_paths_to_parse:
+                parsed_template, content_hash, error_message = \
+                    parse_template_file(file_path)
+                if error_message != "":
+                    self.register_a_template_error(
+                        function_name, 
+                        'Template file "{}" could not be parsed. {}'.format(
+                            file_path, error_message))
+                    template_id_for_file_path[file_path] = ""
+                    continue
+
+                template_id = self.load_a_template(
+                    file_path, True, parsed_template)
+                template_id_for_file_path[file_path] = template_id
+                if template_id != "":
+                    file_status = file_status_for_file_path[file_path]
+                    self.variables["templates"][template_id]["file_state"] = \
+                        (file_status.st_mtime_ns, file_status.st_size, content_hash)
+                    self.save_template_to_cache(
+                        file_path,
+                        self.templates[template_id],
+                        self.variables["templates"][template_id])
+
+            for file_path in loaded_template_id_for_file_path:
+                template_id = loaded_template_id_for_file_path[file_path]
+                if file_path in template_id_for_file_path:
+                    if template_id_for_file_path[file_path] not in ["", template_id]:
+                        self.unload_a_template(template_id)
+                elif ((type(file_path) in self.variables["string_types"]) and
+                      (os.path.dirname(file_path) == directory_path) and
+                      file_path.lower().endswith(self.variables["template_file_name_extensions"]) and
+                      not os.path.isfile(file_path)):
+                    self.unload_a_template(template_id)
+
+        number_of_failures = list(template_id_for_file_path.values()).count("")
+        if number_of_failures > 0:
+            self.register_a_general_error(
+                function_name,
+                "{} of {} template files could not be loaded.".format(
+                    number_of_failures,
+                    len(template_file_paths)))
+
+        return template_id_for_file_path
 #
 ###
 #
@@ -391,7 +1163,9 @@ class Handler():
                                     'Entry {} contains a repeat instance of "template_id".'.format(
                                         entry_number))
 
-                            if template_id in self.templates:
+                            if ((template_id in self.templates) and
+                                (self.variables["templates"][template_id].get("file_path") !=
+                                 self.variables["replaceable_template_file_path"])):
                                 self.register_a_template_error(
                                     function_name, 
                                     'A template with identifier "{}" has already been loaded.'.format(
@@ -562,7 +1336,7 @@ class Handler():
 ###
 #
     def scan_tag_value_for_substitutions(self, supplied_tag_name, tag_value):
-        for text_fragment in self.handlers["string"].parse(tag_value):
+        for text_fragment in self.return_handler("string").parse(tag_value):
             if text_fragment[1] != None:
                 substitution_key = text_fragment[1]
                 usage_details = 'Supplied tag name "{}", format "{}"'.format(supplied_tag_name, text_fragment[2])
@@ -575,6 +1349,107 @@ class Handler():
                     self.variables["templates"]["__latest__"]["usage_details_for_substitution_key"][substitution_key].append(usage_details)
 #
 ###
+#
+# Compiles a loaded template for use in "live" mode. Values without
+# substitution fields are rendered once here and kept in
+# "compiled_constant_metadata". Entries with at least one substitution field
+# are kept in "compiled_dynamic_entries" as
+#   (supplied tag name, full tag name, list flag, [(constant flag, text)])
+# so that only their format strings need to be evaluated for each file. The
+# dynamic entries that use a global (time) substitution key are also listed
+# in "compiled_time_dependent_entries".
+#
+    def compile_template(self, template_id):
+        template_details = self.variables["templates"][template_id]
+        template_details["compiled_constant_metadata"] = {}
+        template_details["compiled_dynamic_entries"] = []
+        template_details["compiled_time_dependent_entries"] = []
+        template_details["compiled_unrecognised_tags"] = []
+        template_details["supplied_tag_name_for_full_tag_name"] = {}
+
+        entry_index = 0
+        while entry_index < len(template_details["supplied_tag_name_for_entry"]):
+            supplied_tag_name = \
+                template_details["supplied_tag_name_for_entry"][entry_index]
+            full_tag_name = \
+                template_details["full_tag_name_for_entry"][entry_index]
+            if supplied_tag_name != "template_id":
+                template_details["supplied_tag_name_for_full_tag_name"][full_tag_name] = supplied_tag_name
+                if entry_index in template_details["entry_indices_of_unrecognised_tags"]:
+                    template_details["compiled_unrecognised_tags"].append(
+                        full_tag_name)
+
+                raw_tag_value = self.templates[template_id][entry_index][supplied_tag_name]
+                tag_value_is_list = (type(raw_tag_value) == list)
+                if tag_value_is_list:
+                    raw_tag_values = raw_tag_value
+                else:
+                    raw_tag_values = [raw_tag_value]
+
+                compiled_values = []
+                entry_is_constant = True
+                entry_is_time_dependent = False
+                for raw_value in raw_tag_values:
+                    try:
+                        value_is_constant = True
+                        for text_fragment in self.return_handler("string").parse(raw_value):
+                            if text_fragment[1] != None:
+                                value_is_constant = False
+                                if text_fragment[1] in self.variables["global_substitution_keys"]:
+                                    entry_is_time_dependent = True
+                        if value_is_constant:
+                            compiled_values.append((True, raw_value.format()))
+                    except (ValueError, IndexError, KeyError):
+                        value_is_constant = False
+                        entry_is_time_dependent = True
+
+                    if not value_is_constant:
+                        entry_is_constant = False
+                        compiled_values.append((False, raw_value))
+
+                if entry_is_constant and tag_value_is_list:
+                    template_details["compiled_constant_metadata"][full_tag_name] = \
+                        [compiled_value[1] for compiled_value in compiled_values]
+                elif entry_is_constant:
+                    template_details["compiled_constant_metadata"][full_tag_name] = \
+                        compiled_values[0][1]
+                else:
+                    template_details["compiled_dynamic_entries"].append((
+                        supplied_tag_name, 
+                        full_tag_name, 
+                        tag_value_is_list, 
+                        compiled_values))
+                    if entry_is_time_dependent:
+                        template_details["compiled_time_dependent_entries"].append(
+                            template_details["compiled_dynamic_entries"][-1])
+
+            entry_index += 1
+#
+###
+#
+# Returns the dynamic entries of a compiled template that are evaluated for
+# each file even when its prepared metadata are found in the cache (see
+# prepare_metadata_from_compiled_template). These are the time-dependent
+# entries and those that use a substitution key provided by file names,
+# which depends on the current file name pattern.
+#
+    def return_per_file_entries(self, template_details):
+        file_substitution_keys = set(self.variables["file_substitution_keys"])
+        per_file_entries = []
+        for dynamic_entry in template_details["compiled_dynamic_entries"]:
+            entry_is_per_file = \
+                dynamic_entry in template_details["compiled_time_dependent_entries"]
+            for value_is_constant, text in dynamic_entry[3]:
+                if not (value_is_constant or entry_is_per_file):
+                    for text_fragment in self.return_handler("string").parse(text):
+                        if text_fragment[1] in file_substitution_keys:
+                            entry_is_per_file = True
+            if entry_is_per_file:
+                per_file_entries.append(dynamic_entry)
+
+        return per_file_entries
+#
+###
 #
     def show_templates_available(self):
         print("")
@@ -613,10 +1488,10 @@ class Handler():
             print("")
             if len(self.variables["templates"][template_id]["usage_details_for_substitution_key"]) == 0:
 
-                print(self.handlers["unindented_message"].fill('Metadata template "{}" does not require any substitutions.'.format(template_id)))
+                print(self.return_handler("unindented_message").fill('Metadata template "{}" does not require any substitutions.'.format(template_id)))
 
             else:
-                print(self.handlers["unindented_message"].fill('Metadata template \033[1m{}\033[0m uses substitutions in the following ways:'.format(template_id)))
+                print(self.return_handler("unindented_message").fill('Metadata template \033[1m{}\033[0m uses substitutions in the following ways:'.format(template_id)))
                 print("")
                 
                 substitution_keys = sorted( self.variables["templates"][template_id]["usage_details_for_substitution_key"].keys() )
@@ -630,6 +1505,10 @@ class Handler():
 ###
 #
     def return_file_path_for_os(self, supplied_file_path):
+        if self.variables["operating_system"] is None:
+            import platform
+            self.variables["operating_system"] = platform.system()
+
         if self.variables["operating_system"].startswith("CYGWIN"):
             file_path_for_os = subprocess.check_output(
                 ["cygpath", "-w", supplied_file_path]).rstrip()
@@ -639,6 +1518,289 @@ class Handler():
         return file_path_for_os
 #
 ###
+#
+# The "persistent_exiftool" option keeps a single ExifTool process running in
+# "-stay_open" mode. Commands are written to its standard input, one argument
+# per line, and each is terminated by a numbered "-execute" marker. The exit
+# status of each command is echoed to standard error after the command.
+#
+    def start_exiftool_process(self):
+        function_name = "start_exiftool_process"
+
+        try:
+            self.variables["exiftool_process"] = subprocess.Popen(
+                self.return_exiftool_command(
+                    self.variables["stay_open_exiftool_arguments"]),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+        except OSError:
+            self.variables["exiftool_process"] = None
+            self.register_a_general_error(
+                function_name,
+                "ExifTool could not be started in stay_open mode.")
+#
+###
+#
+# Returns an ExifTool command line, given as a list starting with
+# "exiftool". If the "embed_fingerprint" option is True, the accompanying
+# ExifTool configuration file, which defines the custom XMP namespace of the
+# fingerprint tag, is added. It must be the first argument.
+#
+    def return_exiftool_command(self, exiftool_arguments):
+        if not self.options["embed_fingerprint"]["value"]:
+            return exiftool_arguments
+        return exiftool_arguments[:1] + \
+            ["-config", self.variables["exiftool_config_file_path"]] + \
+            exiftool_arguments[1:]
+#
+###
+#
+    def return_exiftool_argument_line(self, argument):
+        if type(argument) == bytes:
+            argument = argument.decode("utf8")
+
+        if ("\n" in argument) or ("\r" in argument):
+            escaped_argument = argument.replace("\\", "\\\\")
+            escaped_argument = escaped_argument.replace("\n", "\\n")
+            escaped_argument = escaped_argument.replace("\r", "\\r")
+            argument_line = "#[CSTR]" + escaped_argument
+        else:
+            argument_line = argument
+
+        return argument_line + "\n"
+#
+###
+#
+    def read_exiftool_stream_until(self, stream, end_marker):
+        received_bytes = b""
+        while not received_bytes.rstrip().endswith(end_marker):
+            received_block = os.read(stream.fileno(), 65536)
+            if received_block == b"":
+                raise OSError("ExifTool closed its output unexpectedly.")
+            received_bytes += received_block
+
+        return received_bytes.rstrip()[:-len(end_marker)]
+#
+###
+#
+# Reads a stream, as read_exiftool_stream_until, in a thread of its own. The
+# bytes received are appended to received_strings, which is left empty if
+# the stream could not be read.
+#
+    def read_exiftool_stream_in_thread(
+            self, stream, end_marker, received_strings):
+        try:
+            received_strings.append(
+                self.read_exiftool_stream_until(stream, end_marker))
+        except (OSError, ValueError):
+            pass
+#
+###
+#
+    def run_exiftool_command(self, exiftool_arguments, should_capture_output=True):
+        function_name = "run_exiftool_command"
+
+        if not self.options["persistent_exiftool"]["value"]:
+            if should_capture_output:
+                exiftool_process = subprocess.Popen(
+                    self.return_exiftool_command(exiftool_arguments),
+                    stdout=subprocess.PIPE)
+                exiftool_return_string = exiftool_process.communicate()[0]
+                exit_code = exiftool_process.returncode
+            else:
+                exiftool_return_string = b""
+                exit_code = subprocess.call(
+                    self.return_exiftool_command(exiftool_arguments))
+
+            return exit_code, exiftool_return_string
+
+        with self.locks["exiftool_process"]:
+            return self.run_exiftool_command_in_process(
+                exiftool_arguments, should_capture_output)
+#
+###
+#
+# Runs a command with the persistent ExifTool process. Commands from
+# different threads are run one at a time. Standard error is read by a
+# second thread while standard output is read, since ExifTool would block
+# if either pipe filled while the other was being waited on.
+#
+    def run_exiftool_command_in_process(
+            self, exiftool_arguments, should_capture_output):
+        function_name = "run_exiftool_command"
+
+        if ((self.variables["exiftool_process"] is None) or
+            (self.variables["exiftool_process"].poll() is not None)):
+            self.start_exiftool_process()
+            if self.variables["exiftool_process"] is None:
+                return 1, b""
+
+        self.variables["exiftool_command_number"] += 1
+        command_number = self.variables["exiftool_command_number"]
+        status_marker = "=post{}".format(command_number)
+        command_lines = [
+            self.return_exiftool_argument_line(argument)
+            for argument in exiftool_arguments[1:]]
+        command_lines.append("-echo4\n")
+        command_lines.append("=${{status}}{}\n".format(status_marker))
+        command_lines.append("-execute{}\n".format(command_number))
+
+        exiftool_process = self.variables["exiftool_process"]
+        exiftool_error_strings = []
+        error_reader = threading.Thread(
+            target=self.read_exiftool_stream_in_thread,
+            args=(exiftool_process.stderr,
+                  status_marker.encode("utf8"),
+                  exiftool_error_strings),
+            daemon=True)
+        error_reader.start()
+        try:
+            exiftool_process.stdin.write("".join(command_lines).encode("utf8"))
+            exiftool_process.stdin.flush()
+            exiftool_return_string = self.read_exiftool_stream_until(
+                exiftool_process.stdout,
+                "{{ready{}}}".format(command_number).encode("utf8"))
+            error_reader.join()
+            if len(exiftool_error_strings) == 0:
+                raise OSError("ExifTool closed its error output unexpectedly.")
+        except (OSError, ValueError):
+            self.close()
+            error_reader.join()
+            self.register_a_general_error(
+                function_name,
+                "Communication with the stay_open ExifTool process failed.")
+            return 1, b""
+
+        exiftool_error_string = exiftool_error_strings[0]
+
+        error_text, separator, status_text = \
+            exiftool_error_string.rpartition(b"=")
+        try:
+            exit_code = int(status_text)
+        except ValueError:
+            exit_code = 1
+        if error_text.strip() != b"":
+            sys.stderr.write(error_text.decode("utf8", "replace") + "\n")
+
+        if not should_capture_output:
+            if exiftool_return_string != b"":
+                print(exiftool_return_string.decode("utf8", "replace").rstrip())
+            exiftool_return_string = b""
+
+        return exit_code, exiftool_return_string
+#
+###
+#
+# A batch of ExifTool commands is written to a single argument file, with the
+# commands separated by "-execute", and run by one ExifTool process. The exit
+# status of each command is echoed to standard error so that it can be
+# returned for each section separately.
+#
+    def run_exiftool_sections(self, sections, argument_file_directory=None):
+        function_name = "run_exiftool_sections"
+
+        exit_codes = [1] * len(sections)
+        if len(sections) == 0:
+            return exit_codes
+
+        if argument_file_directory is None:
+            working_directory = tempfile.mkdtemp(prefix="exiftool_handler_")
+        else:
+            working_directory = argument_file_directory
+
+        try:
+            argument_file_path = os.path.join(
+                working_directory, "sections.args")
+            argument_file = open(argument_file_path, "wb")
+            section_index = 0
+            for section in sections:
+                if section_index > 0:
+                    argument_file.write(b"-execute\n")
+                section_lines = [
+                    self.return_exiftool_argument_line(argument)
+                    for argument in section]
+                section_lines.append("-echo4\n")
+                section_lines.append(
+                    "=${{status}}=section{}\n".format(section_index))
+                argument_file.write("".join(section_lines).encode("utf8"))
+                section_index += 1
+            argument_file.close()
+
+            try:
+                exiftool_process = subprocess.Popen(
+                    self.return_exiftool_command(
+                        ["exiftool", "-@", argument_file_path]),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE)
+                exiftool_return_string, exiftool_error_string = \
+                    exiftool_process.communicate()
+            except OSError:
+                self.register_a_general_error(
+                    function_name,
+                    "ExifTool could not be started.")
+                return exit_codes
+        finally:
+            if argument_file_directory is None:
+                shutil.rmtree(working_directory, ignore_errors=True)
+
+        if self.options["verbosity_level"]["value"] > 1:
+            print(exiftool_return_string.decode("utf8", "replace").rstrip())
+
+        status_was_echoed = False
+        for error_line in exiftool_error_string.decode(
+                "utf8", "replace").splitlines():
+            status_match = self.variables["section_status_pattern"].match(
+                error_line)
+            if status_match is None:
+                sys.stderr.write(error_line + "\n")
+            else:
+                status_was_echoed = True
+                try:
+                    exit_codes[int(status_match.group(2))] = \
+                        int(status_match.group(1))
+                except (ValueError, IndexError):
+                    pass
+
+        if (not status_was_echoed) and exiftool_process.returncode == 0:
+            exit_codes = [0] * len(sections)
+
+        return exit_codes
+#
+###
+#
+    def close(self):
+        with self.locks["exiftool_process"]:
+            exiftool_process = self.variables["exiftool_process"]
+            self.variables["exiftool_process"] = None
+            if exiftool_process is not None:
+                if exiftool_process.poll() is None:
+                    try:
+                        exiftool_process.stdin.write(b"-stay_open\nFalse\n")
+                        exiftool_process.stdin.flush()
+                        exiftool_process.wait(timeout=5)
+                    except (OSError, ValueError, subprocess.TimeoutExpired):
+                        exiftool_process.kill()
+                        exiftool_process.wait()
+
+                for stream in [exiftool_process.stdin,
+                               exiftool_process.stdout,
+                               exiftool_process.stderr]:
+                    stream.close()
+#
+###
+#
+    def __enter__(self):
+        return self
+#
+###
+#
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+        self.close_journal()
+        return False
+#
+###
 #
     def return_datetime_string(self, supplied_datetime):
         timezone_indicator_option = self.options["timezone_indicator"]["value"]
@@ -856,7 +2018,7 @@ class Handler():
             format = raw_tag_value
         else:
             format_elements = []
-            for text_fragment in self.handlers["string"].parse(raw_tag_value):
+            for text_fragment in self.return_handler("string").parse(raw_tag_value):
                 format_elements.append(text_fragment[0])
                 if text_fragment[1] != None:
                     format_elements.append("\033[1m{")
@@ -911,7 +2073,8 @@ class Handler():
 ###
 #
     def prepare_metadata_from_template(
-            self, template_id, substitutions={}, mode="live"):
+            self, template_id, substitutions={}, mode="live",
+            file_substitutions=None):
 
         function_name = "prepare_metadata_from_template"
         self.variables["no_general_error_has_been_registered"] = True
@@ -936,13 +2099,18 @@ class Handler():
             if mode == "test_format":
                 self.variables["substitutions"] = {}
             else:
-                self.check_supplied_substitutions(template_id, substitutions)
+                self.check_supplied_substitutions(
+                    template_id, substitutions, file_substitutions)
         else:
             self.register_a_general_error(
                 function_name, 
                 'Supplied mode "{}" is not recognised. The value may only be "live", "test_format", or "test_value".'.format(mode))
 
-        if self.variables["no_general_error_has_been_registered"]:
+        if (self.variables["no_general_error_has_been_registered"] and
+            (mode == "live")):
+            self.prepare_metadata_from_compiled_template(template_id)
+
+        elif self.variables["no_general_error_has_been_registered"]:
             entry_index = 0
             while entry_index < len(self.variables["templates"][template_id]["supplied_tag_name_for_entry"]):
 
@@ -982,37 +2150,360 @@ class Handler():
         if self.variables["no_general_error_has_been_registered"]:
             if self.options["add_standard_tags"]["value"]:
                 self.add_standard_tags_to_prepared_metadata()
+            if self.options["embed_fingerprint"]["value"] and (mode == "live"):
+                self.metadata["prepared"][self.variables["fingerprint_tag_name"]] = \
+                    self.variables["fingerprint_prefix"] + \
+                    self.return_prepared_metadata_fingerprint(
+                        template_id, self.metadata["prepared"])
         else:
             self.metadata["prepared"] = {}
             self.variables["source_of_metadata"]["prepared"] = ""
 #
 ###
 #
-    def check_supplied_substitutions(self, template_id, substitutions):
-        function_name = "check_supplied_substitutions"
+# If the "prepared_metadata_cache_size" option is greater than 0, prepared
+# metadata are kept in a least-recently-used cache keyed on the template, the
+# supplied substitutions, the mode and the options that affect the values.
+# The substitutions taken from the time and from file names are left out of
+# the key, so that the files of a batch share cache entries. On a cache hit
+# only the entries that use them are evaluated; the standard tags are added
+# afterwards by prepare_metadata_from_template as usual.
+#
+    def prepare_metadata_from_compiled_template(self, template_id):
+        function_name = "prepare_metadata_from_template"
+
+        template_details = self.variables["templates"][template_id]
+        self.variables["unrecognised_tags"]["prepared"] = \
+            list(template_details["compiled_unrecognised_tags"])
+
+        if self.options["add_standard_tags"]["value"]:
+            for full_tag_name in self.variables["standard_tag_names"]:
+                if full_tag_name in template_details["supplied_tag_name_for_full_tag_name"]:
+                    self.register_a_general_error(
+                        function_name, 
+                        'Tag "{}" may not be used in a template since it will be added automatically to the prepared metadata. Remove the option from template "{}" or change the value of the "add_standard_tags" option to False.'.format(
+                            template_details["supplied_tag_name_for_full_tag_name"][full_tag_name], 
+                            template_id))
+
+        cache_size = self.options["prepared_metadata_cache_size"]["value"]
+        if cache_size > 0:
+            user_substitutions = {}
+            for substitution_key in self.variables["substitutions_for_prepared_metadata"]:
+                if ((substitution_key not in self.variables["global_substitution_keys"]) and
+                    (substitution_key not in self.variables["file_substitution_keys"])):
+                    user_substitutions[substitution_key] = \
+                        self.variables["substitutions_for_prepared_metadata"][substitution_key]
+            cache_key = (
+                template_id,
+                self.return_hashable_value(user_substitutions),
+                self.variables["prepared_metadata_mode"],
+                self.options["add_standard_tags"]["value"],
+                self.options["timezone_indicator"]["value"])
+
+        cache_was_hit = False
+        if cache_size > 0:
+            with self.locks["prepared_metadata_cache"]:
+                if cache_key in self.variables["prepared_metadata_cache"]:
+                    self.variables["prepared_metadata_cache_hits"] += 1
+                    self.variables["prepared_metadata_cache"].move_to_end(cache_key)
+                    cached_metadata = self.variables["prepared_metadata_cache"][cache_key]
+                    cache_was_hit = True
+                else:
+                    self.variables["prepared_metadata_cache_misses"] += 1
+
+        if cache_was_hit:
+            dynamic_entries = template_details["compiled_per_file_entries"]
+        else:
+            cached_metadata = template_details["compiled_constant_metadata"]
+            dynamic_entries = template_details["compiled_dynamic_entries"]
+
+        prepared_metadata = {}
+        for full_tag_name in cached_metadata:
+            tag_value = cached_metadata[full_tag_name]
+            if type(tag_value) == list:
+                prepared_metadata[full_tag_name] = list(tag_value)
+            else:
+                prepared_metadata[full_tag_name] = tag_value
+
+        substitutions = self.variables["substitutions_for_prepared_metadata"]
+        for supplied_tag_name, full_tag_name, tag_value_is_list, compiled_values in dynamic_entries:
+            prepared_values = []
+            for value_is_constant, text in compiled_values:
+                if value_is_constant:
+                    prepared_values.append(text)
+                else:
+                    try:
+                        prepared_values.append(text.format(**substitutions))
+                    except:
+                        prepared_values.append("")
+                        self.register_a_general_error(
+                            function_name, 
+                            'Unable to perform substitution(s) for supplied tag name "{}" for template id "{}".'.format(
+                                supplied_tag_name,
+                                template_id))
+
+            if tag_value_is_list:
+                prepared_metadata[full_tag_name] = prepared_values
+            else:
+                prepared_metadata[full_tag_name] = prepared_values[0]
+
+        if ((cache_size > 0) and
+            (not cache_was_hit) and
+            self.variables["no_general_error_has_been_registered"]):
+
+            cached_metadata = {}
+            for full_tag_name in prepared_metadata:
+                if type(prepared_metadata[full_tag_name]) == list:
+                    cached_metadata[full_tag_name] = \
+                        list(prepared_metadata[full_tag_name])
+                else:
+                    cached_metadata[full_tag_name] = \
+                        prepared_metadata[full_tag_name]
+            for per_file_entry in template_details["compiled_per_file_entries"]:
+                del cached_metadata[per_file_entry[1]]
+            with self.locks["prepared_metadata_cache"]:
+                self.variables["prepared_metadata_cache"][cache_key] = cached_metadata
+                while len(self.variables["prepared_metadata_cache"]) > cache_size:
+                    self.variables["prepared_metadata_cache"].popitem(last=False)
+
+        self.metadata["prepared"] = prepared_metadata
+#
+###
+#
+    def return_prepared_metadata_cache_statistics(self):
+        return {
+            "hits": self.variables["prepared_metadata_cache_hits"],
+            "misses": self.variables["prepared_metadata_cache_misses"],
+            "size": len(self.variables["prepared_metadata_cache"]),
+            "maximum_size": self.options["prepared_metadata_cache_size"]["value"]}
+#
+###
+#
+# Sets the regular expression that is matched against file names to provide
+# substitutions. Each named group "name" provides the substitution key
+# "__name__". The "capturetime" group is parsed with capture_time_format to
+# provide a datetime as "__capturetime__" and its string as
+# "__capturetimestr__". By default, file names of the form
+#   20221201075900-ncas-cam-3.jpg
+# provide "__capturetime__" and "__instrument__" ("ncas-cam-3").
+#
+    def set_file_name_pattern(
+            self, file_name_pattern, capture_time_format="%Y%m%d%H%M%S"):
+
+        function_name = "set_file_name_pattern"
+        self.variables["no_general_error_has_been_registered"] = True
+
+        try:
+            compiled_file_name_pattern = re.compile(file_name_pattern)
+        except (re.error, TypeError) as exception_message:
+            self.register_a_general_error(
+                function_name, 
+                'The file name pattern could not be compiled. {}'.format(
+                    exception_message))
+            return 1
+
+        file_substitution_keys = []
+        for group_name in sorted(compiled_file_name_pattern.groupindex):
+            file_substitution_keys.append("__{}__".format(group_name))
+            if group_name == "capturetime":
+                file_substitution_keys.append("__capturetimestr__")
+
+        if len(file_substitution_keys) == 0:
+            self.register_a_general_error(
+                function_name, 
+                'The file name pattern must contain at least one named group, for example "(?P<instrument>...)".')
+            return 1
+
+        for file_substitution_key in file_substitution_keys:
+            if file_substitution_key in self.variables["global_substitution_keys"]:
+                self.register_a_general_error(
+                    function_name, 
+                    'The file name pattern may not provide the reserved key "{}".'.format(
+                        file_substitution_key))
+                return 1
+
+        capture_time_slices = {}
+        character_index = 0
+        format_index = 0
+        while format_index < len(capture_time_format):
+            if capture_time_format[format_index] != "%":
+                character_index += 1
+                format_index += 1
+                continue
+
+            directive = capture_time_format[format_index + 1:format_index + 2]
+            if directive == "Y":
+                field_length = 4
+            elif directive in ["m", "d", "H", "M", "S"]:
+                field_length = 2
+            else:
+                capture_time_slices = None
+                break
+            capture_time_slices[directive] = \
+                (character_index, character_index + field_length)
+            character_index += field_length
+            format_index += 2
+
+        if ((capture_time_slices is not None) and
+            not set(["Y", "m", "d"]).issubset(capture_time_slices)):
+            capture_time_slices = None
+
+        self.variables["file_name_pattern"] = compiled_file_name_pattern
+        self.variables["capture_time_format"] = capture_time_format
+        self.variables["capture_time_slices"] = capture_time_slices
+        self.variables["capture_time_length"] = character_index
+        self.variables["file_substitution_keys"] = file_substitution_keys
+        self.variables["validated_substitution_key_sets"] = {}
+        with self.locks["templates"]:
+            for template_id in self.variables["templates"]:
+                if template_id != "__latest__":
+                    self.variables["templates"][template_id]["compiled_per_file_entries"] = \
+                        self.return_per_file_entries(
+                            self.variables["templates"][template_id])
+        with self.locks["prepared_metadata_cache"]:
+            self.variables["prepared_metadata_cache"].clear()
+        return 0
+#
+###
+#
+# Returns the substitutions provided by the names of the supplied files, as
+# a list of dictionaries in the same order. Only the keys that the template
+# uses are provided, and each distinct capture time is parsed only once.
+# When the capture time format uses only %Y, %m, %d, %H, %M and %S the
+# datetimes are built directly from slices of the digits, which is several
+# times faster than datetime.strptime. An empty dictionary is returned for a
+# file whose name does not match the file name pattern.
+#
+    def return_file_name_substitutions(self, template_id, file_paths):
+        file_name_substitutions = [{} for file_path in file_paths]
+        if template_id not in self.variables["templates"]:
+            return file_name_substitutions
+
+        used_file_substitution_keys = set()
+        for substitution_key in self.variables["templates"][template_id]["usage_details_for_substitution_key"]:
+            if substitution_key in self.variables["file_substitution_keys"]:
+                used_file_substitution_keys.add(substitution_key)
+        if len(used_file_substitution_keys) == 0:
+            return file_name_substitutions
+
+        used_group_names = []
+        for group_name in self.variables["file_name_pattern"].groupindex:
+            if group_name == "capturetime":
+                if ("__capturetime__" in used_file_substitution_keys or
+                    "__capturetimestr__" in used_file_substitution_keys):
+                    used_group_names.append(group_name)
+            elif "__{}__".format(group_name) in used_file_substitution_keys:
+                used_group_names.append(group_name)
+
+        file_name_pattern = self.variables["file_name_pattern"]
+        capture_time_slices = self.variables["capture_time_slices"]
+        capture_times = {}
+        file_index = 0
+        for file_path in file_paths:
+            if type(file_path) in self.variables["string_types"]:
+                file_name_match = file_name_pattern.match(
+                    os.path.basename(file_path))
+            else:
+                file_name_match = None
+
+            if file_name_match is not None:
+                for group_name in used_group_names:
+                    group_value = file_name_match.group(group_name)
+                    if group_value is None:
+                        continue
+                    if group_name != "capturetime":
+                        file_name_substitutions[file_index]["__{}__".format(group_name)] = group_value
+                        continue
+
+                    if group_value not in capture_times:
+                        try:
+                            if ((capture_time_slices is not None) and
+                                (len(group_value) == self.variables["capture_time_length"])):
+                                capture_time_fields = {"H": 0, "M": 0, "S": 0}
+                                for directive in capture_time_slices:
+                                    first_index, last_index = \
+                                        capture_time_slices[directive]
+                                    capture_time_fields[directive] = \
+                                        int(group_value[first_index:last_index])
+                                capture_time = datetime.datetime(
+                                    capture_time_fields["Y"],
+                                    capture_time_fields["m"],
+                                    capture_time_fields["d"],
+                                    capture_time_fields["H"],
+                                    capture_time_fields["M"],
+                                    capture_time_fields["S"])
+                            else:
+                                capture_time = datetime.datetime.strptime(
+                                    group_value,
+                                    self.variables["capture_time_format"])
+                            capture_times[group_value] = {
+                                "__capturetime__": capture_time}
+                            if "__capturetimestr__" in used_file_substitution_keys:
+                                capture_times[group_value]["__capturetimestr__"] = \
+                                    self.return_datetime_string(capture_time)
+                        except ValueError:
+                            capture_times[group_value] = {}
+
+                    file_name_substitutions[file_index].update(
+                        capture_times[group_value])
+            file_index += 1
+
+        return file_name_substitutions
+#
+###
+#
+# The keys of the supplied substitutions are checked against those used by
+# the template. Each combination of keys that passes is remembered for the
+# template, so that when metadata are prepared for many files with the same
+# keys the checks are made only once.
+#
+    def check_supplied_substitutions(
+            self, template_id, substitutions, file_substitutions=None):
+
+        function_name = "check_supplied_substitutions"
+        if file_substitutions is None:
+            file_substitutions = {}
+
         if type(substitutions) != dict:
             self.register_a_general_error(
                 function_name, 
                 'Supplied subtitutions is not a python dictionary.')
 
         else:
-            for global_substitution_key in self.variables["global_substitution_keys"]:
-                if global_substitution_key in substitutions:
-                    self.register_a_general_error(
-                        function_name, 
-                        'The supplied substitutions may not contain the reserved key "{}".'.format(global_substitution_key))
+            substitution_key_set = \
+                (frozenset(substitutions), frozenset(file_substitutions))
+            validated_substitution_key_sets = \
+                self.variables["validated_substitution_key_sets"].setdefault(
+                    template_id, set())
+            if substitution_key_set not in validated_substitution_key_sets:
+                for reserved_substitution_key in self.variables["global_substitution_keys"] + self.variables["file_substitution_keys"]:
+                    if reserved_substitution_key in substitutions:
+                        self.register_a_general_error(
+                            function_name, 
+                            'The supplied substitutions may not contain the reserved key "{}".'.format(reserved_substitution_key))
 
-            for required_substitution_key in self.variables["templates"][template_id]["usage_details_for_substitution_key"]:
+                for required_substitution_key in self.variables["templates"][template_id]["usage_details_for_substitution_key"]:
 
-                if ((required_substitution_key not in substitutions) and
-                    (required_substitution_key not in self.variables["global_substitution_keys"])):
-                    self.register_a_general_error(
-                        function_name, 
-                        'No substitution has been supplied for key "{}".'.format(required_substitution_key))
+                    if required_substitution_key in self.variables["file_substitution_keys"]:
+                        if required_substitution_key not in file_substitutions:
+                            self.register_a_general_error(
+                                function_name, 
+                                'Substitution key "{}" is taken from the file name, but no file name matching the file name pattern was supplied.'.format(required_substitution_key))
+
+                    elif ((required_substitution_key not in substitutions) and
+                        (required_substitution_key not in self.variables["global_substitution_keys"])):
+                        self.register_a_general_error(
+                            function_name, 
+                            'No substitution has been supplied for key "{}".'.format(required_substitution_key))
+
+                if self.variables["no_general_error_has_been_registered"]:
+                    validated_substitution_key_sets.add(substitution_key_set)
 
         if self.variables["no_general_error_has_been_registered"]:
             self.variables["substitutions_for_prepared_metadata"] = \
                 substitutions.copy()
+            self.variables["substitutions_for_prepared_metadata"].update(
+                file_substitutions)
             self.variables["substitutions_for_prepared_metadata"]["__utcnow__"] = \
                 self.variables["metadata_datetime"]["prepared"]
             self.variables["substitutions_for_prepared_metadata"]["__utcnowstr__"] = self.variables["metadata_datetime_string"]["prepared"]
@@ -1098,7 +2589,68 @@ class Handler():
 #
 ###
 #
-    def extract(self, source_file_path, should_return_metadata=True):
+# Extraction profiles
+#   "full"          - all tags are extracted
+#   "template_only" - only the supplied tags are extracted
+#   "fast"          - as "template_only", but ExifTool is also given the
+#                     "-fast" or "-fast2" option according to the
+#                     "fast_scan_level" option
+#
+    def return_exiftool_extraction_arguments(
+            self, file_path_for_os, extraction_profile="full", tag_names=None):
+
+        gps_extraction_option = self.options["gps_extraction"]["value"]
+        exiftool_arguments = \
+            self.variables["standard_exiftool_extraction_arguments"] + \
+            [self.variables["gps_extraction_formats"][gps_extraction_option]]
+
+        if extraction_profile == "fast":
+            if self.options["fast_scan_level"]["value"] == 1:
+                exiftool_arguments.append("-fast")
+            else:
+                exiftool_arguments.append("-fast2")
+
+        if (extraction_profile != "full") and (tag_names is not None):
+            for full_tag_name in sorted(tag_names):
+                if full_tag_name.startswith("UNKNOWN:"):
+                    exiftool_arguments.append("-" + full_tag_name[8:])
+                else:
+                    exiftool_arguments.append("-" + full_tag_name)
+
+        exiftool_arguments.append(file_path_for_os)
+
+        return exiftool_arguments
+#
+###
+#
+# ExifTool's JSON output used to be parsed as YAML. A JSON number that YAML
+# would not resolve as a float (e.g. "1e5") is therefore kept as a string so
+# that the types of the extracted values are unchanged. orjson cannot do this
+# and so is only used when the output contains nothing resembling an
+# exponent.
+#
+    def return_parsed_extraction_output(self, exiftool_return_string):
+        orjson = self.return_handler("orjson")
+        if ((orjson is not None) and
+            (self.variables["json_exponent_pattern"].search(
+                exiftool_return_string) is None)):
+            return orjson.loads(exiftool_return_string)[0]
+        else:
+            return self.return_handler("json_decoder").decode(
+                exiftool_return_string.decode("utf8"))[0]
+#
+###
+#
+    def return_yaml_compatible_float(self, number_text):
+        if self.variables["yaml_float_pattern"].match(number_text) is None:
+            return number_text
+        else:
+            return float(number_text)
+#
+###
+#
+    def extract(self, source_file_path, should_return_metadata=True,
+                extraction_profile="full", tag_names=None):
         function_name = "extract"
         self.variables["no_general_error_has_been_registered"] = True
 
@@ -1126,28 +2678,31 @@ class Handler():
                     function_name, 
                     'Supplied file path "{}" is invalid.'.format(
                         self.variables["source_of_metadata"]["extracted"]))
+            else:
+                self.wait_until_file_is_ready(
+                    function_name,
+                    self.variables["source_of_metadata"]["extracted"])
 
         if self.variables["no_general_error_has_been_registered"]:
             file_path_for_os = self.return_file_path_for_os(
                 self.variables["source_of_metadata"]["extracted"])
-            gps_extraction_option = \
-                self.options["gps_extraction"]["value"]
             exiftool_arguments = \
-                self.variables["standard_exiftool_extraction_arguments"] + \
-                [self.variables["gps_extraction_formats"][gps_extraction_option],
-                 file_path_for_os]
+                self.return_exiftool_extraction_arguments(
+                    file_path_for_os, extraction_profile, tag_names)
             try:
-                exiftool_return_string = \
-                    subprocess.check_output(exiftool_arguments)
-            except:
+                exit_code, exiftool_return_string = \
+                    self.run_exiftool_command(exiftool_arguments)
+            except OSError:
+                exit_code = 1
+            if exit_code != 0:
                 self.register_a_general_error(
                     function_name, 
                     "ExifTool extraction command failed. The selected file was probably of a type that does not support embedded metadata.")
             else:
                 try:
-                    self.metadata["extracted"] = yaml.load(
-                        exiftool_return_string, 
-                        Loader=yaml.SafeLoader)[0]
+                    self.metadata["extracted"] = \
+                        self.return_parsed_extraction_output(
+                            exiftool_return_string)
                 except:
                     self.register_a_general_error(
                         function_name, 
@@ -1161,6 +2716,609 @@ class Handler():
             return self.metadata["extracted"]
 #
 ###
+#
+# Extracts metadata from many files, passing up to
+# "maximum_number_of_paths_per_extraction" paths to each ExifTool process via
+# an argument file. ExifTool's JSON array is decoded one record at a time as
+# it is read, and (source file path, metadata) pairs are yielded in the order
+# in which the paths were supplied. An empty dictionary is yielded for any
+# file from which metadata could not be extracted. If tag_names are given,
+# only those tags are extracted.
+#
+    def extract_many(self, source_file_paths, tag_names=None):
+        function_name = "extract_many"
+        self.variables["no_general_error_has_been_registered"] = True
+
+        pending_paths = []
+        for source_file_path in source_file_paths:
+            pending_paths.append(source_file_path)
+            if len(pending_paths) == self.variables["maximum_number_of_paths_per_extraction"]:
+                for source_file_path_and_metadata in self.extract_paths_with_one_command(pending_paths, tag_names):
+                    yield source_file_path_and_metadata
+                pending_paths = []
+
+        if len(pending_paths) > 0:
+            for source_file_path_and_metadata in self.extract_paths_with_one_command(pending_paths, tag_names):
+                yield source_file_path_and_metadata
+#
+###
+#
+    def extract_paths_with_one_command(self, source_file_paths, tag_names=None):
+        function_name = "extract_many"
+
+        file_paths_for_os = []
+        for source_file_path in source_file_paths:
+            if not type(source_file_path) in self.variables["string_types"]:
+                self.register_a_general_error(
+                    function_name, 
+                    'Supplied source file path was not of a string type.')
+                file_paths_for_os.append(None)
+                continue
+
+            if source_file_path.startswith("~"):
+                absolute_file_path = os.path.expanduser(source_file_path)
+            else:
+                absolute_file_path = os.path.abspath(source_file_path)
+
+            if not os.path.isfile(absolute_file_path):
+                self.register_a_general_error(
+                    function_name, 
+                    'Supplied file path "{}" is invalid.'.format(
+                        absolute_file_path))
+                file_paths_for_os.append(None)
+            elif not self.wait_until_file_is_ready(
+                    function_name, absolute_file_path):
+                file_paths_for_os.append(None)
+            else:
+                file_path_for_os = self.return_file_path_for_os(
+                    absolute_file_path)
+                if type(file_path_for_os) == bytes:
+                    file_path_for_os = file_path_for_os.decode("utf8")
+                file_paths_for_os.append(file_path_for_os)
+
+        valid_file_paths_for_os = [
+            file_path_for_os for file_path_for_os in file_paths_for_os
+            if file_path_for_os is not None]
+        gps_extraction_option = self.options["gps_extraction"]["value"]
+        exiftool_arguments = \
+            self.variables["standard_exiftool_extraction_arguments"][1:] + \
+            [self.variables["gps_extraction_formats"][gps_extraction_option]]
+        if tag_names is not None:
+            for full_tag_name in sorted(tag_names):
+                if full_tag_name.startswith("UNKNOWN:"):
+                    exiftool_arguments.append("-" + full_tag_name[8:])
+                else:
+                    exiftool_arguments.append("-" + full_tag_name)
+        exiftool_arguments += valid_file_paths_for_os
+
+        working_directory = tempfile.mkdtemp(prefix="exiftool_handler_")
+        exiftool_process = None
+        try:
+            if len(valid_file_paths_for_os) > 0:
+                argument_file_path = os.path.join(
+                    working_directory, "extraction.args")
+                argument_file = open(argument_file_path, "wb")
+                for argument in exiftool_arguments:
+                    argument_file.write(
+                        self.return_exiftool_argument_line(argument).encode(
+                            "utf8"))
+                argument_file.close()
+
+                try:
+                    exiftool_process = subprocess.Popen(
+                        self.return_exiftool_command(
+                            ["exiftool", "-@", argument_file_path]),
+                        stdout=subprocess.PIPE)
+                except OSError:
+                    self.register_a_general_error(
+                        function_name,
+                        "ExifTool could not be started.")
+
+            extracted_metadata_for_path = {}
+            next_index = 0
+            if exiftool_process is not None:
+                for metadata in self.return_decoded_json_records(
+                        exiftool_process.stdout):
+                    extracted_metadata_for_path[metadata.get("SourceFile")] = \
+                        metadata
+
+                    while ((next_index < len(file_paths_for_os)) and
+                           ((file_paths_for_os[next_index] is None) or
+                            (file_paths_for_os[next_index] in extracted_metadata_for_path))):
+                        yield (source_file_paths[next_index],
+                               extracted_metadata_for_path.pop(
+                                   file_paths_for_os[next_index], {}))
+                        next_index += 1
+
+            while next_index < len(file_paths_for_os):
+                if file_paths_for_os[next_index] in extracted_metadata_for_path:
+                    yield (source_file_paths[next_index],
+                           extracted_metadata_for_path.pop(
+                               file_paths_for_os[next_index]))
+                else:
+                    if file_paths_for_os[next_index] is not None:
+                        self.register_a_general_error(
+                            function_name, 
+                            'ExifTool extraction failed for file "{}".'.format(
+                                file_paths_for_os[next_index]))
+                    yield source_file_paths[next_index], {}
+                next_index += 1
+        finally:
+            if exiftool_process is not None:
+                if exiftool_process.poll() is None:
+                    exiftool_process.kill()
+                exiftool_process.stdout.close()
+                exiftool_process.wait()
+            shutil.rmtree(working_directory, ignore_errors=True)
+#
+###
+#
+    def return_decoded_json_records(self, stream):
+        json_decoder = self.return_handler("json_decoder")
+        text_decoder = codecs.getincrementaldecoder("utf8")("replace")
+        separator_characters = self.variables["json_separator_characters"]
+        received_text = ""
+        while True:
+            received_block = stream.read1(65536)
+            received_text += text_decoder.decode(
+                received_block, received_block == b"")
+
+            position = 0
+            while True:
+                while ((position < len(received_text)) and
+                       (received_text[position] in separator_characters)):
+                    position += 1
+                if position == len(received_text):
+                    break
+
+                try:
+                    record, position = json_decoder.raw_decode(
+                        received_text, position)
+                except ValueError:
+                    break
+                else:
+                    yield record
+
+            received_text = received_text[position:]
+            if received_block == b"":
+                break
+#
+###
+#
+# The native JPEG reader returns the IFD0, ExifIFD and XMP tags listed in
+# "native_exif_tags" and "native_xmp_properties", keyed and formatted as they
+# would be by "exiftool -G1 -j". It returns None if the file cannot be read
+# in this way.
+#
+    def return_natively_read_metadata(self, file_path):
+        import xml.etree.ElementTree
+        try:
+            source_file = open(file_path, "rb")
+        except (IOError, OSError):
+            return None
+
+        try:
+            header_segments = self.return_jpeg_header_segments(source_file)
+        except ValueError:
+            return None
+        finally:
+            source_file.close()
+
+        natively_read_metadata = {"SourceFile": file_path}
+        number_of_xmp_segments = 0
+        try:
+            for marker, segment_data in header_segments:
+                if marker != 0xE1:
+                    continue
+                elif segment_data.startswith(self.variables["exif_identifier"]):
+                    natively_read_metadata.update(self.return_exif_tags(
+                        segment_data[len(self.variables["exif_identifier"]):]))
+                elif segment_data.startswith(
+                        self.variables["jpeg_extended_xmp_identifier"]):
+                    return None
+                elif segment_data.startswith(
+                        self.variables["jpeg_xmp_identifier"]):
+                    number_of_xmp_segments += 1
+                    natively_read_metadata.update(self.return_xmp_tags(
+                        segment_data[len(self.variables["jpeg_xmp_identifier"]):]))
+        except (ValueError, IndexError, xml.etree.ElementTree.ParseError):
+            return None
+
+        if number_of_xmp_segments > 1:
+            return None
+
+        return natively_read_metadata
+#
+###
+#
+    def return_exif_tags(self, tiff_data):
+        if tiff_data[:2] == b"II":
+            byte_order = "little"
+        elif tiff_data[:2] == b"MM":
+            byte_order = "big"
+        else:
+            raise ValueError("The EXIF byte order is not recognised.")
+
+        exif_tags = {}
+        ifd_offsets = [
+            ("IFD0", int.from_bytes(tiff_data[4:8], byte_order))]
+        while len(ifd_offsets) > 0:
+            group_name, ifd_offset = ifd_offsets.pop(0)
+            number_of_entries = int.from_bytes(
+                tiff_data[ifd_offset:ifd_offset + 2], byte_order)
+            for entry_index in range(number_of_entries):
+                entry_offset = ifd_offset + 2 + 12 * entry_index
+                entry = tiff_data[entry_offset:entry_offset + 12]
+                if len(entry) != 12:
+                    raise ValueError("The EXIF data are truncated.")
+
+                tag_id = int.from_bytes(entry[0:2], byte_order)
+                value_type = int.from_bytes(entry[2:4], byte_order)
+                value_count = int.from_bytes(entry[4:8], byte_order)
+                if (group_name == "IFD0" and
+                    tag_id == self.variables["exif_ifd_pointer_tag"]):
+                    ifd_offsets.append(
+                        ("ExifIFD", int.from_bytes(entry[8:12], byte_order)))
+                    continue
+
+                if ((tag_id not in self.variables["native_exif_tags"][group_name]) or
+                    (value_type not in [2, 7])):
+                    continue
+
+                if value_count <= 4:
+                    value_bytes = entry[8:8 + value_count]
+                else:
+                    value_offset = int.from_bytes(entry[8:12], byte_order)
+                    value_bytes = tiff_data[value_offset:value_offset + value_count]
+
+                if value_type == 7:
+                    if value_bytes[:8].rstrip(b"\x00") not in [b"", b"ASCII"]:
+                        continue
+                    value_bytes = value_bytes[8:]
+
+                tag_value = value_bytes.split(b"\x00")[0].decode(
+                    "utf8", "replace").rstrip()
+                full_tag_name = "{}:{}".format(
+                    group_name,
+                    self.variables["native_exif_tags"][group_name][tag_id])
+                exif_tags[full_tag_name] = self.return_exiftool_json_value(
+                    tag_value)
+
+        return exif_tags
+#
+###
+#
+    def return_xmp_tags(self, xmp_packet):
+        import xml.etree.ElementTree
+        namespaces = self.variables["xmp_namespaces"]
+        rdf_tag = "{" + namespaces["rdf"] + "}"
+        full_tag_name_for_property_tag = {}
+        for full_tag_name in self.variables["native_xmp_properties"]:
+            namespace_prefix, property_name, structure, is_date = \
+                self.variables["native_xmp_properties"][full_tag_name]
+            property_tag = \
+                "{" + namespaces[namespace_prefix] + "}" + property_name
+            full_tag_name_for_property_tag[property_tag] = full_tag_name
+
+        xmp_root = xml.etree.ElementTree.fromstring(xmp_packet)
+        xmp_tags = {}
+        for description in xmp_root.iter(rdf_tag + "Description"):
+            xmp_values_for_property_tag = []
+            for property_tag in description.attrib:
+                xmp_values_for_property_tag.append(
+                    (property_tag, [description.attrib[property_tag]]))
+
+            for property_element in description:
+                container = None
+                for container_tag in ["Alt", "Bag", "Seq"]:
+                    container = property_element.find(rdf_tag + container_tag)
+                    if container is not None:
+                        break
+
+                if container is None:
+                    xmp_values = [property_element.text or ""]
+                else:
+                    xmp_values = [list_item.text or "" for list_item in
+                                  container.findall(rdf_tag + "li")]
+                    if container.tag == rdf_tag + "Alt":
+                        for list_item in container.findall(rdf_tag + "li"):
+                            if list_item.get("{" + namespaces["xml"] + "}lang") == "x-default":
+                                xmp_values = [list_item.text or ""]
+                                break
+                        xmp_values = xmp_values[:1]
+
+                xmp_values_for_property_tag.append(
+                    (property_element.tag, xmp_values))
+
+            for property_tag, xmp_values in xmp_values_for_property_tag:
+                if ((property_tag not in full_tag_name_for_property_tag) or
+                    (len(xmp_values) == 0)):
+                    continue
+
+                full_tag_name = full_tag_name_for_property_tag[property_tag]
+                is_date = self.variables["native_xmp_properties"][full_tag_name][3]
+                tag_values = []
+                for xmp_value in xmp_values:
+                    if is_date:
+                        date_match = \
+                            self.variables["xmp_exiftool_date_pattern"].match(
+                                xmp_value)
+                        if date_match is not None:
+                            xmp_value = ":".join(date_match.group(1, 2, 3))
+                            if date_match.group(5) is not None:
+                                xmp_value += " " + date_match.group(5)
+                            if date_match.group(8) is not None:
+                                xmp_value += date_match.group(8)
+                    tag_values.append(self.return_exiftool_json_value(xmp_value))
+
+                if len(tag_values) == 1:
+                    xmp_tags[full_tag_name] = tag_values[0]
+                else:
+                    xmp_tags[full_tag_name] = tag_values
+
+        return xmp_tags
+#
+###
+#
+# ExifTool's JSON output gives values that look like numbers as numbers.
+#
+    def return_exiftool_json_value(self, tag_value):
+        if self.variables["json_number_pattern"].match(tag_value) is None:
+            return tag_value
+        elif ("." in tag_value) or ("e" in tag_value) or ("E" in tag_value):
+            return self.return_yaml_compatible_float(tag_value)
+        else:
+            return int(tag_value)
+#
+###
+#
+# Checks, without waiting, whether a file that may still be being written by
+# a camera or an upload is ready for ExifTool. A file is ready if it is not
+# empty, if a JPEG file starts with the SOI marker and ends, ignoring any
+# padding, with the EOI marker read from its tail, and if it is known to
+# have been closed after writing (for example from an inotify IN_CLOSE_WRITE
+# event) or has not been modified for "file_readiness_stability_window"
+# seconds. Files that do not exist, and paths that are not strings, are
+# reported as ready, leaving them to the usual file path checks.
+#
+    def return_file_readiness(self, file_path, has_been_closed=False):
+        if type(file_path) not in self.variables["string_types"]:
+            return True
+
+        try:
+            file_status = os.stat(file_path)
+        except (OSError, TypeError, ValueError):
+            return True
+        if file_status.st_size == 0:
+            return False
+
+        if file_path.lower().endswith(self.variables["jpeg_file_name_extensions"]):
+            tail_length = min(
+                file_status.st_size, self.variables["jpeg_tail_length"])
+            try:
+                source_file = open(file_path, "rb")
+            except (IOError, OSError):
+                return True
+            try:
+                head_bytes = source_file.read(2)
+                source_file.seek(-tail_length, os.SEEK_END)
+                tail_bytes = source_file.read(tail_length)
+            finally:
+                source_file.close()
+            if head_bytes != self.variables["jpeg_start_of_image_marker"]:
+                return False
+            if not tail_bytes.rstrip(b"\x00\xff\r\n").endswith(
+                    self.variables["jpeg_end_of_image_marker"]):
+                return False
+
+        if has_been_closed:
+            return True
+        return ((time.time() - file_status.st_mtime_ns / 1.0e9) >=
+                self.variables["file_readiness_stability_window"])
+#
+###
+#
+# If the "check_file_readiness" option is True, waits for a file to become
+# ready for ExifTool, for at most "file_readiness_maximum_wait" seconds.
+# Returns False, having registered an error, if the file did not become
+# ready, so that no ExifTool command is run for it.
+#
+    def wait_until_file_is_ready(self, function_name, file_path):
+        if not self.options["check_file_readiness"]["value"]:
+            return True
+
+        end_time = time.monotonic() + \
+            self.variables["file_readiness_maximum_wait"]
+        while not self.return_file_readiness(file_path):
+            remaining_time = end_time - time.monotonic()
+            if remaining_time <= 0:
+                self.register_a_general_error(
+                    function_name, 
+                    'Supplied file "{}" was still being written after {} seconds.'.format(
+                        file_path, self.variables["file_readiness_maximum_wait"]))
+                return False
+            time.sleep(min(
+                remaining_time,
+                self.variables["file_readiness_stability_window"] / 5.0))
+
+        return True
+#
+###
+#
+# Extracts the metadata needed to check whether prepared metadata would
+# overwrite existing tags. If the "native_jpeg_reader" option is True and
+# every prepared tag can be read natively, ExifTool is not used. Otherwise
+# ExifTool extracts the tags selected by the "extraction_profile" option.
+#
+    def extract_for_overwrite_check(self, source_file_path):
+        function_name = "extract_for_overwrite_check"
+
+        if self.options["native_jpeg_reader"]["value"]:
+            if ((type(source_file_path) in self.variables["string_types"]) and
+                self.return_natively_readable_tag_names().issuperset(
+                    self.metadata["prepared"])):
+
+                if source_file_path.startswith("~"):
+                    absolute_file_path = os.path.expanduser(source_file_path)
+                else:
+                    absolute_file_path = os.path.abspath(source_file_path)
+
+                if (os.path.isfile(absolute_file_path) and
+                    self.wait_until_file_is_ready(function_name, absolute_file_path)):
+                    natively_read_metadata = \
+                        self.return_natively_read_metadata(absolute_file_path)
+                    if natively_read_metadata is not None:
+                        self.variables["no_general_error_has_been_registered"] = True
+                        self.variables["source_of_metadata"]["extracted"] = \
+                            absolute_file_path
+                        self.variables["metadata_datetime"]["extracted"] = \
+                            datetime.datetime.utcnow()
+                        self.variables["metadata_datetime_string"]["extracted"] = \
+                            self.return_datetime_string(
+                                self.variables["metadata_datetime"]["extracted"])
+                        self.metadata["extracted"] = natively_read_metadata
+                        return
+
+        self.extract(
+            source_file_path, 
+            False, 
+            self.options["extraction_profile"]["value"],
+            self.metadata["prepared"].keys())
+#
+###
+#
+    def return_natively_readable_tag_names(self):
+        natively_readable_tag_names = \
+            set(self.variables["native_xmp_properties"])
+        for group_name in self.variables["native_exif_tags"]:
+            for short_tag_name in self.variables["native_exif_tags"][group_name].values():
+                natively_readable_tag_names.add(
+                    "{}:{}".format(group_name, short_tag_name))
+
+        return natively_readable_tag_names
+#
+###
+#
+# As extract_for_overwrite_check, but for many files at once. Files are read
+# by the native JPEG reader where the "native_jpeg_reader" option allows it,
+# and the rest with a single ExifTool command (see extract_many), which
+# extracts every tag if the "extraction_profile" option is "full" and
+# otherwise only the supplied tags. Yields (source file path, metadata)
+# pairs in the order of the supplied paths, with an empty dictionary for
+# any file from which metadata could not be extracted. As for
+# extract_for_overwrite_check, a file is only read natively if its path is
+# a string and it is ready; paths that are not strings are left to
+# extract_many to report.
+#
+    def extract_many_for_overwrite_check(self, source_file_paths, tag_names):
+        function_name = "extract_many_for_overwrite_check"
+
+        source_file_paths = list(source_file_paths)
+        natively_read_metadata_for_index = {}
+        if (self.options["native_jpeg_reader"]["value"] and
+            self.return_natively_readable_tag_names().issuperset(tag_names)):
+            for file_index, source_file_path in enumerate(source_file_paths):
+                if type(source_file_path) not in self.variables["string_types"]:
+                    continue
+
+                if source_file_path.startswith("~"):
+                    absolute_file_path = os.path.expanduser(source_file_path)
+                else:
+                    absolute_file_path = os.path.abspath(source_file_path)
+
+                if not os.path.isfile(absolute_file_path):
+                    continue
+                elif not self.wait_until_file_is_ready(
+                        function_name, absolute_file_path):
+                    natively_read_metadata_for_index[file_index] = {}
+                    continue
+
+                natively_read_metadata = \
+                    self.return_natively_read_metadata(absolute_file_path)
+                if natively_read_metadata is not None:
+                    natively_read_metadata_for_index[file_index] = \
+                        natively_read_metadata
+
+        if self.options["extraction_profile"]["value"] == "full":
+            tag_names = None
+        extracted_metadata = self.extract_many(
+            [source_file_path
+             for file_index, source_file_path in enumerate(source_file_paths)
+             if file_index not in natively_read_metadata_for_index],
+            tag_names)
+
+        for file_index, source_file_path in enumerate(source_file_paths):
+            if file_index in natively_read_metadata_for_index:
+                yield (source_file_path,
+                       natively_read_metadata_for_index[file_index])
+            else:
+                yield next(extracted_metadata)
+#
+###
+#
+# When tag overwrites are allowed and the "blind_write" option is True,
+# embedding does not extract the existing metadata from the target file. The
+# file is only checked to exist and to be writable, as is its directory since
+# ExifTool writes a temporary file alongside the original.
+#
+    def should_write_blindly(self):
+        return (self.options["allow_tag_overwrites"]["value"] and
+                self.options["blind_write"]["value"])
+#
+###
+#
+    def return_writable_file_path(self, function_name, file_path):
+        if not type(file_path) in self.variables["string_types"]:
+            self.register_a_general_error(
+                function_name, 
+                'Supplied file path was not of a string type.')
+            return ""
+
+        if file_path.startswith("~"):
+            absolute_file_path = os.path.expanduser(file_path)
+        else:
+            absolute_file_path = os.path.abspath(file_path)
+
+        if not os.path.isfile(absolute_file_path):
+            self.register_a_general_error(
+                function_name, 
+                'Supplied file path "{}" is invalid.'.format(
+                    absolute_file_path))
+            return ""
+
+        if not (os.access(absolute_file_path, os.W_OK) and
+                os.access(os.path.dirname(absolute_file_path), os.W_OK)):
+            self.register_a_general_error(
+                function_name, 
+                'Supplied file "{}" or its directory is not writable.'.format(
+                    absolute_file_path))
+            return ""
+
+        return absolute_file_path
+#
+###
+#
+    def select_file_without_extraction(self, file_path):
+        function_name = "select_file_without_extraction"
+        self.variables["no_general_error_has_been_registered"] = True
+
+        absolute_file_path = self.return_writable_file_path(
+            function_name, file_path)
+        if ((absolute_file_path == "") or
+            not self.wait_until_file_is_ready(function_name, absolute_file_path)):
+            self.variables["source_of_metadata"]["extracted"] = ""
+            self.metadata["extracted"] = {}
+        else:
+            self.variables["source_of_metadata"]["extracted"] = \
+                absolute_file_path
+            self.variables["metadata_datetime"]["extracted"] = \
+                datetime.datetime.utcnow()
+            self.variables["metadata_datetime_string"]["extracted"] = \
+                self.return_datetime_string(
+                    self.variables["metadata_datetime"]["extracted"])
+            self.metadata["extracted"] = {"SourceFile": absolute_file_path}
+#
+###
 #
     def check_if_tags_would_be_overwritten(self, mode):
         function_name = "check_if_tags_would_be_overwritten"
@@ -1249,55 +3407,363 @@ class Handler():
 #
 ###
 #
-    def embed_prepared_metadata(self):
-        function_name = "embed_prepared_metadata"
-        self.variables["no_general_error_has_been_registered"] = True
+    def check_prepared_metadata_for_unrecognised_tags(
+            self, function_name, source_description):
 
-        if self.metadata["extracted"] == {}:
-            self.register_a_general_error(
-                function_name, 
-                "No target file has been selected.")
+        number_of_unrecognised_tags = \
+            len(self.variables["unrecognised_tags"]["prepared"])
+        if number_of_unrecognised_tags > 0:
+            if self.options["allow_unrecognised_tags"]["value"]:
+                self.show_a_warning_message(
+                    function_name,
+                    '{} {} unrecognised tag names. There is no guarantee that these represent valid metadata fields.'.format(
+                        source_description,
+                        number_of_unrecognised_tags))
+            else:
+                self.register_a_general_error(
+                    function_name,
+                    '{} {} unrecognised tag names. Add appropriate details to the accompany file "module_exiftool_recognised_tags.dat" in order to avoid this problem.'.format(
+                        source_description,
+                        number_of_unrecognised_tags))
+#
+###
+#
+    def return_exiftool_embedding_arguments(self, prepared_metadata=None):
+        if prepared_metadata is None:
+            prepared_metadata = self.metadata["prepared"]
+
+        embedding_arguments = []
+        tag_names = sorted( prepared_metadata.keys() )
+        for full_tag_name in tag_names:
+            if full_tag_name.startswith("UNKNOWN"):
+                applied_tag_name = full_tag_name[8:]
+            else:
+                applied_tag_name = full_tag_name
 
-        if self.metadata["prepared"] == {}:
-            self.register_a_general_error(
-                function_name, 
-                "Prepared metadata have not been created.")
+            value_type = type(prepared_metadata[full_tag_name])
 
-        if self.variables["no_general_error_has_been_registered"]:
-            exiftool_arguments = ["exiftool", "-overwrite_original"]
-            tag_names = sorted( self.metadata["prepared"].keys() )
-            for full_tag_name in tag_names:
-                if full_tag_name.startswith("UNKNOWN"):
-                    applied_tag_name = full_tag_name[8:]
-                else:
-                    applied_tag_name = full_tag_name
+            if value_type == list:
+                for value in prepared_metadata[full_tag_name]:
+                    if self.variables["python_version"] == 2:
+                        embedding_arguments.append("-{}={}".format(
+                            applied_tag_name, 
+                            value.encode('utf8', 'replace')))
+                    else:
+                        embedding_arguments.append("-{}={}".format(
+                            applied_tag_name,
+                            value))
+
+            elif self.variables["python_version"] == 2:
+                embedding_arguments.append("-{}={}".format(
+                    applied_tag_name, 
+                    prepared_metadata[full_tag_name].encode('utf8', 'replace')))
+            else:
+                embedding_arguments.append("-{}={}".format(
+                    applied_tag_name, 
+                    prepared_metadata[full_tag_name]))
 
-                value_type = type(self.metadata["prepared"][full_tag_name])
+        return embedding_arguments
+#
+###
+#
+# The "native" XMP writer embeds tags listed in "native_xmp_properties" in a
+# JPEG file without running ExifTool. The existing XMP packet, if any, is
+# parsed and the supplied properties replace any existing ones before the
+# packet is written back to its APP1 segment. All other segments and the
+# image data are copied unchanged. The metadata are written natively only if
+# every prepared tag can be, so that a file is never written partly by this
+# writer and partly by ExifTool. Returns True if the metadata were written,
+# and False, with the file untouched, if they must be embedded by ExifTool.
+#
+    def embed_xmp_natively_in_jpeg(self, file_path, prepared_metadata):
+        import xml.etree.ElementTree
+        if not self.return_xmp_can_be_written_natively(prepared_metadata):
+            return False
 
-                if value_type == list:
-                    for value in self.metadata["prepared"][full_tag_name]:
-                        if self.variables["python_version"] == 2:
-                            exiftool_arguments.append("-{}={}".format(
-                                applied_tag_name, 
-                                value.encode('utf8', 'replace'))),
-                        else:
-                            exiftool_arguments.append("-{}={}".format(
-                                applied_tag_name,
-                                value))
-
-                elif self.variables["python_version"] == 2:
-                    exiftool_arguments.append("-{}={}".format(
-                        applied_tag_name, 
-                        self.metadata["prepared"][full_tag_name].encode('utf8', 'replace')))
-                else:
-                    exiftool_arguments.append("-{}={}".format(
-                        applied_tag_name, 
-                        self.metadata["prepared"][full_tag_name]))
+        try:
+            source_file = open(file_path, "rb")
+        except (IOError, OSError):
+            return False
 
-            file_path_for_os = self.return_file_path_for_os(
-                self.variables["source_of_metadata"]["extracted"])
-            exiftool_arguments.append(file_path_for_os)
-            exit_code = subprocess.call(exiftool_arguments)
+        temporary_file_path = None
+        try:
+            header_segments = self.return_jpeg_header_segments(source_file)
+            xmp_segment_index = None
+            insertion_index = 0
+            segment_index = 0
+            for marker, segment_data in header_segments:
+                if marker == 0xE1 and segment_data.startswith(
+                        self.variables["jpeg_extended_xmp_identifier"]):
+                    raise ValueError("Extended XMP is not supported.")
+                elif marker == 0xE1 and segment_data.startswith(
+                        self.variables["jpeg_xmp_identifier"]):
+                    if xmp_segment_index is not None:
+                        raise ValueError("More than one XMP segment found.")
+                    xmp_segment_index = segment_index
+                elif ((marker == 0xE0) or
+                      ((marker == 0xE1) and segment_data.startswith(b"Exif\x00"))):
+                    insertion_index = segment_index + 1
+                segment_index += 1
+
+            if xmp_segment_index is None:
+                existing_packet = None
+            else:
+                existing_packet = header_segments[xmp_segment_index][1][
+                    len(self.variables["jpeg_xmp_identifier"]):]
+
+            segment_data = self.variables["jpeg_xmp_identifier"] + \
+                self.return_xmp_packet(existing_packet, prepared_metadata)
+            if len(segment_data) + 2 > self.variables["maximum_jpeg_segment_length"]:
+                raise ValueError("The XMP packet is too large for one segment.")
+
+            if xmp_segment_index is None:
+                header_segments.insert(insertion_index, (0xE1, segment_data))
+            else:
+                header_segments[xmp_segment_index] = (0xE1, segment_data)
+
+            file_descriptor, temporary_file_path = tempfile.mkstemp(
+                dir=os.path.dirname(file_path), suffix=".tmp")
+            temporary_file = os.fdopen(file_descriptor, "wb")
+            try:
+                temporary_file.write(b"\xff\xd8")
+                for marker, segment_data in header_segments:
+                    temporary_file.write(bytes([0xFF, marker]))
+                    temporary_file.write(
+                        (len(segment_data) + 2).to_bytes(2, "big"))
+                    temporary_file.write(segment_data)
+                shutil.copyfileobj(source_file, temporary_file, 1048576)
+            finally:
+                temporary_file.close()
+
+            shutil.copymode(file_path, temporary_file_path)
+            os.replace(temporary_file_path, file_path)
+            temporary_file_path = None
+        except (ValueError, IOError, OSError,
+                xml.etree.ElementTree.ParseError):
+            return False
+        finally:
+            source_file.close()
+            if temporary_file_path is not None:
+                os.remove(temporary_file_path)
+
+        return True
+#
+###
+#
+    def return_xmp_can_be_written_natively(self, prepared_metadata):
+        if prepared_metadata == {}:
+            return False
+
+        for full_tag_name in prepared_metadata:
+            if ((full_tag_name not in self.variables["native_xmp_properties"]) or
+                (self.return_xmp_values(
+                    full_tag_name, prepared_metadata[full_tag_name]) is None)):
+                return False
+
+        return True
+#
+###
+#
+# Reads the segments that precede the first non-APPn and non-COM marker of a
+# JPEG file, leaving the file positioned at that marker.
+#
+    def return_jpeg_header_segments(self, source_file):
+        if source_file.read(2) != b"\xff\xd8":
+            raise ValueError("The file is not a JPEG file.")
+
+        header_segments = []
+        while True:
+            marker_position = source_file.tell()
+            marker_bytes = source_file.read(2)
+            if len(marker_bytes) != 2 or marker_bytes[0] != 0xFF:
+                raise ValueError("A JPEG marker was expected.")
+
+            marker = marker_bytes[1]
+            if not ((0xE0 <= marker <= 0xEF) or (marker == 0xFE)):
+                source_file.seek(marker_position)
+                return header_segments
+
+            length_bytes = source_file.read(2)
+            if len(length_bytes) != 2:
+                raise ValueError("The JPEG file is truncated.")
+            segment_length = int.from_bytes(length_bytes, "big")
+            segment_data = source_file.read(segment_length - 2)
+            if len(segment_data) != segment_length - 2:
+                raise ValueError("The JPEG file is truncated.")
+
+            header_segments.append((marker, segment_data))
+#
+###
+#
+    def return_xmp_values(self, full_tag_name, tag_value):
+        if type(tag_value) == list:
+            tag_values = tag_value
+        else:
+            tag_values = [tag_value]
+
+        namespace_prefix, property_name, structure, is_date = \
+            self.variables["native_xmp_properties"][full_tag_name]
+        if structure in ["simple", "lang_alt"] and len(tag_values) != 1:
+            return None
+
+        xmp_values = []
+        for sub_value in tag_values:
+            if type(sub_value) not in self.variables["string_types"]:
+                return None
+            if is_date:
+                date_match = self.variables["xmp_date_pattern"].match(sub_value)
+                if date_match is None:
+                    return None
+                xmp_value = "-".join(date_match.group(1, 2, 3))
+                if date_match.group(4) is not None:
+                    xmp_value += "T" + date_match.group(4)[1:]
+                if date_match.group(6) is not None:
+                    xmp_value += date_match.group(6)
+                sub_value = xmp_value
+            xmp_values.append(sub_value)
+
+        return xmp_values
+#
+###
+#
+    def return_xmp_packet(self, existing_packet, native_metadata):
+        import xml.etree.ElementTree
+        namespaces = self.variables["xmp_namespaces"]
+        for namespace_prefix in namespaces:
+            if namespace_prefix != "xml":
+                xml.etree.ElementTree.register_namespace(
+                    namespace_prefix, namespaces[namespace_prefix])
+
+        rdf_tag = "{" + namespaces["rdf"] + "}"
+        if existing_packet is None:
+            xmp_root = xml.etree.ElementTree.Element(
+                "{" + namespaces["x"] + "}xmpmeta")
+            rdf_root = xml.etree.ElementTree.SubElement(
+                xmp_root, rdf_tag + "RDF")
+        else:
+            xmp_root = xml.etree.ElementTree.fromstring(existing_packet)
+            if xmp_root.tag == rdf_tag + "RDF":
+                rdf_root = xmp_root
+            else:
+                rdf_root = xmp_root.find(rdf_tag + "RDF")
+                if rdf_root is None:
+                    raise ValueError("The XMP packet has no RDF element.")
+
+        xmp_root.set("{" + namespaces["x"] + "}xmptk",
+                     self.variables["xmp_toolkit"])
+
+        descriptions = rdf_root.findall(rdf_tag + "Description")
+        if len(descriptions) == 0:
+            descriptions.append(xml.etree.ElementTree.SubElement(
+                rdf_root, rdf_tag + "Description",
+                {rdf_tag + "about": ""}))
+
+        for full_tag_name in sorted(native_metadata):
+            namespace_prefix, property_name, structure, is_date = \
+                self.variables["native_xmp_properties"][full_tag_name]
+            property_tag = \
+                "{" + namespaces[namespace_prefix] + "}" + property_name
+
+            for description in descriptions:
+                if property_tag in description.attrib:
+                    del description.attrib[property_tag]
+                for existing_property in description.findall(property_tag):
+                    description.remove(existing_property)
+
+            xmp_values = self.return_xmp_values(
+                full_tag_name, native_metadata[full_tag_name])
+            property_element = xml.etree.ElementTree.SubElement(
+                descriptions[0], property_tag)
+            if structure == "simple":
+                property_element.text = xmp_values[0]
+            else:
+                if structure == "lang_alt":
+                    container_tag = rdf_tag + "Alt"
+                elif structure == "bag":
+                    container_tag = rdf_tag + "Bag"
+                else:
+                    container_tag = rdf_tag + "Seq"
+                container = xml.etree.ElementTree.SubElement(
+                    property_element, container_tag)
+                for xmp_value in xmp_values:
+                    list_item = xml.etree.ElementTree.SubElement(
+                        container, rdf_tag + "li")
+                    if structure == "lang_alt":
+                        list_item.set(
+                            "{" + namespaces["xml"] + "}lang", "x-default")
+                    list_item.text = xmp_value
+
+        xmp_packet = "".join([
+            "<?xpacket begin='\ufeff' id='W5M0MpCehiHzreSzNTczkc9d'?>\n",
+            xml.etree.ElementTree.tostring(xmp_root, encoding="unicode"),
+            "\n",
+            self.variables["xmp_packet_padding"],
+            "<?xpacket end='w'?>"])
+
+        return xmp_packet.encode("utf8")
+#
+###
+#
+# Returns the embedding arguments for the prepared metadata. If these were
+# prepared in "live" mode from a template, the arguments for the template's
+# constant values are built once and cached, and only those for the values
+# that change from file to file are built here. The cache is cleared
+# whenever an option is set or the template is compiled.
+#
+    def return_cached_exiftool_embedding_arguments(self):
+        template_id = self.variables["source_of_metadata"]["prepared"]
+        if ((self.variables["prepared_metadata_mode"] != "live") or
+            (template_id not in self.variables["templates"])):
+            return self.return_exiftool_embedding_arguments()
+
+        constant_metadata = \
+            self.variables["templates"][template_id]["compiled_constant_metadata"]
+        if template_id not in self.variables["exiftool_argument_cache"]:
+            self.variables["exiftool_argument_cache"][template_id] = \
+                self.return_exiftool_embedding_arguments(constant_metadata)
+
+        changing_metadata = {}
+        for full_tag_name in self.metadata["prepared"]:
+            if full_tag_name not in constant_metadata:
+                changing_metadata[full_tag_name] = \
+                    self.metadata["prepared"][full_tag_name]
+
+        return self.variables["exiftool_argument_cache"][template_id] + \
+            self.return_exiftool_embedding_arguments(changing_metadata)
+#
+###
+#
+    def embed_prepared_metadata(self):
+        function_name = "embed_prepared_metadata"
+        self.variables["no_general_error_has_been_registered"] = True
+
+        if self.metadata["extracted"] == {}:
+            self.register_a_general_error(
+                function_name, 
+                "No target file has been selected.")
+
+        if self.metadata["prepared"] == {}:
+            self.register_a_general_error(
+                function_name, 
+                "Prepared metadata have not been created.")
+
+        if self.variables["no_general_error_has_been_registered"]:
+            if ((self.options["xmp_writer"]["value"] == "native") and
+                self.embed_xmp_natively_in_jpeg(
+                    self.variables["source_of_metadata"]["extracted"],
+                    self.metadata["prepared"])):
+                exit_code = 0
+            else:
+                exiftool_arguments = ["exiftool", "-overwrite_original"] + \
+                    self.return_cached_exiftool_embedding_arguments()
+                file_path_for_os = self.return_file_path_for_os(
+                    self.variables["source_of_metadata"]["extracted"])
+                exiftool_arguments.append(file_path_for_os)
+                try:
+                    exit_code = self.run_exiftool_command(
+                        exiftool_arguments, False)[0]
+                except OSError:
+                    exit_code = 1
             if exit_code != 0:
                 self.register_a_general_error(
                     function_name, 
@@ -1317,7 +3783,9 @@ class Handler():
         self.variables["no_general_error_has_been_registered"] = True
 
         exit_code = 1
-        self.prepare_metadata_from_template(template_id, substitutions)
+        self.prepare_metadata_from_template(
+            template_id, substitutions, "live", 
+            self.return_file_name_substitutions(template_id, [file_path])[0])
         if self.metadata["prepared"] != {}:
             number_of_unrecognised_tags = \
                 len(self.variables["unrecognised_tags"]["prepared"])
@@ -1333,8 +3801,37 @@ class Handler():
                         'The template contains {} unrecognised tag names. Add appropriate details to the accompany file "module_exiftool_recognised_tags.dat" in order to avoid this problem.'.format(
                             number_of_unrecognised_tags))
 
+        journal_details = None
         if self.variables["no_general_error_has_been_registered"]:
-            self.extract(file_path, False)
+            journal_details, file_is_journalled = self.return_journal_details(
+                template_id, self.metadata["prepared"], file_path)
+            if file_is_journalled:
+                return 0
+
+        file_is_already_tagged = False
+        if (self.variables["no_general_error_has_been_registered"] and
+            (self.variables["fingerprint_tag_name"] in self.metadata["prepared"]) and
+            (type(file_path) in self.variables["string_types"])):
+            if file_path.startswith("~"):
+                absolute_file_path = os.path.expanduser(file_path)
+            else:
+                absolute_file_path = os.path.abspath(file_path)
+            if os.path.isfile(absolute_file_path):
+                file_is_already_tagged = \
+                    (self.return_embedded_fingerprints([absolute_file_path]).get(absolute_file_path) ==
+                     self.metadata["prepared"][self.variables["fingerprint_tag_name"]])
+
+        if file_is_already_tagged:
+            exit_code = 0
+
+        elif (self.variables["no_general_error_has_been_registered"] and
+            self.should_write_blindly()):
+            self.select_file_without_extraction(file_path)
+            if self.metadata["extracted"] != {}:
+                exit_code = self.embed_prepared_metadata()
+
+        elif self.variables["no_general_error_has_been_registered"]:
+            self.extract_for_overwrite_check(file_path)
             if self.metadata["extracted"] != {}:
                 tags_would_be_overwritten = \
                     self.check_if_tags_would_be_overwritten("live")
@@ -1346,6 +3843,7 @@ class Handler():
                     exit_code = self.embed_prepared_metadata()
 
         if exit_code == 0:
+            self.record_journal_details(template_id, journal_details)
             return 0
         else:
             return 1
@@ -1373,8 +3871,14 @@ class Handler():
                         'The input metadata contain {} unrecognised tag names. Add appropriate details to the accompany file "module_exiftool_recognised_tags.dat" in order to avoid this problem.'.format(
                             number_of_unrecognised_tags))
 
-        if self.variables["no_general_error_has_been_registered"]:
-            self.extract(file_path, False)
+        if (self.variables["no_general_error_has_been_registered"] and
+            self.should_write_blindly()):
+            self.select_file_without_extraction(file_path)
+            if self.metadata["extracted"] != {}:
+                exit_code = self.embed_prepared_metadata()
+
+        elif self.variables["no_general_error_has_been_registered"]:
+            self.extract_for_overwrite_check(file_path)
             if self.metadata["extracted"] != {}:
                 tags_would_be_overwritten = \
                     self.check_if_tags_would_be_overwritten("live")
@@ -1391,6 +3895,849 @@ class Handler():
             return 1
 #
 ###
+#
+    def return_hashable_value(self, value):
+        if type(value) == dict:
+            return tuple(sorted(
+                [(key, self.return_hashable_value(value[key]))
+                 for key in value],
+                key=repr))
+        elif type(value) in [list, tuple]:
+            return tuple(
+                [self.return_hashable_value(sub_value) for sub_value in value])
+        else:
+            try:
+                hash(value)
+            except TypeError:
+                return (type(value).__name__, repr(value))
+            else:
+                return (type(value).__name__, value)
+#
+###
+#
+# The batch embedding methods accept a substitution provider, which may be
+# a dictionary of substitutions keyed on file path, any iterable of
+# (file path, substitutions) pairs such as a generator, or a callable that
+# returns either. Returns an iterator of (file path, substitutions) pairs.
+#
+    def return_files_and_substitutions(self, substitution_provider):
+        if callable(substitution_provider):
+            substitution_provider = substitution_provider()
+        if type(substitution_provider) == dict:
+            return iter(substitution_provider.items())
+        return iter(substitution_provider)
+#
+###
+#
+# Returns a compact fingerprint of a template identifier and the metadata
+# prepared from it. The standard tags and the template's time-dependent
+# entries are excluded, so that the fingerprint is the same whenever the
+# template is applied with the same substitutions.
+#
+    def return_prepared_metadata_fingerprint(self, template_id, prepared_metadata):
+        import hashlib
+        excluded_tag_names = set(self.variables["standard_tag_names"])
+        excluded_tag_names.add(self.variables["fingerprint_tag_name"])
+        if template_id in self.variables["templates"]:
+            for time_dependent_entry in self.variables["templates"][template_id]["compiled_time_dependent_entries"]:
+                excluded_tag_names.add(time_dependent_entry[1])
+
+        fingerprinted_metadata = [template_id]
+        for full_tag_name in sorted(prepared_metadata):
+            if full_tag_name not in excluded_tag_names:
+                fingerprinted_metadata.append(
+                    [full_tag_name, prepared_metadata[full_tag_name]])
+
+        return hashlib.blake2b(
+            json.dumps(
+                fingerprinted_metadata, 
+                ensure_ascii=False, 
+                separators=(",", ":"), 
+                default=str).encode("utf8"),
+            digest_size=16).hexdigest()
+#
+###
+#
+# Returns the fingerprints embedded in the supplied files, keyed on absolute
+# file path, with None for files that have no fingerprint. They are read by
+# the native JPEG reader where possible, and otherwise extracted with a
+# single ExifTool command for all of the remaining files.
+#
+    def return_embedded_fingerprints(self, absolute_file_paths):
+        fingerprint_tag_name = self.variables["fingerprint_tag_name"]
+        embedded_fingerprints = {}
+        remaining_file_paths = []
+        for absolute_file_path in absolute_file_paths:
+            natively_read_metadata = None
+            if absolute_file_path.lower().endswith(self.variables["jpeg_file_name_extensions"]):
+                natively_read_metadata = \
+                    self.return_natively_read_metadata(absolute_file_path)
+            if natively_read_metadata is None:
+                remaining_file_paths.append(absolute_file_path)
+            else:
+                embedded_fingerprints[absolute_file_path] = \
+                    natively_read_metadata.get(fingerprint_tag_name)
+
+        if len(remaining_file_paths) > 0:
+            no_general_error_has_been_registered = \
+                self.variables["no_general_error_has_been_registered"]
+            for absolute_file_path, extracted_metadata in self.extract_many(
+                    remaining_file_paths, [fingerprint_tag_name]):
+                embedded_fingerprints[absolute_file_path] = \
+                    extracted_metadata.get(fingerprint_tag_name)
+            self.variables["no_general_error_has_been_registered"] = \
+                no_general_error_has_been_registered
+
+        return embedded_fingerprints
+#
+###
+#
+# Opens, creating it if necessary, an SQLite journal of the files in which
+# metadata have been embedded. Each successful embed records the file's
+# path, inode, size and modification time together with the template
+# identifier and the fingerprint of the prepared metadata, and files whose
+# journal entry still matches are skipped without running ExifTool. This
+# allows an interrupted run over many files to be resumed. The journal uses
+# write-ahead logging, so it may be shared by parallel worker processes.
+#
+    def open_journal(self, journal_file_path):
+        function_name = "open_journal"
+        self.variables["no_general_error_has_been_registered"] = True
+        import sqlite3
+
+        self.close_journal()
+        if journal_file_path.startswith("~"):
+            journal_file_path = os.path.expanduser(journal_file_path)
+        else:
+            journal_file_path = os.path.abspath(journal_file_path)
+
+        try:
+            journal = sqlite3.connect(
+                journal_file_path, timeout=60, check_same_thread=False)
+            journal.execute("PRAGMA journal_mode=WAL")
+            journal.execute("PRAGMA synchronous=NORMAL")
+            journal.execute(
+                "CREATE TABLE IF NOT EXISTS embedded_files ("
+                "path TEXT PRIMARY KEY, "
+                "inode INTEGER, "
+                "size INTEGER, "
+                "mtime_ns INTEGER, "
+                "template_id TEXT, "
+                "prepared_metadata_hash TEXT)")
+            journal.commit()
+        except sqlite3.Error as exception_message:
+            self.register_a_general_error(
+                function_name, 
+                'Journal "{}" could not be opened. {}'.format(
+                    journal_file_path, exception_message))
+            return 1
+
+        self.variables["journal"] = journal
+        self.variables["journal_file_path"] = journal_file_path
+        return 0
+#
+###
+#
+    def close_journal(self):
+        with self.locks["journal"]:
+            journal = self.variables["journal"]
+            self.variables["journal"] = None
+            self.variables["journal_file_path"] = ""
+            if journal is not None:
+                journal.close()
+#
+###
+#
+# Returns the journal entry that a file would have if the metadata with the
+# given fingerprint had just been embedded in it, or None if the file cannot
+# be found.
+#
+    def return_journal_entry(
+            self, absolute_file_path, template_id, prepared_metadata_hash):
+        try:
+            file_status = os.stat(absolute_file_path)
+        except OSError:
+            return None
+        return (absolute_file_path, file_status.st_ino, file_status.st_size,
+                file_status.st_mtime_ns, template_id, prepared_metadata_hash)
+#
+###
+#
+# Returns the recorded journal entries for the supplied absolute file paths,
+# keyed on path. The paths are looked up in batches of at most
+# "maximum_number_of_paths_per_journal_lookup".
+#
+    def return_recorded_journal_entries(self, absolute_file_paths):
+        recorded_journal_entries = {}
+        if self.variables["journal"] is None:
+            return recorded_journal_entries
+
+        import sqlite3
+        absolute_file_paths = list(absolute_file_paths)
+        batch_size = self.variables["maximum_number_of_paths_per_journal_lookup"]
+        try:
+            with self.locks["journal"]:
+                for first_index in range(0, len(absolute_file_paths), batch_size):
+                    batch_of_paths = \
+                        absolute_file_paths[first_index:first_index + batch_size]
+                    for journal_entry in self.variables["journal"].execute(
+                            "SELECT path, inode, size, mtime_ns, template_id, prepared_metadata_hash "
+                            "FROM embedded_files WHERE path IN ({})".format(
+                                ", ".join(["?"] * len(batch_of_paths))),
+                            batch_of_paths):
+                        recorded_journal_entries[journal_entry[0]] = \
+                            tuple(journal_entry)
+        except sqlite3.Error as exception_message:
+            self.show_a_warning_message(
+                "return_recorded_journal_entries",
+                "The journal could not be read. {}".format(exception_message))
+
+        return recorded_journal_entries
+#
+###
+#
+    def record_in_journal(self, journal_entries):
+        if (self.variables["journal"] is None) or (len(journal_entries) == 0):
+            return
+
+        import sqlite3
+        try:
+            with self.locks["journal"], self.variables["journal"]:
+                self.variables["journal"].executemany(
+                    "INSERT OR REPLACE INTO embedded_files "
+                    "(path, inode, size, mtime_ns, template_id, prepared_metadata_hash) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    journal_entries)
+        except sqlite3.Error as exception_message:
+            self.show_a_warning_message(
+                "record_in_journal",
+                "The journal could not be updated. {}".format(exception_message))
+#
+###
+#
+# Returns the journal details of a file for the metadata prepared from a
+# template, which are its absolute path and the fingerprint of the metadata,
+# and whether the journal records these metadata as already embedded in the
+# unchanged file. The details are None if no journal is open or the file
+# path is not a string.
+#
+    def return_journal_details(self, template_id, prepared_metadata, file_path):
+        if ((self.variables["journal"] is None) or
+            (type(file_path) not in self.variables["string_types"])):
+            return None, False
+
+        if file_path.startswith("~"):
+            absolute_file_path = os.path.expanduser(file_path)
+        else:
+            absolute_file_path = os.path.abspath(file_path)
+        prepared_metadata_hash = self.return_prepared_metadata_fingerprint(
+            template_id, prepared_metadata)
+        recorded_journal_entries = \
+            self.return_recorded_journal_entries([absolute_file_path])
+        file_is_journalled = (
+            (absolute_file_path in recorded_journal_entries) and
+            (recorded_journal_entries[absolute_file_path] ==
+             self.return_journal_entry(
+                 absolute_file_path, template_id, prepared_metadata_hash)))
+        return (absolute_file_path, prepared_metadata_hash), file_is_journalled
+#
+###
+#
+# Records in the journal that the metadata given by journal details from
+# return_journal_details have been embedded in the file.
+#
+    def record_journal_details(self, template_id, journal_details):
+        if journal_details is None:
+            return
+
+        journal_entry = self.return_journal_entry(
+            journal_details[0], template_id, journal_details[1])
+        if journal_entry is not None:
+            self.record_in_journal([journal_entry])
+#
+###
+#
+# Embeds metadata from a template in many files with a single ExifTool
+# process. Metadata are prepared once for each distinct substitutions
+# dictionary (together with the substitutions taken from the file names,
+# which are parsed for the whole batch at once), and the embedding arguments
+# for each distinct set of prepared metadata are written once to an ExifTool
+# argument file, which is used with all the files that share those metadata.
+# Unless writing blindly (see should_write_blindly), tags that would be
+# overwritten are checked for, as by embed_from_template, with the existing
+# metadata of all the files extracted in one pass. If the
+# "check_file_readiness" option is True, files that are still being written
+# are deferred to the end of the batch. If a journal is open (see
+# open_journal), files already recorded in it are skipped, with their exit
+# codes set to 0, and successfully tagged files are recorded. Likewise, if
+# the "embed_fingerprint" option is True, files whose embedded fingerprint
+# matches the prepared metadata are skipped, the fingerprints being read in
+# one pass before any file is tagged. Returns a list of exit codes (0 or 1)
+# in the same order as the supplied files or, if should_return_results is
+# True, a list of EmbeddingResult records.
+#
+    def embed_many_from_template(
+            self, template_id, files_and_substitutions,
+            should_return_results=False):
+
+        function_name = "embed_many_from_template"
+
+        files_and_substitutions = list(
+            self.return_files_and_substitutions(files_and_substitutions))
+
+        number_of_files = len(files_and_substitutions)
+        exit_codes = [1] * number_of_files
+        error_codes = [""] * number_of_files
+        skipped_file_indices = set()
+        tags_written = [()] * number_of_files
+        overwritten_tags = [None] * number_of_files
+        prepare_seconds = [0.0] * number_of_files
+        check_seconds = [0.0] * number_of_files
+        write_seconds = [0.0] * number_of_files
+        prepared_metadata_for_substitutions = {}
+        prepared_metadata_for_group = {}
+        files_for_group = {}
+        tags_written_for_group = {}
+        files_to_check = []
+        files_to_group = []
+
+        recorded_journal_entries = {}
+        journal_details_for_file_index = {}
+        journal_entries = []
+        prepared_metadata_hash_for_substitutions = {}
+        embedded_fingerprints = {}
+        if ((self.variables["journal"] is not None) or
+            self.options["embed_fingerprint"]["value"]):
+            absolute_file_paths = []
+            for file_path, substitutions in files_and_substitutions:
+                if type(file_path) not in self.variables["string_types"]:
+                    continue
+                elif file_path.startswith("~"):
+                    absolute_file_paths.append(os.path.expanduser(file_path))
+                else:
+                    absolute_file_paths.append(os.path.abspath(file_path))
+            recorded_journal_entries = \
+                self.return_recorded_journal_entries(absolute_file_paths)
+
+        if self.options["embed_fingerprint"]["value"]:
+            unjournalled_file_paths = []
+            for absolute_file_path in absolute_file_paths:
+                file_state = self.return_journal_entry(absolute_file_path, "", "")
+                if file_state is None:
+                    continue
+                if ((absolute_file_path not in recorded_journal_entries) or
+                    (recorded_journal_entries[absolute_file_path][1:4] != file_state[1:4])):
+                    unjournalled_file_paths.append(absolute_file_path)
+            embedded_fingerprints = \
+                self.return_embedded_fingerprints(unjournalled_file_paths)
+
+        file_name_substitutions = self.return_file_name_substitutions(
+            template_id, 
+            [file_path for file_path, substitutions in files_and_substitutions])
+
+        file_indices = list(range(len(files_and_substitutions)))
+        if self.options["check_file_readiness"]["value"]:
+            file_indices.sort(key=lambda file_index: not self.return_file_readiness(
+                files_and_substitutions[file_index][0]))
+
+        iteration_start_times = []
+        for file_index in file_indices:
+            file_path, substitutions = files_and_substitutions[file_index]
+            self.variables["no_general_error_has_been_registered"] = True
+            iteration_start_times.append(time.perf_counter())
+
+            substitutions_key = (
+                self.return_hashable_value(substitutions),
+                self.return_hashable_value(file_name_substitutions[file_index]))
+            if substitutions_key not in prepared_metadata_for_substitutions:
+                prepare_start_time = time.perf_counter()
+                self.prepare_metadata_from_template(
+                    template_id, substitutions, "live", 
+                    file_name_substitutions[file_index])
+                if self.metadata["prepared"] != {}:
+                    self.check_prepared_metadata_for_unrecognised_tags(
+                        function_name, "The template contains")
+                    if not self.variables["no_general_error_has_been_registered"]:
+                        self.metadata["prepared"] = {}
+
+                prepared_metadata_for_substitutions[substitutions_key] = \
+                    self.metadata["prepared"]
+                prepare_seconds[file_index] = \
+                    time.perf_counter() - prepare_start_time
+
+            prepared_metadata = \
+                prepared_metadata_for_substitutions[substitutions_key]
+
+            if prepared_metadata == {}:
+                error_codes[file_index] = "metadata_not_prepared"
+            elif type(file_path) not in self.variables["string_types"]:
+                self.register_a_general_error(
+                    function_name,
+                    'Supplied file path number {} was not of a string type.'.format(
+                        file_index + 1))
+                error_codes[file_index] = "invalid_file_path"
+            elif file_path.startswith("~"):
+                file_path = os.path.expanduser(file_path)
+            else:
+                file_path = os.path.abspath(file_path)
+
+            if ((prepared_metadata != {}) and
+                self.variables["no_general_error_has_been_registered"] and
+                (self.variables["journal"] is not None)):
+
+                if substitutions_key not in prepared_metadata_hash_for_substitutions:
+                    prepared_metadata_hash_for_substitutions[substitutions_key] = \
+                        self.return_prepared_metadata_fingerprint(
+                            template_id, prepared_metadata)
+                prepared_metadata_hash = \
+                    prepared_metadata_hash_for_substitutions[substitutions_key]
+
+                if ((file_path in recorded_journal_entries) and
+                    (recorded_journal_entries[file_path] ==
+                     self.return_journal_entry(
+                         file_path, template_id, prepared_metadata_hash))):
+                    exit_codes[file_index] = 0
+                    skipped_file_indices.add(file_index)
+                    continue
+                journal_details_for_file_index[file_index] = \
+                    (file_path, prepared_metadata_hash)
+
+            if ((prepared_metadata != {}) and
+                self.variables["no_general_error_has_been_registered"] and
+                (self.variables["fingerprint_tag_name"] in prepared_metadata) and
+                (embedded_fingerprints.get(file_path) ==
+                 prepared_metadata[self.variables["fingerprint_tag_name"]])):
+                exit_codes[file_index] = 0
+                skipped_file_indices.add(file_index)
+                if file_index in journal_details_for_file_index:
+                    journal_entry = self.return_journal_entry(
+                        file_path, template_id,
+                        journal_details_for_file_index[file_index][1])
+                    if journal_entry is not None:
+                        journal_entries.append(journal_entry)
+                continue
+
+            if ((prepared_metadata != {}) and
+                self.variables["no_general_error_has_been_registered"]):
+
+                if self.should_write_blindly():
+                    self.return_writable_file_path(function_name, file_path)
+                    if not self.variables["no_general_error_has_been_registered"]:
+                        error_codes[file_index] = "invalid_file_path"
+
+                elif not os.path.isfile(file_path):
+                    self.register_a_general_error(
+                        function_name,
+                        'Supplied file path "{}" is invalid.'.format(
+                            file_path))
+                    error_codes[file_index] = "invalid_file_path"
+
+                if self.variables["no_general_error_has_been_registered"]:
+                    self.wait_until_file_is_ready(function_name, file_path)
+                    if not self.variables["no_general_error_has_been_registered"]:
+                        error_codes[file_index] = "file_not_ready"
+                    elif self.should_write_blindly():
+                        files_to_group.append(
+                            (file_index, file_path, prepared_metadata))
+                    else:
+                        files_to_check.append(
+                            (file_index, file_path, prepared_metadata))
+
+        iteration_start_times.append(time.perf_counter())
+        for iteration_number, file_index in enumerate(file_indices):
+            check_seconds[file_index] = \
+                iteration_start_times[iteration_number + 1] - \
+                iteration_start_times[iteration_number] - \
+                prepare_seconds[file_index]
+#
+# Unless writing blindly, the files are checked for tags that would be
+# overwritten, as embed_from_template does, with the existing metadata of
+# all of them extracted in one pass.
+#
+        if len(files_to_check) > 0:
+            check_start_time = time.perf_counter()
+            checked_tag_names = set()
+            for file_index, file_path, prepared_metadata in files_to_check:
+                checked_tag_names.update(prepared_metadata)
+            for file_to_check, file_path_and_metadata in zip(
+                    files_to_check,
+                    self.extract_many_for_overwrite_check(
+                        [file_path for file_index, file_path, prepared_metadata in files_to_check],
+                        checked_tag_names)):
+                file_index, file_path, prepared_metadata = file_to_check
+                self.variables["no_general_error_has_been_registered"] = True
+                self.metadata["prepared"] = prepared_metadata
+                self.metadata["extracted"] = file_path_and_metadata[1]
+                if self.metadata["extracted"] == {}:
+                    error_codes[file_index] = "extraction_failed"
+                    continue
+
+                self.variables["source_of_metadata"]["extracted"] = file_path
+                overwritten_tags[file_index] = tuple(
+                    full_tag_name for full_tag_name in sorted(prepared_metadata)
+                    if full_tag_name in self.metadata["extracted"])
+                if (self.check_if_tags_would_be_overwritten("live") and
+                    not self.options["allow_tag_overwrites"]["value"]):
+                    self.register_a_general_error(
+                        function_name,
+                        'Tag overwrites are not allowed. Change the value of the "allow_tag_overwrites" option to True in order to continue.')
+                    error_codes[file_index] = "tag_overwrite"
+                else:
+                    files_to_group.append(file_to_check)
+
+            check_seconds_per_file = \
+                (time.perf_counter() - check_start_time) / len(files_to_check)
+            for file_index, file_path, prepared_metadata in files_to_check:
+                check_seconds[file_index] += check_seconds_per_file
+
+#
+# If the "xmp_writer" option is "native", each file is first offered to the
+# native XMP writer, and only the files that it cannot write are grouped for
+# ExifTool.
+#
+        file_exit_codes = {}
+        for file_index, file_path, prepared_metadata in files_to_group:
+            if self.options["xmp_writer"]["value"] == "native":
+                write_start_time = time.perf_counter()
+                if self.embed_xmp_natively_in_jpeg(file_path, prepared_metadata):
+                    write_seconds[file_index] = \
+                        time.perf_counter() - write_start_time
+                    tags_written[file_index] = tuple(sorted(prepared_metadata))
+                    file_exit_codes[file_index] = 0
+                    continue
+
+            group_key = self.return_hashable_value(prepared_metadata)
+            if group_key not in files_for_group:
+                prepared_metadata_for_group[group_key] = prepared_metadata
+                files_for_group[group_key] = []
+                tags_written_for_group[group_key] = \
+                    tuple(sorted(prepared_metadata))
+            tags_written[file_index] = tags_written_for_group[group_key]
+            files_for_group[group_key].append(
+                (file_index, self.return_file_path_for_os(file_path)))
+#
+# The files of each group share one ExifTool command. If a command fails,
+# the files of its group are written again one at a time, so that the files
+# that failed can be told apart from the others.
+#
+        working_directory = tempfile.mkdtemp(prefix="exiftool_handler_")
+        try:
+            sections = []
+            group_keys_for_sections = []
+            argument_file_path_for_group = {}
+            group_number = 1
+            for group_key in files_for_group:
+                self.metadata["prepared"] = \
+                    prepared_metadata_for_group[group_key]
+                argument_file_path_for_group[group_key] = os.path.join(
+                    working_directory, "group_{}.args".format(group_number))
+                group_argument_file = open(
+                    argument_file_path_for_group[group_key], "wb")
+                for argument in self.return_cached_exiftool_embedding_arguments():
+                    group_argument_file.write(
+                        self.return_exiftool_argument_line(argument).encode(
+                            "utf8"))
+                group_argument_file.close()
+
+                sections.append(
+                    ["-overwrite_original", "-@", argument_file_path_for_group[group_key]] +
+                    [file_path_for_os for file_index, file_path_for_os in files_for_group[group_key]])
+                group_keys_for_sections.append(group_key)
+                group_number += 1
+
+            write_start_time = time.perf_counter()
+            section_exit_codes = self.run_exiftool_sections(
+                sections, working_directory)
+
+            retried_sections = []
+            retried_file_indices = []
+            for group_key, section_exit_code in zip(
+                    group_keys_for_sections, section_exit_codes):
+                if (section_exit_code == 0) or (len(files_for_group[group_key]) == 1):
+                    for file_index, file_path_for_os in files_for_group[group_key]:
+                        file_exit_codes[file_index] = section_exit_code
+                else:
+                    for file_index, file_path_for_os in files_for_group[group_key]:
+                        retried_sections.append([
+                            "-overwrite_original",
+                            "-@",
+                            argument_file_path_for_group[group_key],
+                            file_path_for_os])
+                        retried_file_indices.append(file_index)
+
+            if len(retried_sections) > 0:
+                for file_index, section_exit_code in zip(
+                        retried_file_indices,
+                        self.run_exiftool_sections(
+                            retried_sections, working_directory)):
+                    file_exit_codes[file_index] = section_exit_code
+
+            if len(sections) > 0:
+                write_seconds_per_file = \
+                    (time.perf_counter() - write_start_time) / \
+                    sum(len(files_for_group[group_key]) for group_key in files_for_group)
+                for group_key in files_for_group:
+                    for file_index, file_path_for_os in files_for_group[group_key]:
+                        write_seconds[file_index] = write_seconds_per_file
+        finally:
+            shutil.rmtree(working_directory, ignore_errors=True)
+
+        for file_index in file_exit_codes:
+            if file_exit_codes[file_index] != 0:
+                error_codes[file_index] = "exiftool_failed"
+                tags_written[file_index] = ()
+            else:
+                exit_codes[file_index] = 0
+                if file_index in journal_details_for_file_index:
+                    file_path, prepared_metadata_hash = \
+                        journal_details_for_file_index[file_index]
+                    journal_entry = self.return_journal_entry(
+                        file_path, template_id, prepared_metadata_hash)
+                    if journal_entry is not None:
+                        journal_entries.append(journal_entry)
+        self.record_in_journal(journal_entries)
+
+        self.variables["no_general_error_has_been_registered"] = \
+            (1 not in exit_codes)
+        if 1 in exit_codes:
+            self.register_a_general_error(
+                function_name,
+                "Metadata could not be embedded in {} of {} files.".format(
+                    exit_codes.count(1),
+                    len(exit_codes)))
+
+        self.variables["source_of_metadata"]["extracted"] = ""
+        self.metadata["extracted"] = {}
+
+        if not should_return_results:
+            return exit_codes
+
+        results = []
+        for file_index in range(number_of_files):
+            if exit_codes[file_index] != 0:
+                status = "failed"
+            elif file_index in skipped_file_indices:
+                status = "skipped"
+            else:
+                status = "embedded"
+            results.append(EmbeddingResult(
+                files_and_substitutions[file_index][0], status,
+                error_codes[file_index], tags_written[file_index],
+                overwritten_tags[file_index], prepare_seconds[file_index],
+                check_seconds[file_index], write_seconds[file_index]))
+
+        return results
+#
+###
+#
+# Returns the arguments of initialise_parallel_worker, which give a worker
+# process the template file, the option values, the file name pattern and
+# capture time format and the journal of this handler.
+#
+    def return_parallel_worker_arguments(self, template_id):
+        option_values = {}
+        for option_name in self.options:
+            option_values[option_name] = self.options[option_name]["value"]
+
+        return (self.variables["templates"][template_id]["file_path"],
+                option_values,
+                self.variables["file_name_pattern"],
+                self.variables["capture_time_format"],
+                self.variables["journal_file_path"])
+#
+###
+#
+# Embeds metadata from a template in the files given by a substitution
+# provider, which is consumed lazily in chunks of at most
+# "maximum_number_of_files_per_chunk" files, so that very many files can be
+# driven from a generator. Each chunk is embedded with
+# embed_many_from_template, either in this process or, if number_of_workers
+# is greater than 1, by a pool of worker processes with at most two chunks
+# per worker in hand at a time. Yields (file path, exit code) pairs, or
+# EmbeddingResult records if should_return_results is True, in the order in
+# which the provider supplied the files.
+#
+    def embed_many_from_provider(
+            self, template_id, substitution_provider, number_of_workers=1,
+            should_return_results=False):
+
+        function_name = "embed_many_from_provider"
+        self.variables["no_general_error_has_been_registered"] = True
+
+        if template_id not in self.variables["templates"]:
+            self.register_a_general_error(
+                function_name, 
+                'Supplied template identifier "{}" is not recognised.'.format(
+                    template_id))
+            return
+
+        if (type(number_of_workers) != int) or (number_of_workers < 1):
+            self.register_a_general_error(
+                function_name, 
+                "The number of workers must be a positive integer.")
+            return
+
+        files_and_substitutions = \
+            self.return_files_and_substitutions(substitution_provider)
+        chunks = iter(
+            lambda: list(itertools.islice(
+                files_and_substitutions,
+                self.variables["maximum_number_of_files_per_chunk"])),
+            [])
+
+        if number_of_workers == 1:
+            for chunk in chunks:
+                chunk_results = self.embed_many_from_template(
+                    template_id, chunk, should_return_results)
+                if should_return_results:
+                    for result in chunk_results:
+                        yield result
+                else:
+                    for file_and_substitutions, exit_code in zip(chunk, chunk_results):
+                        yield file_and_substitutions[0], exit_code
+            return
+
+        import multiprocessing
+        worker_pool = multiprocessing.Pool(
+            processes=number_of_workers,
+            initializer=initialise_parallel_worker,
+            initargs=self.return_parallel_worker_arguments(template_id))
+        pending_chunk_results = collections.deque()
+        try:
+            for chunk in chunks:
+                pending_chunk_results.append(worker_pool.apply_async(
+                    embed_chunk_in_parallel_worker,
+                    (chunk, should_return_results)))
+                while len(pending_chunk_results) >= 2 * number_of_workers:
+                    for file_result in pending_chunk_results.popleft().get():
+                        yield file_result
+
+            while len(pending_chunk_results) > 0:
+                for file_result in pending_chunk_results.popleft().get():
+                    yield file_result
+            worker_pool.close()
+        except:
+            worker_pool.terminate()
+            raise
+        finally:
+            worker_pool.join()
+#
+###
+#
+# Embeds metadata from a template in many files using a pool of worker
+# processes. Each worker creates its own Handler, with a persistent ExifTool
+# process, and loads the template once. The files are divided into shards,
+# several per worker, which are processed in turn. Returns a list of
+# (file path, exit code, error messages) tuples in the same order as the
+# supplied files or, if should_return_results is True, a list of
+# EmbeddingResult records, each shard then being embedded with
+# embed_many_from_template.
+#
+    def embed_many_in_parallel(
+            self, template_id, files_and_substitutions, number_of_workers=None,
+            should_return_results=False):
+
+        import multiprocessing
+        function_name = "embed_many_in_parallel"
+        self.variables["no_general_error_has_been_registered"] = True
+
+        files_and_substitutions = list(
+            self.return_files_and_substitutions(files_and_substitutions))
+
+        if template_id not in self.variables["templates"]:
+            self.register_a_general_error(
+                function_name, 
+                'Supplied template identifier "{}" is not recognised.'.format(
+                    template_id))
+
+        if number_of_workers is None:
+            number_of_workers = multiprocessing.cpu_count()
+        elif (type(number_of_workers) != int) or (number_of_workers < 1):
+            self.register_a_general_error(
+                function_name, 
+                "The number of workers must be a positive integer.")
+
+        if not self.variables["no_general_error_has_been_registered"]:
+            if should_return_results:
+                return [
+                    EmbeddingResult(file_path, "failed", "metadata_not_prepared")
+                    for file_path, substitutions in files_and_substitutions]
+            return [(file_path, 1, []) for file_path, substitutions in files_and_substitutions]
+
+        number_of_files = len(files_and_substitutions)
+        number_of_shards = \
+            number_of_workers * self.variables["number_of_shards_per_worker"]
+        shard_size = max(1, -(-number_of_files // number_of_shards))
+        shards = [
+            files_and_substitutions[first_index:first_index + shard_size]
+            for first_index in range(0, number_of_files, shard_size)]
+
+        results = []
+        worker_pool = multiprocessing.Pool(
+            processes=min(number_of_workers, max(1, len(shards))),
+            initializer=initialise_parallel_worker,
+            initargs=self.return_parallel_worker_arguments(template_id))
+        try:
+            if should_return_results:
+                for shard_results in worker_pool.starmap(
+                        embed_chunk_in_parallel_worker,
+                        [(shard, True) for shard in shards]):
+                    results.extend(shard_results)
+            else:
+                for shard_results in worker_pool.imap(
+                        embed_shard_in_parallel_worker, shards):
+                    results.extend(shard_results)
+            worker_pool.close()
+        except:
+            worker_pool.terminate()
+            raise
+        finally:
+            worker_pool.join()
+
+        number_of_failures = 0
+        for result in results:
+            if should_return_results:
+                exit_code = result.exit_code
+            else:
+                exit_code = result[1]
+            if exit_code != 0:
+                number_of_failures += 1
+        if number_of_failures > 0:
+            self.register_a_general_error(
+                function_name,
+                "Metadata could not be embedded in {} of {} files.".format(
+                    number_of_failures,
+                    number_of_files))
+
+        return results
+#
+###
+#
+# Aggregates a sequence of EmbeddingResult records, returning the number of
+# files for each status and each error code, and the total time spent in
+# each stage.
+#
+    def return_embedding_results_summary(self, results):
+        number_of_files_for_status = \
+            {"embedded": 0, "skipped": 0, "failed": 0}
+        number_of_files_for_error_code = {}
+        total_seconds_for_stage = {"prepare": 0.0, "check": 0.0, "write": 0.0}
+        for result in results:
+            number_of_files_for_status[result.status] += 1
+            if result.error_code != "":
+                number_of_files_for_error_code[result.error_code] = \
+                    number_of_files_for_error_code.get(result.error_code, 0) + 1
+            total_seconds_for_stage["prepare"] += result.prepare_seconds
+            total_seconds_for_stage["check"] += result.check_seconds
+            total_seconds_for_stage["write"] += result.write_seconds
+
+        return {
+            "number_of_files": sum(number_of_files_for_status.values()),
+            "number_of_files_for_status": number_of_files_for_status,
+            "number_of_files_for_error_code": number_of_files_for_error_code,
+            "total_seconds_for_stage": total_seconds_for_stage}
+#
+###
 #
     def test_from_template(
             self, template_id, substitutions=None, file_path=None):
@@ -1400,6 +4747,10 @@ class Handler():
         if substitutions == None:
             self.prepare_metadata_from_template(
                 template_id, {}, "test_format")
+        elif file_path != None:
+            self.prepare_metadata_from_template(
+                template_id, substitutions, "test_value",
+                self.return_file_name_substitutions(template_id, [file_path])[0])
         else:
             self.prepare_metadata_from_template(
                 template_id, substitutions, "test_value")
@@ -1424,7 +4775,7 @@ class Handler():
                 print("")
 
             if file_path != None:
-                self.extract(file_path, False)
+                self.extract_for_overwrite_check(file_path)
                 if self.metadata["extracted"] != {}:
                     tags_would_be_overwritten = \
                         self.check_if_tags_would_be_overwritten("test")
@@ -1459,7 +4810,7 @@ class Handler():
                 print("")
 
             if file_path != None:
-                self.extract(file_path, False)
+                self.extract_for_overwrite_check(file_path)
                 if self.metadata["extracted"] != {}:
                     tags_would_be_overwritten = \
                         self.check_if_tags_would_be_overwritten("test")
@@ -1467,3 +4818,872 @@ class Handler():
                         self.register_a_general_error(
                             function_name, 
                             'Tag overwrites are not allowed. Change the value of the "allow_tag_overwrites" option to True in order to continue.')
+#
+###
+#
+# Asynchronous front end for a Handler. Extraction and embedding are carried
+# out with asyncio subprocesses so that the event loop is not blocked, and
+# the number of ExifTool processes running at any one time is limited by
+# "maximum_number_of_concurrent_commands". Metadata for each call are held
+# locally between awaits, so many calls may be in flight at once. Other
+# attributes, e.g. set_option() and load_a_template(), are those of the
+# underlying Handler. If the "xmp_writer" option is "native", the native XMP
+# writer is run in the event loop's default executor. If a journal is open,
+# embed_from_template skips and records files as the Handler method does.
+#
+class AsyncHandler():
+    def __init__(self, handler=None, maximum_number_of_concurrent_commands=4):
+        if handler is None:
+            handler = Handler()
+        self.handler = handler
+        self.maximum_number_of_concurrent_commands = \
+            maximum_number_of_concurrent_commands
+        self.semaphore = None
+#
+###
+#
+    def __getattr__(self, attribute_name):
+        return getattr(self.handler, attribute_name)
+#
+###
+#
+    async def run_exiftool_command(
+            self, exiftool_arguments, should_capture_output=True):
+
+        import asyncio
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(
+                self.maximum_number_of_concurrent_commands)
+
+        if should_capture_output:
+            standard_output = asyncio.subprocess.PIPE
+        else:
+            standard_output = None
+
+        async with self.semaphore:
+            exiftool_process = await asyncio.create_subprocess_exec(
+                *self.handler.return_exiftool_command(exiftool_arguments),
+                stdout=standard_output)
+            exiftool_return_string = \
+                (await exiftool_process.communicate())[0]
+
+        if exiftool_return_string is None:
+            exiftool_return_string = b""
+
+        return exiftool_process.returncode, exiftool_return_string
+#
+###
+#
+    def return_absolute_file_path(self, function_name, source_file_path):
+        if not type(source_file_path) in self.handler.variables["string_types"]:
+            self.handler.register_a_general_error(
+                function_name, 
+                'Supplied source file path was not of a string type.')
+            return ""
+
+        if source_file_path.startswith("~"):
+            absolute_file_path = os.path.expanduser(source_file_path)
+        else:
+            absolute_file_path = os.path.abspath(source_file_path)
+
+        if not os.path.isfile(absolute_file_path):
+            self.handler.register_a_general_error(
+                function_name, 
+                'Supplied file path "{}" is invalid.'.format(
+                    absolute_file_path))
+            return ""
+
+        return absolute_file_path
+#
+###
+#
+    async def wait_until_file_is_ready(self, function_name, absolute_file_path):
+        if not self.handler.options["check_file_readiness"]["value"]:
+            return True
+
+        import asyncio
+        end_time = time.monotonic() + \
+            self.handler.variables["file_readiness_maximum_wait"]
+        while not self.handler.return_file_readiness(absolute_file_path):
+            remaining_time = end_time - time.monotonic()
+            if remaining_time <= 0:
+                self.handler.register_a_general_error(
+                    function_name, 
+                    'Supplied file "{}" was still being written after {} seconds.'.format(
+                        absolute_file_path,
+                        self.handler.variables["file_readiness_maximum_wait"]))
+                return False
+            await asyncio.sleep(min(
+                remaining_time,
+                self.handler.variables["file_readiness_stability_window"] / 5.0))
+
+        return True
+#
+###
+#
+    async def return_extracted_metadata(
+            self, function_name, absolute_file_path,
+            extraction_profile="full", tag_names=None):
+
+        file_path_for_os = self.handler.return_file_path_for_os(
+            absolute_file_path)
+        exiftool_arguments = \
+            self.handler.return_exiftool_extraction_arguments(
+                file_path_for_os, extraction_profile, tag_names)
+        try:
+            exit_code, exiftool_return_string = \
+                await self.run_exiftool_command(exiftool_arguments)
+        except OSError:
+            exit_code = 1
+
+        if exit_code != 0:
+            self.handler.register_a_general_error(
+                function_name, 
+                "ExifTool extraction command failed. The selected file was probably of a type that does not support embedded metadata.")
+            return {}
+
+        try:
+            return self.handler.return_parsed_extraction_output(
+                exiftool_return_string)
+        except:
+            self.handler.register_a_general_error(
+                function_name, 
+                "Return from ExifTool extraction command could not be parsed.")
+            return {}
+#
+###
+#
+    async def extract(self, source_file_path):
+        function_name = "extract"
+
+        extracted_metadata = {}
+        absolute_file_path = self.return_absolute_file_path(
+            function_name, source_file_path)
+        if ((absolute_file_path != "") and
+            await self.wait_until_file_is_ready(function_name, absolute_file_path)):
+            extraction_datetime = datetime.datetime.utcnow()
+            extracted_metadata = await self.return_extracted_metadata(
+                function_name, absolute_file_path)
+
+        if extracted_metadata != {}:
+            self.handler.metadata["extracted"] = extracted_metadata
+            self.handler.variables["source_of_metadata"]["extracted"] = \
+                absolute_file_path
+            self.handler.variables["metadata_datetime"]["extracted"] = \
+                extraction_datetime
+            self.handler.variables["metadata_datetime_string"]["extracted"] = \
+                self.handler.return_datetime_string(extraction_datetime)
+
+        return extracted_metadata
+#
+###
+#
+    def is_tagged_with_fingerprint(
+            self, absolute_file_path, prepared_metadata, extracted_metadata=None):
+        fingerprint_tag_name = self.handler.variables["fingerprint_tag_name"]
+        if fingerprint_tag_name not in prepared_metadata:
+            return False
+
+        if extracted_metadata is None:
+            extracted_metadata = \
+                self.handler.return_natively_read_metadata(absolute_file_path)
+            if extracted_metadata is None:
+                return False
+
+        return (extracted_metadata.get(fingerprint_tag_name) ==
+                prepared_metadata[fingerprint_tag_name])
+#
+###
+#
+    async def embed_prepared_metadata_in_file(
+            self, function_name, prepared_metadata, file_path, result):
+
+        import asyncio
+        if self.handler.should_write_blindly():
+            absolute_file_path = self.handler.return_writable_file_path(
+                function_name, file_path)
+            if absolute_file_path == "":
+                result.error_code = "invalid_file_path"
+                return 1
+            if not await self.wait_until_file_is_ready(
+                    function_name, absolute_file_path):
+                result.error_code = "file_not_ready"
+                return 1
+            if self.is_tagged_with_fingerprint(
+                    absolute_file_path, prepared_metadata):
+                result.status = "skipped"
+                result.error_code = ""
+                return 0
+            tags_would_be_overwritten = False
+        else:
+            absolute_file_path = self.return_absolute_file_path(
+                function_name, file_path)
+            if absolute_file_path == "":
+                result.error_code = "invalid_file_path"
+                return 1
+            if not await self.wait_until_file_is_ready(
+                    function_name, absolute_file_path):
+                result.error_code = "file_not_ready"
+                return 1
+            if self.is_tagged_with_fingerprint(
+                    absolute_file_path, prepared_metadata):
+                result.status = "skipped"
+                result.error_code = ""
+                return 0
+
+            extracted_metadata = await self.return_extracted_metadata(
+                function_name, 
+                absolute_file_path,
+                self.handler.options["extraction_profile"]["value"],
+                prepared_metadata.keys())
+            if extracted_metadata == {}:
+                result.error_code = "extraction_failed"
+                return 1
+            if self.is_tagged_with_fingerprint(
+                    absolute_file_path, prepared_metadata, extracted_metadata):
+                result.status = "skipped"
+                result.error_code = ""
+                return 0
+            result.overwritten_tags = tuple(
+                full_tag_name for full_tag_name in sorted(prepared_metadata)
+                if full_tag_name in extracted_metadata)
+
+            self.handler.metadata["extracted"] = extracted_metadata
+            self.handler.metadata["prepared"] = prepared_metadata
+            self.handler.variables["source_of_metadata"]["extracted"] = \
+                absolute_file_path
+            tags_would_be_overwritten = \
+                self.handler.check_if_tags_would_be_overwritten("live")
+            self.handler.metadata["extracted"] = {}
+            self.handler.variables["source_of_metadata"]["extracted"] = ""
+
+        if tags_would_be_overwritten and not self.handler.options["allow_tag_overwrites"]["value"]:
+            self.handler.register_a_general_error(
+                function_name, 
+                'Tag overwrites are not allowed. Change the value of the "allow_tag_overwrites" option to True in order to continue.')
+            result.error_code = "tag_overwrite"
+            return 1
+
+        write_start_time = time.perf_counter()
+        if ((self.handler.options["xmp_writer"]["value"] == "native") and
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.handler.embed_xmp_natively_in_jpeg,
+                absolute_file_path, prepared_metadata)):
+            exit_code = 0
+        else:
+            exiftool_arguments = ["exiftool", "-overwrite_original"] + \
+                self.handler.return_exiftool_embedding_arguments(
+                    prepared_metadata) + \
+                [self.handler.return_file_path_for_os(absolute_file_path)]
+            try:
+                exit_code = (await self.run_exiftool_command(
+                    exiftool_arguments, False))[0]
+            except OSError:
+                exit_code = 1
+        result.write_seconds = time.perf_counter() - write_start_time
+
+        if exit_code != 0:
+            self.handler.register_a_general_error(
+                function_name, 
+                "ExifTool returned an error whilst trying to embed metadata.")
+            result.error_code = "exiftool_failed"
+            return 1
+
+        result.status = "embedded"
+        result.error_code = ""
+        result.tags_written = tuple(sorted(prepared_metadata))
+        return 0
+#
+###
+#
+# Completes the timings of an EmbeddingResult and returns it if
+# should_return_result is True, or otherwise its exit code. The check time
+# is the elapsed time outside preparation and ExifTool, and so includes any
+# time spent waiting for other calls on the event loop.
+#
+    def return_embedding_outcome(self, result, start_time, should_return_result):
+        result.check_seconds = time.perf_counter() - start_time - \
+            result.prepare_seconds - result.write_seconds
+        if should_return_result:
+            return result
+        return result.exit_code
+#
+###
+#
+    async def embed_from_template(
+            self, template_id, substitutions, file_path,
+            should_return_result=False):
+
+        function_name = "embed_from_template"
+        result = EmbeddingResult(file_path, "failed", "metadata_not_prepared")
+        start_time = time.perf_counter()
+
+        self.handler.prepare_metadata_from_template(
+            template_id, substitutions, "live",
+            self.handler.return_file_name_substitutions(
+                template_id, [file_path])[0])
+        if self.handler.metadata["prepared"] != {}:
+            self.handler.check_prepared_metadata_for_unrecognised_tags(
+                function_name, "The template contains")
+        result.prepare_seconds = time.perf_counter() - start_time
+
+        if ((self.handler.metadata["prepared"] != {}) and
+            self.handler.variables["no_general_error_has_been_registered"]):
+            journal_details, file_is_journalled = \
+                self.handler.return_journal_details(
+                    template_id, self.handler.metadata["prepared"], file_path)
+            if file_is_journalled:
+                result.status = "skipped"
+                result.error_code = ""
+            elif await self.embed_prepared_metadata_in_file(
+                    function_name, self.handler.metadata["prepared"],
+                    file_path, result) == 0:
+                self.handler.record_journal_details(template_id, journal_details)
+
+        return self.return_embedding_outcome(
+            result, start_time, should_return_result)
+#
+###
+#
+    async def embed_from_input(
+            self, input_metadata, file_path, should_return_result=False):
+
+        function_name = "embed_from_input"
+        result = EmbeddingResult(file_path, "failed", "metadata_not_prepared")
+        start_time = time.perf_counter()
+
+        self.handler.prepare_metadata_from_input(input_metadata)
+        if self.handler.metadata["prepared"] != {}:
+            self.handler.check_prepared_metadata_for_unrecognised_tags(
+                function_name, "The input metadata contain")
+        result.prepare_seconds = time.perf_counter() - start_time
+
+        if ((self.handler.metadata["prepared"] != {}) and
+            self.handler.variables["no_general_error_has_been_registered"]):
+            await self.embed_prepared_metadata_in_file(
+                function_name, self.handler.metadata["prepared"], file_path,
+                result)
+
+        return self.return_embedding_outcome(
+            result, start_time, should_return_result)
+#
+###
+#
+# Returns the content hash of a template file, which identifies its cached
+# compiled form.
+#
+def return_template_file_content_hash(file_path):
+    import hashlib
+    template_file = open(file_path, "rb")
+    try:
+        return hashlib.blake2b(template_file.read(), digest_size=16).hexdigest()
+    finally:
+        template_file.close()
+#
+###
+#
+# Parses a template file for Handler.load_templates_from_directory. Returns
+# (parsed template, content hash, error message), the error message being ""
+# if the file was parsed.
+#
+def parse_template_file(file_path):
+    import hashlib, yaml
+    try:
+        template_file = open(file_path, "rb")
+        try:
+            template_bytes = template_file.read()
+        finally:
+            template_file.close()
+        parsed_template = yaml.load(
+            template_bytes,
+            Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    except (IOError, OSError, yaml.YAMLError) as exception_message:
+        return None, "", str(exception_message)
+
+    return (parsed_template,
+            hashlib.blake2b(template_bytes, digest_size=16).hexdigest(),
+            "")
+#
+###
+#
+# Worker process functions for Handler.embed_many_in_parallel. These must be
+# defined at module level so that they can be used by multiprocessing.
+#
+parallel_worker = {}
+
+def initialise_parallel_worker(
+        template_file_path, option_values, file_name_pattern,
+        capture_time_format, journal_file_path=""):
+    import multiprocessing.util
+    handler = Handler()
+    for option_name in option_values:
+        handler.set_option(option_name, option_values[option_name])
+    handler.set_option("persistent_exiftool", True)
+    handler.set_file_name_pattern(file_name_pattern, capture_time_format)
+    if journal_file_path != "":
+        handler.open_journal(journal_file_path)
+        multiprocessing.util.Finalize(
+            handler, handler.close_journal, exitpriority=10)
+
+    parallel_worker["handler"] = handler
+    parallel_worker["template_id"] = handler.load_a_template(template_file_path)
+    multiprocessing.util.Finalize(handler, handler.close, exitpriority=10)
+#
+###
+#
+def embed_chunk_in_parallel_worker(
+        files_and_substitutions, should_return_results=False):
+
+    handler = parallel_worker["handler"]
+    if parallel_worker["template_id"] != "":
+        chunk_results = handler.embed_many_from_template(
+            parallel_worker["template_id"], files_and_substitutions,
+            should_return_results)
+    elif should_return_results:
+        chunk_results = [
+            EmbeddingResult(file_path, "failed", "metadata_not_prepared")
+            for file_path, substitutions in files_and_substitutions]
+    else:
+        chunk_results = [1] * len(files_and_substitutions)
+
+    if should_return_results:
+        return chunk_results
+    return [(file_and_substitutions[0], exit_code) for file_and_substitutions, exit_code in
+            zip(files_and_substitutions, chunk_results)]
+#
+###
+#
+def embed_shard_in_parallel_worker(files_and_substitutions):
+    handler = parallel_worker["handler"]
+    shard_results = []
+    for file_path, substitutions in files_and_substitutions:
+        handler.variables["registered_error_messages"] = []
+        if parallel_worker["template_id"] == "":
+            handler.variables["registered_error_messages"].append(
+                "initialise_parallel_worker(). The template could not be loaded.")
+            exit_code = 1
+        else:
+            try:
+                exit_code = handler.embed_from_template(
+                    parallel_worker["template_id"], substitutions, file_path)
+            except Exception as exception_message:
+                handler.variables["registered_error_messages"].append(
+                    "embed_from_template(). {}".format(exception_message))
+                exit_code = 1
+
+        shard_results.append((
+            file_path,
+            exit_code,
+            handler.variables["registered_error_messages"]))
+        handler.variables["registered_error_messages"] = None
+
+    return shard_results
+#
+###
+#
+# Watches a directory tree, such as a camera's date/hour image tree, and tags
+# each new JPEG file from a template as it arrives. Linux inotify is used
+# where available, with new subdirectories watched as they are created, and
+# the tree is otherwise polled. While it runs, the handler's
+# "persistent_exiftool" option is set, and its previous value is restored
+# afterwards. The latency from each file being written to it being tagged is
+# recorded. Files are forgotten once their tagging has been seen or they
+# leave the tree, so that a long-running watcher does not accumulate state.
+#
+class DirectoryWatcher():
+    def __init__(
+            self, handler, template_id, root_directory_path,
+            substitutions=None, polling_interval=1.0,
+            file_name_extensions=(".jpg", ".jpeg"),
+            maximum_number_of_latencies=10000):
+        self.handler = handler
+        self.template_id = template_id
+        self.root_directory_path = os.path.abspath(
+            os.path.expanduser(root_directory_path))
+        if substitutions is None:
+            substitutions = {}
+        self.substitutions = substitutions
+        self.polling_interval = polling_interval
+        self.file_name_extensions = tuple(
+            extension.lower() for extension in file_name_extensions)
+
+        self.inotify = {
+            "IN_CLOSE_WRITE": 0x00000008,
+            "IN_MOVED_FROM": 0x00000040,
+            "IN_MOVED_TO": 0x00000080,
+            "IN_CREATE": 0x00000100,
+            "IN_DELETE": 0x00000200,
+            "IN_DELETE_SELF": 0x00000400,
+            "IN_Q_OVERFLOW": 0x00004000,
+            "IN_IGNORED": 0x00008000,
+            "IN_ISDIR": 0x40000000,
+            "event_header_format": "iIII"}
+        self.inotify["watch_mask"] = (
+            self.inotify["IN_CLOSE_WRITE"] | self.inotify["IN_MOVED_FROM"] |
+            self.inotify["IN_MOVED_TO"] | self.inotify["IN_CREATE"] |
+            self.inotify["IN_DELETE"] | self.inotify["IN_DELETE_SELF"])
+
+        self.watched_directory_paths = {}
+        self.known_file_states = {}
+        self.tagged_file_states = {}
+        self.deferred_files = collections.OrderedDict()
+        self.latencies = collections.deque(maxlen=maximum_number_of_latencies)
+        self.number_of_files_tagged = 0
+        self.number_of_files_failed = 0
+        self.number_of_deferrals = 0
+        self.should_stop = False
+#
+###
+#
+    def stop(self):
+        self.should_stop = True
+#
+###
+#
+    def is_a_watched_file_name(self, file_name):
+        return file_name.lower().endswith(self.file_name_extensions)
+#
+###
+#
+    def return_file_state(self, file_path):
+        try:
+            file_status = os.stat(file_path)
+        except OSError:
+            return None
+        return (file_status.st_mtime_ns, file_status.st_size)
+#
+###
+#
+    def return_file_paths_in_tree(self, directory_path):
+        file_paths = []
+        for directory_path, directory_names, file_names in os.walk(
+                directory_path):
+            directory_names.sort()
+            for file_name in sorted(file_names):
+                if self.is_a_watched_file_name(file_name):
+                    file_paths.append(os.path.join(directory_path, file_name))
+        return file_paths
+#
+###
+#
+# Forgets a file, or every file under a directory, that has left the tree.
+#
+    def forget_files(self, path, is_a_directory=False):
+        for file_states in [self.known_file_states, self.tagged_file_states,
+                            self.deferred_files]:
+            if is_a_directory:
+                path_prefix = os.path.join(path, "")
+                for file_path in [file_path for file_path in file_states
+                                  if file_path.startswith(path_prefix)]:
+                    del file_states[file_path]
+            else:
+                file_states.pop(path, None)
+#
+###
+#
+# Tags a file unless it is in the state in which it was last left by this
+# watcher, so that the event caused by writing the metadata is ignored. That
+# state is forgotten once it has been seen, or once the file has changed.
+# Files that are still being written are deferred, and are retried by
+# tag_deferred_files until they are ready or, after the handler's
+# "file_readiness_maximum_wait", counted as failed.
+#
+    def tag_file(self, file_path, has_been_closed=False):
+        file_state = self.return_file_state(file_path)
+        if file_state is None:
+            self.forget_files(file_path)
+            return
+        if self.tagged_file_states.pop(file_path, None) == file_state:
+            self.deferred_files.pop(file_path, None)
+            return
+
+        if file_path in self.deferred_files:
+            has_been_closed = \
+                has_been_closed or self.deferred_files[file_path][0]
+        if not self.handler.return_file_readiness(file_path, has_been_closed):
+            if file_path not in self.deferred_files:
+                self.deferred_files[file_path] = \
+                    (has_been_closed, time.monotonic())
+                self.number_of_deferrals += 1
+            elif (time.monotonic() - self.deferred_files[file_path][1] >
+                  self.handler.variables["file_readiness_maximum_wait"]):
+                del self.deferred_files[file_path]
+                self.number_of_files_failed += 1
+                self.handler.register_a_general_error(
+                    "DirectoryWatcher.tag_file",
+                    'Supplied file "{}" was still being written after {} seconds.'.format(
+                        file_path,
+                        self.handler.variables["file_readiness_maximum_wait"]))
+            return
+        self.deferred_files.pop(file_path, None)
+
+        exit_code = self.handler.embed_from_template(
+            self.template_id, self.substitutions, file_path)
+        tagged_time = time.time()
+
+        if exit_code == 0:
+            self.number_of_files_tagged += 1
+            latency = tagged_time - file_state[0] / 1.0e9
+            self.latencies.append(latency)
+            if self.handler.options["verbosity_level"]["value"] > 1:
+                print('Tagged "{}" {:.3f} s after it was written.'.format(
+                    file_path, latency))
+        else:
+            self.number_of_files_failed += 1
+
+        tagged_file_state = self.return_file_state(file_path)
+        if tagged_file_state is not None:
+            self.tagged_file_states[file_path] = tagged_file_state
+#
+###
+#
+    def tag_deferred_files(self):
+        for file_path in list(self.deferred_files):
+            if self.should_stop:
+                break
+            self.tag_file(file_path)
+#
+###
+#
+    def return_timeout(self, end_time):
+        timeout = self.polling_interval
+        if len(self.deferred_files) > 0:
+            timeout = min(
+                timeout,
+                self.handler.variables["file_readiness_stability_window"] / 5.0)
+        if end_time is not None:
+            timeout = min(timeout, end_time - time.monotonic())
+        return timeout
+#
+###
+#
+    def return_latency_statistics(self):
+        latency_statistics = {
+            "number_of_files_tagged": self.number_of_files_tagged,
+            "number_of_files_failed": self.number_of_files_failed,
+            "number_of_deferrals": self.number_of_deferrals,
+            "mean_seconds": None,
+            "p50_seconds": None,
+            "p99_seconds": None,
+            "maximum_seconds": None}
+
+        if len(self.latencies) > 0:
+            sorted_latencies = sorted(self.latencies)
+            latency_statistics["mean_seconds"] = \
+                sum(sorted_latencies) / len(sorted_latencies)
+            latency_statistics["p50_seconds"] = sorted_latencies[
+                int(0.50 * (len(sorted_latencies) - 1) + 0.5)]
+            latency_statistics["p99_seconds"] = sorted_latencies[
+                int(0.99 * (len(sorted_latencies) - 1) + 0.5)]
+            latency_statistics["maximum_seconds"] = sorted_latencies[-1]
+
+        return latency_statistics
+#
+###
+#
+# Returns the inotify functions of the C library, or None if inotify is not
+# available on this system.
+#
+    def return_inotify_library(self):
+        if not sys.platform.startswith("linux"):
+            return None
+        import ctypes, ctypes.util
+        try:
+            c_library = ctypes.CDLL(
+                ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            c_library.inotify_init1
+            c_library.inotify_add_watch
+        except (OSError, AttributeError):
+            return None
+        c_library.inotify_add_watch.argtypes = [
+            ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return c_library
+#
+###
+#
+# Watches a directory and all of its subdirectories. Files already present
+# in a newly created subdirectory may have been written before its watch was
+# added, so these are returned for tagging.
+#
+    def add_inotify_watches(self, c_library, inotify_descriptor, directory_path):
+        file_paths = []
+        for directory_path, directory_names, file_names in os.walk(
+                directory_path):
+            directory_names.sort()
+            watch_descriptor = c_library.inotify_add_watch(
+                inotify_descriptor, os.fsencode(directory_path),
+                self.inotify["watch_mask"])
+            if watch_descriptor >= 0:
+                self.watched_directory_paths[watch_descriptor] = directory_path
+            for file_name in sorted(file_names):
+                if self.is_a_watched_file_name(file_name):
+                    file_paths.append(os.path.join(directory_path, file_name))
+        return file_paths
+#
+###
+#
+    def watch_with_inotify(self, c_library, end_time, should_tag_existing_files):
+        import select, struct
+
+        inotify_descriptor = c_library.inotify_init1(os.O_CLOEXEC)
+        if inotify_descriptor < 0:
+            return False
+
+        try:
+            existing_file_paths = self.add_inotify_watches(
+                c_library, inotify_descriptor, self.root_directory_path)
+            if should_tag_existing_files:
+                for file_path in existing_file_paths:
+                    self.tag_file(file_path)
+
+            event_header_size = struct.calcsize(
+                self.inotify["event_header_format"])
+            while not self.should_stop:
+                timeout = self.return_timeout(end_time)
+                if timeout <= 0:
+                    break
+                if not select.select([inotify_descriptor], [], [], timeout)[0]:
+                    self.tag_deferred_files()
+                    continue
+
+                event_bytes = os.read(inotify_descriptor, 65536)
+                file_paths = []
+                closed_file_paths = []
+                offset = 0
+                while offset + event_header_size <= len(event_bytes):
+                    watch_descriptor, event_mask, cookie, name_length = \
+                        struct.unpack_from(
+                            self.inotify["event_header_format"],
+                            event_bytes, offset)
+                    name = event_bytes[
+                        offset + event_header_size:
+                        offset + event_header_size + name_length].rstrip(b"\0")
+                    offset += event_header_size + name_length
+
+                    if event_mask & self.inotify["IN_Q_OVERFLOW"]:
+                        file_paths.extend(self.return_file_paths_in_tree(
+                            self.root_directory_path))
+                        continue
+                    if event_mask & self.inotify["IN_IGNORED"]:
+                        self.watched_directory_paths.pop(watch_descriptor, None)
+                        continue
+                    if watch_descriptor not in self.watched_directory_paths:
+                        continue
+
+                    path = os.path.join(
+                        self.watched_directory_paths[watch_descriptor],
+                        os.fsdecode(name))
+                    if event_mask & self.inotify["IN_ISDIR"]:
+                        if event_mask & (self.inotify["IN_CREATE"] |
+                                         self.inotify["IN_MOVED_TO"]):
+                            file_paths.extend(self.add_inotify_watches(
+                                c_library, inotify_descriptor, path))
+                        elif event_mask & (self.inotify["IN_DELETE"] |
+                                           self.inotify["IN_MOVED_FROM"]):
+                            self.forget_files(path, True)
+                    elif event_mask & (self.inotify["IN_DELETE"] |
+                                       self.inotify["IN_MOVED_FROM"]):
+                        self.forget_files(path)
+                    elif event_mask & (self.inotify["IN_CLOSE_WRITE"] |
+                                       self.inotify["IN_MOVED_TO"]):
+                        if self.is_a_watched_file_name(os.path.basename(path)):
+                            closed_file_paths.append(path)
+
+                for file_path in file_paths:
+                    if self.should_stop:
+                        break
+                    self.tag_file(file_path)
+                for file_path in closed_file_paths:
+                    if self.should_stop:
+                        break
+                    self.tag_file(file_path, True)
+                self.tag_deferred_files()
+        finally:
+            os.close(inotify_descriptor)
+
+        return True
+#
+###
+#
+# Scans the tree when polling, tagging the files that are new or that have
+# changed since the previous scan. The known file states are replaced by
+# those found, so that files that have left the tree are forgotten, and a
+# tagged file is known in the state in which it was left.
+#
+    def scan_tree(self, should_tag_changed_files=True):
+        scanned_file_states = {}
+        for file_path in self.return_file_paths_in_tree(
+                self.root_directory_path):
+            if self.should_stop:
+                break
+            file_state = self.return_file_state(file_path)
+            if file_state is None:
+                continue
+            if should_tag_changed_files and \
+               self.known_file_states.get(file_path) != file_state:
+                self.tag_file(file_path)
+                file_state = self.tagged_file_states.pop(file_path, file_state)
+            scanned_file_states[file_path] = file_state
+
+        if self.should_stop:
+            self.known_file_states.update(scanned_file_states)
+            return
+        for file_path in list(self.known_file_states):
+            if file_path not in scanned_file_states:
+                self.forget_files(file_path)
+        self.known_file_states = scanned_file_states
+#
+###
+#
+# Polls the tree, tagging files that are new or that have changed since the
+# previous scan.
+#
+    def watch_by_polling(self, end_time, should_tag_existing_files):
+        self.scan_tree(should_tag_existing_files)
+
+        while not self.should_stop:
+            timeout = self.return_timeout(end_time)
+            if timeout <= 0:
+                break
+            time.sleep(timeout)
+            self.tag_deferred_files()
+            self.scan_tree()
+#
+###
+#
+# Watches the tree until stop() is called, the process is interrupted or,
+# if given, maximum_duration seconds have passed. Returns the latency
+# statistics.
+#
+    def run(self, maximum_duration=None, should_tag_existing_files=False,
+            should_use_inotify=True):
+        if not os.path.isdir(self.root_directory_path):
+            self.handler.register_a_general_error(
+                "DirectoryWatcher.run",
+                'Supplied directory path "{}" is invalid.'.format(
+                    self.root_directory_path))
+            return self.return_latency_statistics()
+
+        end_time = None
+        if maximum_duration is not None:
+            end_time = time.monotonic() + maximum_duration
+
+        previous_persistent_exiftool = \
+            self.handler.options["persistent_exiftool"]["value"]
+        self.handler.set_option("persistent_exiftool", True)
+        self.should_stop = False
+        try:
+            c_library = None
+            if should_use_inotify:
+                c_library = self.return_inotify_library()
+            if c_library is None or not self.watch_with_inotify(
+                    c_library, end_time, should_tag_existing_files):
+                self.watch_by_polling(end_time, should_tag_existing_files)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.handler.close()
+            self.handler.set_option(
+                "persistent_exiftool", previous_persistent_exiftool)
+
+        return self.return_latency_statistics()
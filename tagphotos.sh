@@ -1,3 +1,10 @@
 #!/bin/bash
+#
+# Tags the images in an hour directory of the camera's date/hour image tree,
+# by default that of the previous hour (UTC). Any further arguments are
+# passed to writeinfo.py, for example --jobs 4.
+#
+hour_directory=${1:-/data/ncas-cam-3/images/$(date -u -d "1 hour ago" +%Y%m%d/%H)}
 
-find /data/ncas-cam-3/images/20221130/10 -type f | xargs -0 /opt/scripts/tag_photos/writeinfo.py
+exec /opt/scripts/tag_photos/writeinfo.py \
+    /opt/scripts/tag_photos/iceland_template.yaml "$hour_directory" "${@:2}"
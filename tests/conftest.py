@@ -0,0 +1,171 @@
+#
+# Shared fixtures for the tests of module_exiftool_python3. ExifTool itself
+# is replaced by tests/fake_exiftool.py, which is put first on the PATH as
+# "exiftool" (see the fake_exiftool fixture).
+#
+import json, os, shutil, stat, sys
+
+import pytest
+
+repository_directory_path = os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))
+if repository_directory_path not in sys.path:
+    sys.path.insert(0, repository_directory_path)
+
+import module_exiftool_python3
+
+test_image_file_path = os.path.join(repository_directory_path, "testimage.jpg")
+fake_exiftool_file_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fake_exiftool.py")
+#
+###
+#
+class FakeExifTool():
+    def __init__(self, bin_directory_path, log_file_path, monkeypatch):
+        self.bin_directory_path = bin_directory_path
+        self.log_file_path = log_file_path
+        self.monkeypatch = monkeypatch
+#
+###
+#
+    def return_logged_sections(self):
+        if not os.path.isfile(self.log_file_path):
+            return []
+        log_file = open(self.log_file_path, "r")
+        try:
+            return [json.loads(log_line) for log_line in log_file]
+        finally:
+            log_file.close()
+#
+###
+#
+    def return_write_sections(self):
+        return [
+            logged_section for logged_section in self.return_logged_sections()
+            if "-j" not in logged_section["arguments"]]
+#
+###
+#
+    def return_read_sections(self):
+        return [
+            logged_section for logged_section in self.return_logged_sections()
+            if "-j" in logged_section["arguments"]]
+#
+###
+#
+    def clear_log(self):
+        if os.path.isfile(self.log_file_path):
+            os.remove(self.log_file_path)
+#
+###
+#
+    def return_stored_tags(self, file_path):
+        sidecar_file_path = file_path + ".fake_exiftool.json"
+        if not os.path.isfile(sidecar_file_path):
+            return {}
+        sidecar_file = open(sidecar_file_path, "r")
+        try:
+            return json.load(sidecar_file)
+        finally:
+            sidecar_file.close()
+#
+###
+#
+    def store_tags(self, file_path, tags):
+        sidecar_file = open(file_path + ".fake_exiftool.json", "w")
+        json.dump(tags, sidecar_file)
+        sidecar_file.close()
+#
+###
+#
+    def set_failing_writes(self, path_text):
+        self.monkeypatch.setenv("FAKE_EXIFTOOL_FAILING_WRITES", path_text)
+#
+###
+#
+    def set_failing_reads(self, path_text):
+        self.monkeypatch.setenv("FAKE_EXIFTOOL_FAILING_READS", path_text)
+#
+###
+#
+    def set_standard_error_noise(self, number_of_bytes):
+        self.monkeypatch.setenv(
+            "FAKE_EXIFTOOL_STDERR_BYTES", str(number_of_bytes))
+#
+###
+#
+@pytest.fixture
+def fake_exiftool(tmp_path, monkeypatch):
+    bin_directory_path = str(tmp_path / "fake_bin")
+    os.mkdir(bin_directory_path)
+    exiftool_file_path = os.path.join(bin_directory_path, "exiftool")
+    fake_exiftool_file = open(fake_exiftool_file_path, "r")
+    script = fake_exiftool_file.read()
+    fake_exiftool_file.close()
+    exiftool_file = open(exiftool_file_path, "w")
+    exiftool_file.write("#! {}\n".format(sys.executable))
+    exiftool_file.write(script)
+    exiftool_file.close()
+    os.chmod(exiftool_file_path, os.stat(exiftool_file_path).st_mode | stat.S_IXUSR)
+
+    log_file_path = str(tmp_path / "fake_exiftool.log")
+    monkeypatch.setenv(
+        "PATH", bin_directory_path + os.pathsep + os.environ.get("PATH", ""))
+    monkeypatch.setenv("FAKE_EXIFTOOL_LOG", log_file_path)
+    for variable_name in ["FAKE_EXIFTOOL_FAILING_WRITES",
+                          "FAKE_EXIFTOOL_FAILING_READS",
+                          "FAKE_EXIFTOOL_STDERR_BYTES"]:
+        monkeypatch.delenv(variable_name, raising=False)
+
+    return FakeExifTool(bin_directory_path, log_file_path, monkeypatch)
+#
+###
+#
+@pytest.fixture
+def handler():
+    handler = module_exiftool_python3.Handler()
+    handler.set_option("verbosity_level", 0)
+    handler.variables["registered_error_messages"] = []
+    yield handler
+    handler.close()
+    handler.close_journal()
+#
+###
+#
+# Returns the paths of copies of the test image in a new directory. Their
+# names follow the default file name pattern, so that they provide the
+# "__capturetime__" and "__instrument__" substitutions.
+#
+@pytest.fixture
+def image_file_paths(tmp_path):
+    image_directory_path = tmp_path / "images"
+    image_directory_path.mkdir()
+    image_file_paths = []
+    for file_number in range(3):
+        image_file_path = str(image_directory_path /
+            "2022120107590{}-ncas-cam-3.jpg".format(file_number))
+        shutil.copyfile(test_image_file_path, image_file_path)
+        image_file_paths.append(image_file_path)
+    return image_file_paths
+#
+###
+#
+# Writes a template file and returns its path.
+#
+def write_template(directory_path, file_name, template_lines):
+    template_file_path = os.path.join(str(directory_path), file_name)
+    template_file = open(template_file_path, "w")
+    template_file.write("\n".join(template_lines) + "\n")
+    template_file.close()
+    return template_file_path
+#
+###
+#
+@pytest.fixture
+def template_id(handler, tmp_path):
+    template_file_path = write_template(tmp_path, "test_template.yaml", [
+        "- template_id: testphotos",
+        "- XMP-dc:Title: \"Camera image\"",
+        "- XMP-dc:Subject: [\"cloud\", \"{site}\"]",
+        "- XMP-dc:Source: \"{__instrument__}\""])
+    return handler.load_a_template(template_file_path)
@@ -0,0 +1,265 @@
+#! /usr/bin/env python3
+#
+# fake_exiftool
+#
+# A stand-in for ExifTool used by the tests. It understands the part of
+# ExifTool's command line that module_exiftool_python3 uses: argument files
+# ("-@"), "#[CSTR]" argument lines, "-execute" sections, "-stay_open",
+# "-echo4", "-config", JSON extraction ("-j", optionally restricted to the
+# requested tags) and writing ("-TAG=VALUE"). Written tags are kept in a
+# JSON file alongside each image ("<image>.fake_exiftool.json") and the
+# image's modification time is updated, as ExifTool's rewrite would. Images
+# are otherwise left unchanged.
+#
+# Each section run is logged as a JSON line to the file named by the
+# FAKE_EXIFTOOL_LOG environment variable. The behaviour can be changed with
+#   FAKE_EXIFTOOL_FAILING_WRITES  write fails for paths containing this text
+#   FAKE_EXIFTOOL_FAILING_READS   read fails for paths containing this text
+#   FAKE_EXIFTOOL_STDERR_BYTES    number of bytes of warnings written to
+#                                 standard error before the output of each
+#                                 stay_open command
+#
+import json, os, re, sys, time
+
+custom_namespace_group_name = "XMP-exiftoolhandler"
+#
+###
+#
+def return_sidecar_file_path(file_path):
+    return file_path + ".fake_exiftool.json"
+#
+###
+#
+def return_stored_tags(file_path):
+    try:
+        sidecar_file = open(return_sidecar_file_path(file_path), "r")
+    except (IOError, OSError):
+        return {}
+    try:
+        return json.load(sidecar_file)
+    finally:
+        sidecar_file.close()
+#
+###
+#
+def return_argument(argument_line):
+    if argument_line.startswith("#[CSTR]"):
+        return re.sub(
+            r"\\(.)",
+            lambda escape_match: {"n": "\n", "r": "\r"}.get(
+                escape_match.group(1), escape_match.group(1)),
+            argument_line[7:])
+    return argument_line
+#
+###
+#
+def return_expanded_arguments(arguments):
+    expanded_arguments = []
+    argument_index = 0
+    while argument_index < len(arguments):
+        if ((arguments[argument_index] == "-@") and
+            (argument_index + 1 < len(arguments)) and
+            (arguments[argument_index + 1] != "-")):
+            argument_file = open(
+                arguments[argument_index + 1], "r", encoding="utf8")
+            argument_lines = argument_file.read().split("\n")
+            argument_file.close()
+            file_arguments = []
+            for argument_line in argument_lines:
+                if argument_line.startswith("#[CSTR]"):
+                    file_arguments.append(return_argument(argument_line))
+                elif (argument_line != "") and not argument_line.startswith("#"):
+                    file_arguments.append(argument_line)
+            expanded_arguments += return_expanded_arguments(file_arguments)
+            argument_index += 2
+        else:
+            expanded_arguments.append(arguments[argument_index])
+            argument_index += 1
+
+    return expanded_arguments
+#
+###
+#
+def log_section(arguments, config_file_path, is_stay_open):
+    log_file_path = os.environ.get("FAKE_EXIFTOOL_LOG", "")
+    if log_file_path == "":
+        return
+    log_line = json.dumps({
+        "pid": os.getpid(),
+        "arguments": arguments,
+        "config_file_path": config_file_path,
+        "stay_open": is_stay_open}) + "\n"
+    log_descriptor = os.open(
+        log_file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(log_descriptor, log_line.encode("utf8"))
+    finally:
+        os.close(log_descriptor)
+#
+###
+#
+def return_tag_is_defined(full_tag_name, config_file_path):
+    if not full_tag_name.startswith(custom_namespace_group_name + ":"):
+        return True
+    if config_file_path is None:
+        return False
+    try:
+        config_file = open(config_file_path, "r")
+    except (IOError, OSError):
+        return False
+    try:
+        return custom_namespace_group_name[4:] in config_file.read()
+    finally:
+        config_file.close()
+#
+###
+#
+# Runs one command and returns (standard output, standard error, status).
+#
+def run_section(arguments, config_file_path, is_stay_open):
+    log_section(arguments, config_file_path, is_stay_open)
+
+    file_paths = []
+    requested_tag_names = []
+    written_values = {}
+    echo_texts = []
+    should_extract = False
+    argument_index = 0
+    while argument_index < len(arguments):
+        argument = arguments[argument_index]
+        if argument in ["-c", "-echo4"]:
+            if argument == "-echo4":
+                echo_texts.append(arguments[argument_index + 1])
+            argument_index += 2
+            continue
+        if argument == "-j":
+            should_extract = True
+        elif argument.startswith("-") and "=" in argument:
+            tag_name, tag_value = argument[1:].split("=", 1)
+            written_values.setdefault(tag_name, []).append(tag_value)
+        elif argument in ["-G1", "-fast", "-fast2", "-overwrite_original"]:
+            pass
+        elif argument.startswith("-"):
+            requested_tag_names.append(argument[1:])
+        else:
+            file_paths.append(argument)
+        argument_index += 1
+
+    output_text = ""
+    error_text = ""
+    status = 0
+    if should_extract:
+        records = []
+        for file_path in file_paths:
+            if ((not os.path.isfile(file_path)) or
+                (os.environ.get("FAKE_EXIFTOOL_FAILING_READS", "\0") in file_path)):
+                error_text += "Error: File not found - {}\n".format(file_path)
+                status = 1
+                continue
+            record = {
+                "SourceFile": file_path,
+                "System:FileName": os.path.basename(file_path)}
+            record.update(return_stored_tags(file_path))
+            if len(requested_tag_names) > 0:
+                record = dict(
+                    (full_tag_name, record[full_tag_name])
+                    for full_tag_name in record
+                    if (full_tag_name == "SourceFile") or
+                       (full_tag_name in requested_tag_names) or
+                       (full_tag_name.split(":")[-1] in requested_tag_names))
+            records.append(record)
+        if len(records) > 0:
+            output_text = json.dumps(records, indent=2) + "\n"
+    else:
+        number_of_updated_files = 0
+        for tag_name in list(written_values):
+            if not return_tag_is_defined(tag_name, config_file_path):
+                error_text += "Warning: Tag '{}' is not defined\n".format(
+                    tag_name)
+                del written_values[tag_name]
+        for file_path in file_paths:
+            if not os.path.isfile(file_path):
+                error_text += "Error: File not found - {}\n".format(file_path)
+                status = 1
+            elif os.environ.get("FAKE_EXIFTOOL_FAILING_WRITES", "\0") in file_path:
+                error_text += "Error: Not a valid JPG - {}\n".format(file_path)
+                status = 1
+            elif len(written_values) > 0:
+                stored_tags = return_stored_tags(file_path)
+                for tag_name in written_values:
+                    if len(written_values[tag_name]) == 1:
+                        stored_tags[tag_name] = written_values[tag_name][0]
+                    else:
+                        stored_tags[tag_name] = written_values[tag_name]
+                sidecar_file = open(return_sidecar_file_path(file_path), "w")
+                json.dump(stored_tags, sidecar_file)
+                sidecar_file.close()
+                modification_time = max(
+                    time.time_ns(), os.stat(file_path).st_mtime_ns + 1000)
+                os.utime(file_path, ns=(modification_time, modification_time))
+                number_of_updated_files += 1
+        if len(written_values) == 0:
+            error_text += "Nothing to do.\n"
+            status = 1
+        output_text = "    {} image files updated\n".format(
+            number_of_updated_files)
+
+    for echo_text in echo_texts:
+        error_text += echo_text.replace("${status}", str(status)) + "\n"
+
+    return output_text, error_text, status
+#
+###
+#
+def run_stay_open(config_file_path):
+    noise_length = int(os.environ.get("FAKE_EXIFTOOL_STDERR_BYTES", "0"))
+    command_arguments = []
+    for argument_line in sys.stdin:
+        argument = return_argument(argument_line.rstrip("\n"))
+        if argument.startswith("-execute"):
+            output_text, error_text, status = run_section(
+                return_expanded_arguments(command_arguments),
+                config_file_path, True)
+            if noise_length > 0:
+                noise_line = "Warning: fake noise\n"
+                sys.stderr.write(
+                    noise_line * (noise_length // len(noise_line) + 1))
+                sys.stderr.flush()
+            sys.stdout.write(output_text)
+            sys.stdout.write("{{ready{}}}\n".format(argument[8:]))
+            sys.stdout.flush()
+            sys.stderr.write(error_text)
+            sys.stderr.flush()
+            command_arguments = []
+        elif (argument == "False") and (command_arguments[-1:] == ["-stay_open"]):
+            return
+        else:
+            command_arguments.append(argument)
+#
+###
+#
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    config_file_path = None
+    if arguments[:1] == ["-config"]:
+        config_file_path = arguments[1]
+        arguments = arguments[2:]
+
+    if arguments[:4] == ["-stay_open", "True", "-@", "-"]:
+        run_stay_open(config_file_path)
+        sys.exit(0)
+
+    sections = [[]]
+    for argument in return_expanded_arguments(arguments):
+        if argument == "-execute":
+            sections.append([])
+        else:
+            sections[-1].append(argument)
+
+    status = 0
+    for section in sections:
+        output_text, error_text, status = run_section(
+            section, config_file_path, False)
+        sys.stdout.write(output_text)
+        sys.stderr.write(error_text)
+    sys.exit(status)
@@ -0,0 +1,47 @@
+#
+# Tests of the cached ExifTool arguments for a template's constant values.
+#
+def prepare_metadata(handler, template_id, site):
+    handler.prepare_metadata_from_template(
+        template_id, {"site": site}, "live",
+        handler.return_file_name_substitutions(
+            template_id, ["20221201075900-ncas-cam-3.jpg"])[0])
+#
+###
+#
+def test_constant_arguments_are_built_once_per_template(handler, template_id):
+    prepare_metadata(handler, template_id, "Chilbolton")
+    first_arguments = handler.return_cached_exiftool_embedding_arguments()
+    cached_arguments = handler.variables["exiftool_argument_cache"][template_id]
+    assert cached_arguments == ["-XMP-dc:Title=Camera image"]
+
+    prepare_metadata(handler, template_id, "Halley")
+    second_arguments = handler.return_cached_exiftool_embedding_arguments()
+    assert handler.variables["exiftool_argument_cache"][template_id] is cached_arguments
+    assert "-XMP-dc:Subject=Chilbolton" in first_arguments
+    assert "-XMP-dc:Source=ncas-cam-3" in first_arguments
+    assert "-XMP-dc:Subject=Halley" in second_arguments
+#
+###
+#
+def test_the_arguments_match_those_built_without_the_cache(handler, template_id):
+    prepare_metadata(handler, template_id, "Chilbolton")
+    assert sorted(handler.return_cached_exiftool_embedding_arguments()) == \
+        sorted(handler.return_exiftool_embedding_arguments())
+#
+###
+#
+def test_the_cache_is_cleared_when_an_option_is_set(handler, template_id):
+    prepare_metadata(handler, template_id, "Chilbolton")
+    assert handler.return_cached_exiftool_embedding_arguments() != []
+    handler.set_option("allow_tag_overwrites", False)
+    assert handler.variables["exiftool_argument_cache"] == {}
+#
+###
+#
+def test_the_cache_is_cleared_when_the_template_is_reloaded(handler, template_id):
+    prepare_metadata(handler, template_id, "Chilbolton")
+    assert handler.return_cached_exiftool_embedding_arguments() != []
+    assert handler.load_a_template(
+        handler.variables["templates"][template_id]["file_path"], True) == template_id
+    assert template_id not in handler.variables["exiftool_argument_cache"]
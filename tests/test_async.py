@@ -0,0 +1,48 @@
+#
+# Tests of AsyncHandler.
+#
+import asyncio
+
+import module_exiftool_python3
+#
+###
+#
+def test_extract_returns_the_metadata(fake_exiftool, handler, image_file_paths):
+    async_handler = module_exiftool_python3.AsyncHandler(handler)
+    extracted_metadata = asyncio.run(async_handler.extract(image_file_paths[0]))
+    assert extracted_metadata["SourceFile"] == image_file_paths[0]
+    assert async_handler.metadata["extracted"] == extracted_metadata
+#
+###
+#
+def test_concurrent_embeds_are_all_completed(fake_exiftool, handler, template_id, image_file_paths):
+    async_handler = module_exiftool_python3.AsyncHandler(
+        handler, maximum_number_of_concurrent_commands=2)
+
+    async def embed_all():
+        return await asyncio.gather(*[
+            async_handler.embed_from_template(
+                template_id, {"site": "Site {}".format(file_number)}, file_path)
+            for file_number, file_path in enumerate(image_file_paths)])
+
+    assert asyncio.run(embed_all()) == [0, 0, 0]
+    for file_number, file_path in enumerate(image_file_paths):
+        assert fake_exiftool.return_stored_tags(file_path)["XMP-dc:Subject"] == \
+            ["cloud", "Site {}".format(file_number)]
+#
+###
+#
+def test_embed_from_input_reports_a_failed_write(fake_exiftool, handler, image_file_paths):
+    fake_exiftool.set_failing_writes("075900")
+    async_handler = module_exiftool_python3.AsyncHandler(handler)
+    result = asyncio.run(async_handler.embed_from_input(
+        {"XMP-dc:Title": "Title"}, image_file_paths[0], should_return_result=True))
+    assert result.status == "failed"
+    assert result.error_code == "exiftool_failed"
+#
+###
+#
+def test_other_attributes_are_those_of_the_handler(handler):
+    async_handler = module_exiftool_python3.AsyncHandler(handler)
+    async_handler.set_option("allow_tag_overwrites", False)
+    assert handler.options["allow_tag_overwrites"]["value"] == False
@@ -0,0 +1,69 @@
+#
+# Tests of Handler.embed_many_from_template.
+#
+def test_files_with_the_same_metadata_share_one_section(fake_exiftool, handler, template_id, image_file_paths):
+    exit_codes = handler.embed_many_from_template(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths])
+    assert exit_codes == [0, 0, 0]
+
+    write_sections = fake_exiftool.return_write_sections()
+    assert len(write_sections) == 1
+    for file_path in image_file_paths:
+        assert file_path in write_sections[0]["arguments"]
+        assert fake_exiftool.return_stored_tags(file_path)["XMP-dc:Title"] == "Camera image"
+#
+###
+#
+def test_files_with_different_metadata_are_written_in_separate_sections(fake_exiftool, handler, template_id, image_file_paths):
+    exit_codes = handler.embed_many_from_template(template_id, [
+        (image_file_paths[0], {"site": "Chilbolton"}),
+        (image_file_paths[1], {"site": "Chilbolton"}),
+        (image_file_paths[2], {"site": "Halley"})])
+    assert exit_codes == [0, 0, 0]
+    assert len(fake_exiftool.return_write_sections()) == 2
+    assert fake_exiftool.return_stored_tags(image_file_paths[2])["XMP-dc:Subject"] == \
+        ["cloud", "Halley"]
+#
+###
+#
+def test_a_failing_file_does_not_fail_the_rest_of_its_group(fake_exiftool, handler, template_id, image_file_paths):
+    fake_exiftool.set_failing_writes("075901")
+    exit_codes = handler.embed_many_from_template(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths])
+    assert exit_codes == [0, 1, 0]
+    assert fake_exiftool.return_stored_tags(image_file_paths[1]) == {}
+    assert fake_exiftool.return_stored_tags(image_file_paths[2])["XMP-dc:Title"] == "Camera image"
+#
+###
+#
+def test_existing_tags_are_checked_in_one_extraction(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("allow_tag_overwrites", False)
+    fake_exiftool.store_tags(image_file_paths[1], {"XMP-dc:Title": "Old title"})
+    exit_codes = handler.embed_many_from_template(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths])
+    assert exit_codes == [0, 1, 0]
+    assert len(fake_exiftool.return_read_sections()) == 1
+    assert fake_exiftool.return_stored_tags(image_file_paths[1]) == {"XMP-dc:Title": "Old title"}
+#
+###
+#
+def test_overwrites_are_still_checked_when_allowed_but_not_writing_blindly(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("allow_tag_overwrites", True)
+    handler.set_option("blind_write", False)
+    fake_exiftool.store_tags(image_file_paths[1], {"XMP-dc:Title": "Old title"})
+    results = handler.embed_many_from_template(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths],
+        should_return_results=True)
+    assert [result.status for result in results] == ["embedded"] * 3
+    assert results[1].overwritten_tags == ("XMP-dc:Title",)
+    assert len(fake_exiftool.return_read_sections()) == 1
+#
+###
+#
+def test_writing_blindly_skips_the_overwrite_check(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("allow_tag_overwrites", True)
+    handler.set_option("blind_write", True)
+    exit_codes = handler.embed_many_from_template(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths])
+    assert exit_codes == [0, 0, 0]
+    assert fake_exiftool.return_read_sections() == []
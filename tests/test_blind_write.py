@@ -0,0 +1,37 @@
+#
+# Tests of the "blind_write" option.
+#
+import os
+#
+###
+#
+def test_writing_blindly_does_not_extract(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("allow_tag_overwrites", True)
+    handler.set_option("blind_write", True)
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0]) == 0
+    assert fake_exiftool.return_read_sections() == []
+    assert fake_exiftool.return_stored_tags(image_file_paths[0])["XMP-dc:Title"] == \
+        "Camera image"
+#
+###
+#
+def test_the_file_must_still_exist(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("allow_tag_overwrites", True)
+    handler.set_option("blind_write", True)
+    missing_file_path = os.path.join(
+        os.path.dirname(image_file_paths[0]), "missing.jpg")
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, missing_file_path) == 1
+    assert fake_exiftool.return_logged_sections() == []
+#
+###
+#
+def test_blind_writing_needs_overwrites_to_be_allowed(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("allow_tag_overwrites", False)
+    handler.set_option("blind_write", True)
+    assert not handler.should_write_blindly()
+    fake_exiftool.store_tags(image_file_paths[0], {"XMP-dc:Title": "Old title"})
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0]) == 1
+    assert len(fake_exiftool.return_read_sections()) == 1
@@ -0,0 +1,41 @@
+#
+# Tests of compiled templates.
+#
+from conftest import write_template
+#
+###
+#
+def test_constant_values_are_rendered_when_the_template_is_loaded(handler, template_id):
+    template_details = handler.variables["templates"][template_id]
+    assert template_details["compiled_constant_metadata"] == {"XMP-dc:Title": "Camera image"}
+    assert sorted(
+        dynamic_entry[1] for dynamic_entry in template_details["compiled_dynamic_entries"]) == \
+        ["XMP-dc:Source", "XMP-dc:Subject"]
+#
+###
+#
+def test_only_the_dynamic_fields_are_evaluated_for_each_file(handler, tmp_path):
+    template_id = handler.load_a_template(write_template(tmp_path, "times.yaml", [
+        "- template_id: times",
+        "- XMP-dc:Title: \"Image from {site}\"",
+        "- XMP-dc:Subject: [\"cloud\", \"{site}\", \"{{literal}}\"]",
+        "- XMP-dc:Rights: \"Copyright {__utcnow__:%Y}\"",
+        "- XMP-dc:Source: \"{__instrument__}\""]))
+    file_substitutions = handler.return_file_name_substitutions(
+        template_id, ["20221201075900-ncas-cam-3.jpg"])[0]
+
+    for site in ["Chilbolton", "Halley"]:
+        handler.prepare_metadata_from_template(
+            template_id, {"site": site}, "live", file_substitutions)
+        assert handler.metadata["prepared"]["XMP-dc:Title"] == "Image from " + site
+        assert handler.metadata["prepared"]["XMP-dc:Subject"] == ["cloud", site, "{literal}"]
+        assert handler.metadata["prepared"]["XMP-dc:Source"] == "ncas-cam-3"
+        assert handler.metadata["prepared"]["XMP-dc:Rights"] == "Copyright {:%Y}".format(
+            handler.variables["metadata_datetime"]["prepared"])
+#
+###
+#
+def test_a_missing_substitution_is_still_reported(handler, template_id):
+    handler.prepare_metadata_from_template(template_id, {}, "live")
+    assert handler.metadata["prepared"] == {}
+    assert not handler.variables["no_general_error_has_been_registered"]
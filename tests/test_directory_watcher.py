@@ -0,0 +1,104 @@
+#
+# Tests of DirectoryWatcher.
+#
+import os, shutil, threading, time
+
+import module_exiftool_python3
+#
+###
+#
+def return_watcher(handler, template_id, image_file_paths):
+    return module_exiftool_python3.DirectoryWatcher(
+        handler, template_id, os.path.dirname(image_file_paths[0]),
+        substitutions={"site": "Chilbolton"}, polling_interval=0.05)
+#
+###
+#
+def test_existing_files_are_tagged_and_the_option_is_restored(fake_exiftool, handler, template_id, image_file_paths):
+    for file_path in image_file_paths:
+        os.utime(file_path, (time.time() - 60.0, time.time() - 60.0))
+    watcher = return_watcher(handler, template_id, image_file_paths)
+    assert handler.options["persistent_exiftool"]["value"] == False
+
+    latency_statistics = watcher.run(
+        maximum_duration=0.2, should_tag_existing_files=True,
+        should_use_inotify=False)
+    assert latency_statistics["number_of_files_tagged"] == 3
+    for file_path in image_file_paths:
+        assert fake_exiftool.return_stored_tags(file_path)["XMP-dc:Subject"] == \
+            ["cloud", "Chilbolton"]
+    assert all(logged_section["stay_open"]
+               for logged_section in fake_exiftool.return_write_sections())
+    assert handler.options["persistent_exiftool"]["value"] == False
+#
+###
+#
+def test_a_tagged_state_is_forgotten_once_it_has_been_seen(fake_exiftool, handler, template_id, image_file_paths):
+    watcher = return_watcher(handler, template_id, image_file_paths)
+    watcher.tag_file(image_file_paths[0], True)
+    assert list(watcher.tagged_file_states) == [image_file_paths[0]]
+    assert watcher.known_file_states == {}
+
+    watcher.tag_file(image_file_paths[0], True)
+    assert watcher.number_of_files_tagged == 1
+    assert watcher.tagged_file_states == {}
+#
+###
+#
+def test_polling_forgets_tagged_states_and_files_that_leave_the_tree(fake_exiftool, handler, template_id, image_file_paths):
+    watcher = return_watcher(handler, template_id, image_file_paths)
+    watcher.scan_tree(False)
+    assert sorted(watcher.known_file_states) == image_file_paths
+
+    new_file_path = os.path.join(
+        os.path.dirname(image_file_paths[0]), "20221201075903-ncas-cam-3.jpg")
+    shutil.copyfile(image_file_paths[0], new_file_path)
+    os.utime(new_file_path, (time.time() - 60.0, time.time() - 60.0))
+    watcher.scan_tree()
+    assert watcher.number_of_files_tagged == 1
+    assert watcher.tagged_file_states == {}
+    assert watcher.known_file_states[new_file_path] == \
+        watcher.return_file_state(new_file_path)
+
+    watcher.scan_tree()
+    assert watcher.number_of_files_tagged == 1
+
+    os.remove(image_file_paths[1])
+    watcher.scan_tree()
+    assert image_file_paths[1] not in watcher.known_file_states
+    assert len(watcher.known_file_states) == 3
+#
+###
+#
+def test_inotify_forgets_files_that_leave_the_tree(fake_exiftool, handler, template_id, image_file_paths):
+    watcher = return_watcher(handler, template_id, image_file_paths)
+    if watcher.return_inotify_library() is None:
+        return
+    new_file_path = os.path.join(
+        os.path.dirname(image_file_paths[0]), "20221201075903-ncas-cam-3.jpg")
+
+    def write_and_remove_a_file():
+        time.sleep(0.3)
+        shutil.copyfile(image_file_paths[0], new_file_path)
+        time.sleep(0.6)
+        os.remove(new_file_path)
+
+    writing_thread = threading.Thread(target=write_and_remove_a_file)
+    writing_thread.start()
+    latency_statistics = watcher.run(maximum_duration=1.5)
+    writing_thread.join()
+
+    assert latency_statistics["number_of_files_tagged"] == 1
+    assert watcher.tagged_file_states == {}
+    assert watcher.deferred_files == {}
+#
+###
+#
+def test_forgetting_a_directory_forgets_the_files_under_it(handler, template_id, image_file_paths):
+    watcher = return_watcher(handler, template_id, image_file_paths)
+    directory_path = os.path.dirname(image_file_paths[0])
+    other_file_path = directory_path + "-other.jpg"
+    for file_path in image_file_paths + [other_file_path]:
+        watcher.tagged_file_states[file_path] = (0, 1)
+    watcher.forget_files(directory_path, True)
+    assert list(watcher.tagged_file_states) == [other_file_path]
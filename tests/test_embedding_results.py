@@ -0,0 +1,77 @@
+#
+# Tests of the EmbeddingResult records of the batch and asynchronous
+# embedding methods.
+#
+import asyncio
+
+import module_exiftool_python3
+#
+###
+#
+def return_files_and_substitutions(image_file_paths):
+    return [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths]
+#
+###
+#
+def test_results_give_the_tags_written_and_overwritten(fake_exiftool, handler, template_id, image_file_paths):
+    fake_exiftool.store_tags(image_file_paths[0], {"XMP-dc:Title": "Old title"})
+    results = handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths),
+        should_return_results=True)
+    assert [result.status for result in results] == ["embedded"] * 3
+    assert [result.exit_code for result in results] == [0, 0, 0]
+    assert results[0].overwritten_tags == ("XMP-dc:Title",)
+    assert results[1].overwritten_tags == ()
+    assert "XMP-dc:Subject" in results[1].tags_written
+    assert all(result.write_seconds > 0.0 for result in results)
+#
+###
+#
+def test_a_file_whose_metadata_cannot_be_extracted_has_its_own_error_code(fake_exiftool, handler, template_id, image_file_paths):
+    fake_exiftool.set_failing_reads("075901")
+    results = handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths),
+        should_return_results=True)
+    assert [result.status for result in results] == ["embedded", "failed", "embedded"]
+    assert results[1].error_code == "extraction_failed"
+    assert results[1].overwritten_tags is None
+    assert results[1].tags_written == ()
+    assert results[1].exit_code == 1
+    assert fake_exiftool.return_stored_tags(image_file_paths[1]) == {}
+#
+###
+#
+def test_the_async_embed_reports_a_failed_extraction(fake_exiftool, handler, template_id, image_file_paths):
+    fake_exiftool.set_failing_reads("075900")
+    async_handler = module_exiftool_python3.AsyncHandler(handler)
+    result = asyncio.run(async_handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0],
+        should_return_result=True))
+    assert result.status == "failed"
+    assert result.error_code == "extraction_failed"
+    assert result.overwritten_tags is None
+#
+###
+#
+def test_files_written_blindly_are_not_checked_for_overwrites(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("blind_write", True)
+    results = handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths),
+        should_return_results=True)
+    assert [result.overwritten_tags for result in results] == [None] * 3
+    assert fake_exiftool.return_read_sections() == []
+#
+###
+#
+def test_results_are_summarised_by_status_error_code_and_stage(fake_exiftool, handler, template_id, image_file_paths):
+    fake_exiftool.set_failing_writes("075902")
+    results = handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths),
+        should_return_results=True)
+    results_summary = handler.return_embedding_results_summary(results)
+    assert results_summary["number_of_files"] == 3
+    assert results_summary["number_of_files_for_status"] == \
+        {"embedded": 2, "skipped": 0, "failed": 1}
+    assert results_summary["number_of_files_for_error_code"] == {"exiftool_failed": 1}
+    assert results_summary["total_seconds_for_stage"]["write"] == \
+        sum(result.write_seconds for result in results)
@@ -0,0 +1,53 @@
+#
+# Tests of Handler.extract_many.
+#
+import os
+#
+###
+#
+def test_metadata_are_yielded_in_the_order_of_the_paths(fake_exiftool, handler, image_file_paths):
+    fake_exiftool.store_tags(image_file_paths[2], {"XMP-dc:Title": "Third"})
+    source_file_paths = list(reversed(image_file_paths))
+    extracted_pairs = list(handler.extract_many(source_file_paths))
+    assert [source_file_path for source_file_path, metadata in extracted_pairs] == \
+        source_file_paths
+    assert extracted_pairs[0][1]["XMP-dc:Title"] == "Third"
+    assert extracted_pairs[1][1]["SourceFile"] == image_file_paths[1]
+    assert len(fake_exiftool.return_read_sections()) == 1
+#
+###
+#
+def test_an_invalid_file_yields_empty_metadata(fake_exiftool, handler, image_file_paths):
+    missing_file_path = os.path.join(
+        os.path.dirname(image_file_paths[0]), "missing.jpg")
+    extracted_pairs = list(handler.extract_many(
+        [image_file_paths[0], missing_file_path, image_file_paths[1]]))
+    assert extracted_pairs[1] == (missing_file_path, {})
+    assert extracted_pairs[0][1]["SourceFile"] == image_file_paths[0]
+    assert extracted_pairs[2][1]["SourceFile"] == image_file_paths[1]
+#
+###
+#
+def test_a_file_that_exiftool_cannot_read_yields_empty_metadata(fake_exiftool, handler, image_file_paths):
+    fake_exiftool.set_failing_reads("075901")
+    extracted_pairs = list(handler.extract_many(image_file_paths))
+    assert extracted_pairs[1] == (image_file_paths[1], {})
+    assert extracted_pairs[2][1]["SourceFile"] == image_file_paths[2]
+#
+###
+#
+def test_paths_are_split_between_commands(fake_exiftool, handler, image_file_paths):
+    handler.variables["maximum_number_of_paths_per_extraction"] = 2
+    extracted_pairs = list(handler.extract_many(image_file_paths))
+    assert len(extracted_pairs) == 3
+    assert len(fake_exiftool.return_read_sections()) == 2
+#
+###
+#
+def test_only_the_requested_tags_are_extracted(fake_exiftool, handler, image_file_paths):
+    fake_exiftool.store_tags(
+        image_file_paths[0], {"XMP-dc:Title": "Title", "XMP-dc:Source": "Source"})
+    extracted_pairs = list(handler.extract_many(
+        image_file_paths[:1], ["XMP-dc:Title"]))
+    assert "XMP-dc:Title" in extracted_pairs[0][1]
+    assert "XMP-dc:Source" not in extracted_pairs[0][1]
@@ -0,0 +1,55 @@
+#
+# Tests of the "extraction_profile" and "fast_scan_level" options.
+#
+def test_the_full_profile_extracts_every_tag(handler):
+    exiftool_arguments = handler.return_exiftool_extraction_arguments(
+        "image.jpg", "full", ["XMP-dc:Title"])
+    assert "-XMP-dc:Title" not in exiftool_arguments
+    assert "-fast" not in exiftool_arguments
+    assert exiftool_arguments[-1] == "image.jpg"
+#
+###
+#
+def test_the_template_only_profile_extracts_the_named_tags(handler):
+    exiftool_arguments = handler.return_exiftool_extraction_arguments(
+        "image.jpg", "template_only", ["XMP-dc:Title", "UNKNOWN:XMP-ncas:Site"])
+    assert sorted(exiftool_arguments[-3:-1]) == ["-XMP-dc:Title", "-XMP-ncas:Site"]
+    assert exiftool_arguments[-1] == "image.jpg"
+    assert "-fast" not in exiftool_arguments
+#
+###
+#
+def test_the_fast_profile_adds_the_scan_level(handler):
+    exiftool_arguments = handler.return_exiftool_extraction_arguments(
+        "image.jpg", "fast", ["XMP-dc:Title"])
+    assert "-fast" in exiftool_arguments
+    handler.set_option("fast_scan_level", 2)
+    exiftool_arguments = handler.return_exiftool_extraction_arguments(
+        "image.jpg", "fast", ["XMP-dc:Title"])
+    assert "-fast2" in exiftool_arguments
+#
+###
+#
+def test_the_overwrite_check_asks_only_for_the_prepared_tags(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("extraction_profile", "template_only")
+    handler.set_option("allow_tag_overwrites", False)
+    fake_exiftool.store_tags(image_file_paths[0], {"XMP-dc:Creator": "Someone"})
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0]) == 0
+
+    read_arguments = fake_exiftool.return_read_sections()[0]["arguments"]
+    assert "-XMP-dc:Title" in read_arguments
+    assert "-XMP-dc:Creator" not in read_arguments
+#
+###
+#
+def test_the_batch_overwrite_check_asks_only_for_the_prepared_tags(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("extraction_profile", "template_only")
+    handler.set_option("allow_tag_overwrites", False)
+    exit_codes = handler.embed_many_from_template(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths])
+    assert exit_codes == [0, 0, 0]
+
+    read_sections = fake_exiftool.return_read_sections()
+    assert len(read_sections) == 1
+    assert "-XMP-dc:Title" in read_sections[0]["arguments"]
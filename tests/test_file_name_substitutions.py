@@ -0,0 +1,90 @@
+#
+# Tests of the substitutions taken from file names.
+#
+import datetime, os
+
+import pytest
+
+from conftest import write_template
+#
+###
+#
+@pytest.fixture
+def capture_time_template_id(handler, tmp_path):
+    return handler.load_a_template(write_template(tmp_path, "capture_time_template.yaml", [
+        "- template_id: capturetime",
+        "- XMP-dc:Source: \"{__instrument__}\"",
+        "- XMP-xmp:CreateDate: \"{__capturetimestr__}\""]))
+#
+###
+#
+def test_the_default_pattern_provides_the_capture_time_and_instrument(handler, capture_time_template_id):
+    file_name_substitutions = handler.return_file_name_substitutions(
+        capture_time_template_id,
+        ["/images/20221201075900-ncas-cam-3.jpg", "/images/unnamed.jpg",
+         "/images/20221399075900-ncas-cam-3.jpg", None])
+    assert file_name_substitutions[0]["__instrument__"] == "ncas-cam-3"
+    assert file_name_substitutions[0]["__capturetime__"] == \
+        datetime.datetime(2022, 12, 1, 7, 59, 0)
+    assert file_name_substitutions[0]["__capturetimestr__"] == \
+        handler.return_datetime_string(datetime.datetime(2022, 12, 1, 7, 59, 0))
+    assert file_name_substitutions[1] == {}
+    assert file_name_substitutions[2] == {"__instrument__": "ncas-cam-3"}
+    assert file_name_substitutions[3] == {}
+#
+###
+#
+def test_only_the_keys_used_by_the_template_are_provided(handler, template_id):
+    assert handler.return_file_name_substitutions(
+        template_id, ["20221201075900-ncas-cam-3.jpg"]) == \
+        [{"__instrument__": "ncas-cam-3"}]
+#
+###
+#
+def test_a_batch_is_stamped_with_the_capture_time_of_each_file(fake_exiftool, handler, capture_time_template_id, image_file_paths):
+    exit_codes = handler.embed_many_from_template(
+        capture_time_template_id, [(file_path, {}) for file_path in image_file_paths])
+    assert exit_codes == [0, 0, 0]
+    for file_number, file_path in enumerate(image_file_paths):
+        stored_tags = fake_exiftool.return_stored_tags(file_path)
+        assert stored_tags["XMP-dc:Source"] == "ncas-cam-3"
+        assert stored_tags["XMP-xmp:CreateDate"] == handler.return_datetime_string(
+            datetime.datetime(2022, 12, 1, 7, 59, file_number))
+#
+###
+#
+def test_a_custom_pattern_and_format(handler, tmp_path):
+    assert handler.set_file_name_pattern(
+        r"^(?P<site>[a-z]+)_(?P<capturetime>\d{8}T\d{4})\.jpg$",
+        "%Y%m%dT%H%M") == 0
+    custom_template_id = handler.load_a_template(write_template(tmp_path, "custom_template.yaml", [
+        "- template_id: custom",
+        "- XMP-dc:Source: \"{__site__}\"",
+        "- XMP-xmp:CreateDate: \"{__capturetimestr__}\""]))
+    assert handler.return_file_name_substitutions(
+        custom_template_id, ["chilbolton_20221201T0759.jpg"]) == [{
+            "__site__": "chilbolton",
+            "__capturetime__": datetime.datetime(2022, 12, 1, 7, 59),
+            "__capturetimestr__": handler.return_datetime_string(
+                datetime.datetime(2022, 12, 1, 7, 59))}]
+#
+###
+#
+def test_a_format_that_cannot_be_sliced_is_parsed_with_strptime(handler, tmp_path):
+    assert handler.set_file_name_pattern(
+        r"^(?P<capturetime>\d{7})\.jpg$", "%Y%j") == 0
+    assert handler.variables["capture_time_slices"] is None
+    day_template_id = handler.load_a_template(write_template(tmp_path, "day_template.yaml", [
+        "- template_id: day",
+        "- XMP-xmp:CreateDate: \"{__capturetimestr__}\""]))
+    assert handler.return_file_name_substitutions(
+        day_template_id, [os.path.join("images", "2022335.jpg")])[0]["__capturetime__"] == \
+        datetime.datetime(2022, 12, 1)
+#
+###
+#
+def test_invalid_patterns_are_rejected(handler):
+    assert handler.set_file_name_pattern("(?P<capturetime>") == 1
+    assert handler.set_file_name_pattern(r"^\d+\.jpg$") == 1
+    assert handler.set_file_name_pattern(r"^(?P<utcnow>\d+)\.jpg$") == 1
+    assert "__instrument__" in handler.variables["file_substitution_keys"]
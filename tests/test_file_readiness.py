@@ -0,0 +1,95 @@
+#
+# Tests of the file readiness check.
+#
+import os, time
+
+from conftest import write_template
+#
+###
+#
+def write_partial_jpeg(file_path, source_file_path):
+    source_file = open(source_file_path, "rb")
+    content = source_file.read()
+    source_file.close()
+    partial_file = open(file_path, "wb")
+    partial_file.write(content[:len(content) // 2])
+    partial_file.close()
+#
+###
+#
+def test_a_file_is_ready_once_complete_and_closed_or_stable(handler, image_file_paths):
+    os.utime(image_file_paths[0], (time.time() - 60.0, time.time() - 60.0))
+    assert handler.return_file_readiness(image_file_paths[0])
+
+    os.utime(image_file_paths[1], None)
+    assert not handler.return_file_readiness(image_file_paths[1])
+    assert handler.return_file_readiness(image_file_paths[1], True)
+#
+###
+#
+def test_empty_and_truncated_jpegs_are_not_ready(handler, image_file_paths):
+    directory_path = os.path.dirname(image_file_paths[0])
+    empty_file_path = os.path.join(directory_path, "empty.jpg")
+    open(empty_file_path, "wb").close()
+    assert not handler.return_file_readiness(empty_file_path, True)
+
+    partial_file_path = os.path.join(directory_path, "partial.jpg")
+    write_partial_jpeg(partial_file_path, image_file_paths[0])
+    assert not handler.return_file_readiness(partial_file_path, True)
+
+    assert handler.return_file_readiness(os.path.join(directory_path, "missing.jpg"))
+#
+###
+#
+def test_paths_that_are_not_strings_are_left_to_the_file_path_checks(fake_exiftool, handler, image_file_paths, tmp_path):
+    empty_file_path = os.path.join(os.path.dirname(image_file_paths[0]), "empty.jpg")
+    empty_file = open(empty_file_path, "wb")
+    try:
+        assert handler.return_file_readiness(empty_file.fileno())
+    finally:
+        empty_file.close()
+    assert handler.return_file_readiness(["20221201075900-ncas-cam-3.jpg"])
+
+    handler.set_option("check_file_readiness", True)
+    for file_path in image_file_paths:
+        os.utime(file_path, (time.time() - 60.0, time.time() - 60.0))
+    title_template_id = handler.load_a_template(write_template(tmp_path, "title_template.yaml", [
+        "- template_id: title",
+        "- XMP-dc:Title: \"Camera image\""]))
+    results = handler.embed_many_from_template(
+        title_template_id,
+        [(image_file_paths[0], {}), (["20221201075900-ncas-cam-3.jpg"], {})],
+        should_return_results=True)
+    assert [result.error_code for result in results] == ["", "invalid_file_path"]
+#
+###
+#
+def test_extract_does_not_run_exiftool_for_a_file_that_is_not_ready(fake_exiftool, handler, image_file_paths):
+    handler.set_option("check_file_readiness", True)
+    handler.variables["file_readiness_maximum_wait"] = 0.2
+    partial_file_path = os.path.join(
+        os.path.dirname(image_file_paths[0]), "partial.jpg")
+    write_partial_jpeg(partial_file_path, image_file_paths[0])
+
+    handler.extract(partial_file_path)
+    assert handler.metadata["extracted"] == {}
+    assert fake_exiftool.return_logged_sections() == []
+#
+###
+#
+def test_the_batch_embed_fails_only_the_file_that_is_not_ready(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("check_file_readiness", True)
+    handler.variables["file_readiness_maximum_wait"] = 0.2
+    for file_path in image_file_paths:
+        os.utime(file_path, (time.time() - 60.0, time.time() - 60.0))
+    write_partial_jpeg(image_file_paths[1], image_file_paths[0])
+
+    results = handler.embed_many_from_template(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths],
+        should_return_results=True)
+    assert [result.status for result in results] == ["embedded", "failed", "embedded"]
+    assert results[1].error_code == "file_not_ready"
+    logged_file_paths = [
+        argument for logged_section in fake_exiftool.return_logged_sections()
+        for argument in logged_section["arguments"]]
+    assert image_file_paths[1] not in logged_file_paths
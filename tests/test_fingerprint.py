@@ -0,0 +1,93 @@
+#
+# Tests of the embedded metadata fingerprint.
+#
+fingerprint_tag_name = "XMP-exiftoolhandler:Fingerprint"
+#
+###
+#
+def test_the_fingerprint_has_its_own_tag(handler, template_id, image_file_paths):
+    handler.set_option("embed_fingerprint", True)
+    assert handler.variables["fingerprint_tag_name"] == fingerprint_tag_name
+    handler.prepare_metadata_from_template(
+        template_id, {"site": "Chilbolton"},
+        file_substitutions=handler.return_file_name_substitutions(
+            template_id, image_file_paths[:1])[0])
+    assert handler.metadata["prepared"][fingerprint_tag_name].startswith(
+        handler.variables["fingerprint_prefix"])
+    assert "XMP-xmpMM:InstanceID" not in handler.metadata["prepared"]
+    assert fingerprint_tag_name in handler.variables["tag_supports_multiple_values"]
+#
+###
+#
+def test_exiftool_is_given_the_configuration_of_the_namespace(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("embed_fingerprint", True)
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0]) == 0
+    assert fingerprint_tag_name in fake_exiftool.return_stored_tags(image_file_paths[0])
+    assert all(
+        logged_section["config_file_path"] == handler.variables["exiftool_config_file_path"]
+        for logged_section in fake_exiftool.return_logged_sections())
+
+    handler.set_option("embed_fingerprint", False)
+    fake_exiftool.clear_log()
+    handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[1])
+    assert all(
+        logged_section["config_file_path"] is None
+        for logged_section in fake_exiftool.return_logged_sections())
+#
+###
+#
+def test_the_persistent_process_is_restarted_with_the_configuration(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("persistent_exiftool", True)
+    handler.extract(image_file_paths[0])
+    handler.set_option("embed_fingerprint", True)
+    assert handler.variables["exiftool_process"] is None
+
+    handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0])
+    write_sections = fake_exiftool.return_write_sections()
+    assert write_sections[-1]["stay_open"]
+    assert write_sections[-1]["config_file_path"] == \
+        handler.variables["exiftool_config_file_path"]
+#
+###
+#
+# The fake ExifTool keeps written tags beside the image, where the native
+# JPEG reader, which reads the embedded fingerprints, cannot see them, so the
+# files are tagged with the native writer.
+#
+def test_fingerprinted_files_are_skipped(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("embed_fingerprint", True)
+    handler.set_option("xmp_writer", "native")
+    files_and_substitutions = [
+        (file_path, {"site": "Chilbolton"}) for file_path in image_file_paths]
+    handler.embed_many_from_template(template_id, files_and_substitutions)
+
+    fake_exiftool.clear_log()
+    results = handler.embed_many_from_template(
+        template_id, files_and_substitutions, should_return_results=True)
+    assert [result.status for result in results] == ["skipped"] * 3
+    assert fake_exiftool.return_logged_sections() == []
+
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0]) == 0
+    assert fake_exiftool.return_logged_sections() == []
+#
+###
+#
+def test_the_native_writer_and_reader_use_the_custom_namespace(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("embed_fingerprint", True)
+    handler.set_option("xmp_writer", "native")
+    handler.set_option("native_jpeg_reader", True)
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0]) == 0
+    assert fake_exiftool.return_write_sections() == []
+    natively_read_metadata = handler.return_natively_read_metadata(image_file_paths[0])
+    assert natively_read_metadata[fingerprint_tag_name].startswith(
+        handler.variables["fingerprint_prefix"])
+
+    fake_exiftool.clear_log()
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0]) == 0
+    assert fake_exiftool.return_logged_sections() == []
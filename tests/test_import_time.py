@@ -0,0 +1,35 @@
+#
+# Tests of the lazy imports of the handler module.
+#
+import subprocess, sys
+
+import module_exiftool_benchmarks
+from conftest import repository_directory_path, write_template
+#
+###
+#
+# The import time itself depends on the load of the machine, so it is
+# checked against its budget only by "module_exiftool_benchmarks.py
+# import_time".
+#
+def test_lazily_imported_modules_are_not_imported_at_start_up():
+    best_milliseconds, unexpectedly_imported_module_names = \
+        module_exiftool_benchmarks.return_import_time_measurement(0)
+    assert unexpectedly_imported_module_names == []
+#
+###
+#
+def test_a_parsed_template_is_loaded_without_yaml(tmp_path):
+    template_file_path = write_template(tmp_path, "template.yaml", [
+        "- template_id: parsed",
+        "- XMP-dc:Title: \"Camera image\""])
+    loading_code = "; ".join([
+        "import sys, module_exiftool_python3",
+        "handler = module_exiftool_python3.Handler()",
+        "print(handler.load_a_template({!r}, False, [{{'template_id': 'parsed'}}, {{'XMP-dc:Title': 'Camera image'}}]))".format(
+            template_file_path),
+        "print('yaml' in sys.modules)"])
+    loading_lines = subprocess.check_output(
+        [sys.executable, "-c", loading_code],
+        cwd=repository_directory_path).decode("utf8").splitlines()
+    assert loading_lines == ["parsed", "False"]
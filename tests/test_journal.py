@@ -0,0 +1,108 @@
+#
+# Tests of the SQLite journal of embedded files.
+#
+import asyncio, os, time
+
+import module_exiftool_python3
+#
+###
+#
+def return_files_and_substitutions(image_file_paths, site="Chilbolton"):
+    return [(file_path, {"site": site}) for file_path in image_file_paths]
+#
+###
+#
+def test_a_repeated_batch_is_skipped_without_running_exiftool(fake_exiftool, handler, template_id, image_file_paths, tmp_path):
+    assert handler.open_journal(str(tmp_path / "journal.sqlite")) == 0
+    assert handler.variables["journal"].execute(
+        "PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    results = handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths),
+        should_return_results=True)
+    assert [result.status for result in results] == ["embedded"] * 3
+
+    fake_exiftool.clear_log()
+    results = handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths),
+        should_return_results=True)
+    assert [result.status for result in results] == ["skipped"] * 3
+    assert fake_exiftool.return_logged_sections() == []
+#
+###
+#
+def test_the_journal_survives_the_handler(fake_exiftool, handler, template_id, image_file_paths, tmp_path):
+    journal_file_path = str(tmp_path / "journal.sqlite")
+    handler.open_journal(journal_file_path)
+    handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths))
+    handler.close_journal()
+
+    fake_exiftool.clear_log()
+    handler.open_journal(journal_file_path)
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0]) == 0
+    assert fake_exiftool.return_logged_sections() == []
+#
+###
+#
+def test_changed_files_and_metadata_are_tagged_again(fake_exiftool, handler, template_id, image_file_paths, tmp_path):
+    handler.open_journal(str(tmp_path / "journal.sqlite"))
+    handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths))
+
+    os.utime(image_file_paths[0], (time.time() + 10.0, time.time() + 10.0))
+    results = handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths),
+        should_return_results=True)
+    assert [result.status for result in results] == ["embedded", "skipped", "skipped"]
+
+    results = handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths, "Cardington"),
+        should_return_results=True)
+    assert [result.status for result in results] == ["embedded"] * 3
+#
+###
+#
+def test_journal_lookups_are_batched(fake_exiftool, handler, template_id, image_file_paths, tmp_path):
+    handler.open_journal(str(tmp_path / "journal.sqlite"))
+    handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths))
+
+    handler.variables["maximum_number_of_paths_per_journal_lookup"] = 2
+    recorded_journal_entries = handler.return_recorded_journal_entries(
+        image_file_paths + [image_file_paths[0] + ".missing"])
+    assert sorted(recorded_journal_entries) == image_file_paths
+    assert recorded_journal_entries[image_file_paths[0]][4] == template_id
+#
+###
+#
+def test_failed_files_are_not_recorded(fake_exiftool, handler, template_id, image_file_paths, tmp_path):
+    fake_exiftool.set_failing_writes("075901")
+    handler.open_journal(str(tmp_path / "journal.sqlite"))
+    handler.embed_many_from_template(
+        template_id, return_files_and_substitutions(image_file_paths))
+    assert sorted(handler.return_recorded_journal_entries(image_file_paths)) == \
+        [image_file_paths[0], image_file_paths[2]]
+#
+###
+#
+def test_async_embeds_are_recorded_and_skipped(fake_exiftool, handler, template_id, image_file_paths, tmp_path):
+    handler.open_journal(str(tmp_path / "journal.sqlite"))
+    async_handler = module_exiftool_python3.AsyncHandler(handler)
+    result = asyncio.run(async_handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0],
+        should_return_result=True))
+    assert result.status == "embedded"
+    assert sorted(handler.return_recorded_journal_entries(image_file_paths)) == \
+        [image_file_paths[0]]
+
+    fake_exiftool.clear_log()
+    result = asyncio.run(async_handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0],
+        should_return_result=True))
+    assert result.status == "skipped"
+    assert fake_exiftool.return_logged_sections() == []
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0]) == 0
+    assert fake_exiftool.return_logged_sections() == []
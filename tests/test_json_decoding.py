@@ -0,0 +1,44 @@
+#
+# Tests of the decoding of ExifTool's JSON output.
+#
+import yaml
+
+exiftool_return_string = b"""[{
+  "SourceFile": "testimage.jpg",
+  "ExifIFD:ISO": 100,
+  "ExifIFD:FNumber": 2.8,
+  "ExifIFD:ExposureCompensation": -0.5,
+  "Composite:LargeValue": 1e5,
+  "Composite:DecimalExponent": 1.5e+3,
+  "XMP-dc:Title": "Caf\\u00e9",
+  "XMP-dc:Subject": ["cloud", 3],
+  "XMP-xmp:Rating": null,
+  "Composite:Flag": true
+}]
+"""
+#
+###
+#
+def test_values_have_the_types_given_by_yaml(handler):
+    assert handler.return_parsed_extraction_output(exiftool_return_string) == \
+        yaml.load(exiftool_return_string, Loader=yaml.SafeLoader)[0]
+#
+###
+#
+def test_the_optional_decoder_gives_the_same_values(handler):
+    if handler.return_handler("orjson") is None:
+        return
+    output_without_exponents = exiftool_return_string.replace(
+        b"1e5", b"100000").replace(b"1.5e+3", b"1500.0")
+    parsed_output = handler.return_parsed_extraction_output(output_without_exponents)
+    handler.handlers["orjson"] = None
+    assert handler.return_parsed_extraction_output(output_without_exponents) == \
+        parsed_output
+    assert parsed_output == yaml.load(output_without_exponents, Loader=yaml.SafeLoader)[0]
+#
+###
+#
+def test_extract_decodes_the_output(fake_exiftool, handler, image_file_paths):
+    fake_exiftool.store_tags(image_file_paths[0], {"XMP-dc:Title": "Café"})
+    extracted_metadata = handler.extract(image_file_paths[0])
+    assert extracted_metadata["XMP-dc:Title"] == "Café"
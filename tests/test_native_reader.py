@@ -0,0 +1,94 @@
+#
+# Tests of the native JPEG reader, selected by the "native_jpeg_reader"
+# option.
+#
+import os
+
+import module_exiftool_python3
+from conftest import write_template
+from test_file_readiness import write_partial_jpeg
+#
+###
+#
+def test_exif_tags_are_read_with_exiftool_group_names(handler, image_file_paths):
+    natively_read_metadata = handler.return_natively_read_metadata(image_file_paths[0])
+    assert natively_read_metadata["SourceFile"] == image_file_paths[0]
+    assert natively_read_metadata["IFD0:ModifyDate"] == "2022:12:01 07:59:00"
+    assert natively_read_metadata["ExifIFD:DateTimeOriginal"] == "2022:12:01 07:59:00"
+#
+###
+#
+def test_xmp_properties_are_read_with_exiftool_group_names(handler, image_file_paths):
+    assert handler.embed_xmp_natively_in_jpeg(image_file_paths[0], {
+        "XMP-dc:Title": "Camera image",
+        "XMP-dc:Creator": ["First", "Second"],
+        "XMP-xmp:CreateDate": "2022:12:01 07:59:00"})
+    natively_read_metadata = handler.return_natively_read_metadata(image_file_paths[0])
+    assert natively_read_metadata["XMP-dc:Title"] == "Camera image"
+    assert natively_read_metadata["XMP-dc:Creator"] == ["First", "Second"]
+    assert natively_read_metadata["XMP-xmp:CreateDate"] == "2022:12:01 07:59:00"
+#
+###
+#
+def test_a_file_that_is_not_a_jpeg_is_not_read(handler, tmp_path):
+    text_file_path = str(tmp_path / "not_a_jpeg.jpg")
+    text_file = open(text_file_path, "w")
+    text_file.write("Not a JPEG file")
+    text_file.close()
+    assert handler.return_natively_read_metadata(text_file_path) is None
+    assert handler.return_natively_read_metadata(text_file_path + ".missing") is None
+#
+###
+#
+def test_the_overwrite_check_reads_natively(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("native_jpeg_reader", True)
+    handler.set_option("allow_tag_overwrites", False)
+    assert handler.embed_xmp_natively_in_jpeg(
+        image_file_paths[0], {"XMP-dc:Title": "Old title"})
+
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[0]) == 1
+    assert handler.embed_from_template(
+        template_id, {"site": "Chilbolton"}, image_file_paths[1]) == 0
+    assert fake_exiftool.return_read_sections() == []
+    assert len(fake_exiftool.return_write_sections()) == 1
+#
+###
+#
+def test_the_batch_check_reads_only_valid_and_ready_files_natively(fake_exiftool, handler, image_file_paths, tmp_path, monkeypatch):
+    handler.set_option("native_jpeg_reader", True)
+    handler.set_option("check_file_readiness", True)
+    handler.variables["file_readiness_maximum_wait"] = 0.2
+    for file_path in image_file_paths:
+        os.utime(file_path, (0.0, 0.0))
+    partial_file_path = os.path.join(
+        os.path.dirname(image_file_paths[0]), "partial.jpg")
+    write_partial_jpeg(partial_file_path, image_file_paths[0])
+
+    natively_read_file_paths = []
+    return_natively_read_metadata = \
+        module_exiftool_python3.Handler.return_natively_read_metadata
+
+    def record_native_read(self, file_path):
+        natively_read_file_paths.append(file_path)
+        return return_natively_read_metadata(self, file_path)
+
+    monkeypatch.setattr(
+        module_exiftool_python3.Handler, "return_natively_read_metadata",
+        record_native_read)
+    file_paths_and_metadata = list(handler.extract_many_for_overwrite_check(
+        [image_file_paths[0], 7, partial_file_path], ["XMP-dc:Title"]))
+    assert natively_read_file_paths == [image_file_paths[0]]
+    assert file_paths_and_metadata[0][1]["SourceFile"] == image_file_paths[0]
+    assert file_paths_and_metadata[1:] == [(7, {}), (partial_file_path, {})]
+    assert fake_exiftool.return_read_sections() == []
+
+    title_template_id = handler.load_a_template(write_template(tmp_path, "title_template.yaml", [
+        "- template_id: title",
+        "- XMP-dc:Title: \"Camera image\""]))
+    results = handler.embed_many_from_template(
+        title_template_id,
+        [(image_file_paths[1], {}), (7, {}), (partial_file_path, {})],
+        should_return_results=True)
+    assert [result.error_code for result in results] == \
+        ["", "invalid_file_path", "file_not_ready"]
@@ -0,0 +1,94 @@
+#
+# Tests of the native XMP writer, selected by the "xmp_writer" option.
+#
+import asyncio
+
+import module_exiftool_python3
+#
+###
+#
+def return_file_content(file_path):
+    image_file = open(file_path, "rb")
+    try:
+        return image_file.read()
+    finally:
+        image_file.close()
+#
+###
+#
+def test_natively_writable_metadata_are_written_without_exiftool(fake_exiftool, handler, image_file_paths):
+    handler.set_option("xmp_writer", "native")
+    exit_code = handler.embed_from_input(
+        {"XMP-dc:Title": "Camera image", "XMP-dc:Subject": ["cloud", "sky"]},
+        image_file_paths[0])
+    assert exit_code == 0
+    assert fake_exiftool.return_write_sections() == []
+
+    natively_read_metadata = handler.return_natively_read_metadata(image_file_paths[0])
+    assert natively_read_metadata["XMP-dc:Title"] == "Camera image"
+    assert natively_read_metadata["XMP-dc:Subject"] == ["cloud", "sky"]
+    assert natively_read_metadata["ExifIFD:DateTimeOriginal"] == "2022:12:01 07:59:00"
+#
+###
+#
+def test_a_tag_that_cannot_be_written_natively_leaves_the_whole_file_to_exiftool(fake_exiftool, handler, image_file_paths):
+    handler.set_option("xmp_writer", "native")
+    original_content = return_file_content(image_file_paths[0])
+    assert not handler.embed_xmp_natively_in_jpeg(image_file_paths[0], {
+        "XMP-dc:Title": "Camera image",
+        "XMP-iptcCore:CreatorWorkEmail": "someone@example.com"})
+    assert return_file_content(image_file_paths[0]) == original_content
+
+    exit_code = handler.embed_from_input({
+        "XMP-dc:Title": "Camera image",
+        "XMP-iptcCore:CreatorWorkEmail": "someone@example.com"},
+        image_file_paths[0])
+    assert exit_code == 0
+    assert "XMP-dc:Title" not in handler.return_natively_read_metadata(image_file_paths[0])
+    stored_tags = fake_exiftool.return_stored_tags(image_file_paths[0])
+    assert stored_tags["XMP-dc:Title"] == "Camera image"
+    assert stored_tags["XMP-iptcCore:CreatorWorkEmail"] == "someone@example.com"
+#
+###
+#
+def test_a_date_in_another_format_leaves_the_whole_file_to_exiftool(fake_exiftool, handler, image_file_paths):
+    original_content = return_file_content(image_file_paths[0])
+    assert not handler.embed_xmp_natively_in_jpeg(image_file_paths[0], {
+        "XMP-dc:Title": "Camera image",
+        "XMP-xmp:CreateDate": "20221128102800"})
+    assert return_file_content(image_file_paths[0]) == original_content
+#
+###
+#
+def test_the_batch_embed_uses_the_native_writer(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("xmp_writer", "native")
+    results = handler.embed_many_from_template(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths],
+        should_return_results=True)
+    assert [result.status for result in results] == ["embedded"] * 3
+    assert fake_exiftool.return_write_sections() == []
+    for file_path in image_file_paths:
+        assert handler.return_natively_read_metadata(file_path)["XMP-dc:Subject"] == \
+            ["cloud", "Chilbolton"]
+#
+###
+#
+def test_the_async_embed_uses_the_native_writer(fake_exiftool, handler, image_file_paths):
+    handler.set_option("xmp_writer", "native")
+    async_handler = module_exiftool_python3.AsyncHandler(handler)
+    exit_code = asyncio.run(async_handler.embed_from_input(
+        {"XMP-dc:Title": "Camera image"}, image_file_paths[0]))
+    assert exit_code == 0
+    assert fake_exiftool.return_write_sections() == []
+    assert handler.return_natively_read_metadata(image_file_paths[0])["XMP-dc:Title"] == \
+        "Camera image"
+#
+###
+#
+def test_the_parallel_embed_uses_the_native_writer(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("xmp_writer", "native")
+    results = handler.embed_many_in_parallel(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths],
+        number_of_workers=2)
+    assert [exit_code for file_path, exit_code, error_messages in results] == [0, 0, 0]
+    assert fake_exiftool.return_write_sections() == []
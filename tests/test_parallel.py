@@ -0,0 +1,78 @@
+#
+# Tests of Handler.embed_many_in_parallel.
+#
+import os
+
+from conftest import write_template
+#
+###
+#
+def test_files_are_tagged_by_worker_processes_in_order(fake_exiftool, handler, template_id, image_file_paths):
+    results = handler.embed_many_in_parallel(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths],
+        number_of_workers=2)
+    assert [(file_path, exit_code) for file_path, exit_code, error_messages in results] == \
+        [(file_path, 0) for file_path in image_file_paths]
+    for file_path in image_file_paths:
+        assert fake_exiftool.return_stored_tags(file_path)["XMP-dc:Subject"] == \
+            ["cloud", "Chilbolton"]
+
+    logged_sections = fake_exiftool.return_logged_sections()
+    assert all(logged_section["stay_open"] for logged_section in logged_sections)
+#
+###
+#
+def test_errors_are_returned_for_each_file(fake_exiftool, handler, template_id, image_file_paths):
+    fake_exiftool.set_failing_writes("075901")
+    results = handler.embed_many_in_parallel(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths],
+        number_of_workers=2)
+    assert [exit_code for file_path, exit_code, error_messages in results] == [0, 1, 0]
+    assert results[1][2] != []
+    assert results[0][2] == []
+#
+###
+#
+def test_results_are_returned_when_requested(fake_exiftool, handler, template_id, image_file_paths):
+    results = handler.embed_many_in_parallel(
+        template_id, [(file_path, {"site": "Chilbolton"}) for file_path in image_file_paths],
+        number_of_workers=2, should_return_results=True)
+    assert [result.file_path for result in results] == image_file_paths
+    assert [result.status for result in results] == ["embedded"] * 3
+#
+###
+#
+def test_an_invalid_number_of_workers_fails_every_file(fake_exiftool, handler, template_id, image_file_paths):
+    results = handler.embed_many_in_parallel(
+        template_id, [(file_path, {}) for file_path in image_file_paths],
+        number_of_workers=0)
+    assert [exit_code for file_path, exit_code, error_messages in results] == [1, 1, 1]
+    assert fake_exiftool.return_logged_sections() == []
+#
+###
+#
+def test_workers_use_the_file_name_pattern_of_the_handler(fake_exiftool, handler, image_file_paths, tmp_path):
+    assert handler.set_file_name_pattern(
+        r"^cam_(?P<instrument>\d)_(?P<capturetime>\d{14})\.jpg$") == 0
+    pattern_template_id = handler.load_a_template(write_template(tmp_path, "pattern_template.yaml", [
+        "- template_id: pattern",
+        "- XMP-dc:Source: \"{__instrument__}\""]))
+    renamed_file_paths = []
+    for file_number, file_path in enumerate(image_file_paths):
+        renamed_file_path = os.path.join(
+            os.path.dirname(file_path), "cam_{}_2022120107590{}.jpg".format(
+                file_number, file_number))
+        os.rename(file_path, renamed_file_path)
+        renamed_file_paths.append(renamed_file_path)
+    files_and_substitutions = [(file_path, {}) for file_path in renamed_file_paths]
+
+    handler.variables["maximum_number_of_files_per_chunk"] = 1
+    provider_results = list(handler.embed_many_from_provider(
+        pattern_template_id, files_and_substitutions, 2, True))
+    parallel_results = handler.embed_many_in_parallel(
+        pattern_template_id, files_and_substitutions, 2, True)
+    for results in [provider_results, parallel_results]:
+        assert [result.status for result in results] == ["embedded"] * 3
+    for file_number, file_path in enumerate(renamed_file_paths):
+        assert fake_exiftool.return_stored_tags(file_path)["XMP-dc:Source"] == \
+            str(file_number)
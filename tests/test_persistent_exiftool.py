@@ -0,0 +1,85 @@
+#
+# Tests of the persistent "-stay_open" ExifTool process.
+#
+import threading
+
+import module_exiftool_python3
+#
+###
+#
+def test_commands_share_one_stay_open_process(fake_exiftool, handler, image_file_paths):
+    handler.set_option("persistent_exiftool", True)
+    for image_file_path in image_file_paths:
+        extracted_metadata = handler.extract(image_file_path)
+        assert extracted_metadata["SourceFile"] == image_file_path
+
+    logged_sections = fake_exiftool.return_logged_sections()
+    assert len(logged_sections) == len(image_file_paths)
+    assert all(logged_section["stay_open"] for logged_section in logged_sections)
+    assert len(set(logged_section["pid"] for logged_section in logged_sections)) == 1
+#
+###
+#
+def test_exit_status_is_returned_for_each_command(fake_exiftool, handler, image_file_paths):
+    handler.set_option("persistent_exiftool", True)
+    exit_code, exiftool_return_string = handler.run_exiftool_command(
+        ["exiftool", "-j", image_file_paths[0]])
+    assert exit_code == 0
+    assert image_file_paths[0].encode("utf8") in exiftool_return_string
+
+    exit_code, exiftool_return_string = handler.run_exiftool_command(
+        ["exiftool", "-j", image_file_paths[0] + ".missing"])
+    assert exit_code == 1
+#
+###
+#
+def test_arguments_with_line_breaks_are_passed_intact(fake_exiftool, handler, image_file_paths):
+    handler.set_option("persistent_exiftool", True)
+    exit_code = handler.embed_from_input(
+        {"XMP-dc:Description": "First line\nSecond line\\n"},
+        image_file_paths[0])
+    assert exit_code == 0
+    assert fake_exiftool.return_stored_tags(image_file_paths[0])["XMP-dc:Description"] == \
+        "First line\nSecond line\\n"
+#
+###
+#
+def test_a_full_standard_error_pipe_does_not_block_the_process(fake_exiftool, handler, image_file_paths):
+    fake_exiftool.set_standard_error_noise(1000000)
+    handler.set_option("persistent_exiftool", True)
+    exit_codes = []
+    command_thread = threading.Thread(
+        target=lambda: exit_codes.append(handler.run_exiftool_command(
+            ["exiftool", "-j", image_file_paths[0]])[0]))
+    command_thread.start()
+    command_thread.join(timeout=30)
+    command_was_blocked = command_thread.is_alive()
+    if command_was_blocked:
+        handler.variables["exiftool_process"].kill()
+        command_thread.join()
+
+    assert not command_was_blocked
+    assert exit_codes == [0]
+#
+###
+#
+def test_close_ends_the_process_and_a_new_one_is_started_when_needed(fake_exiftool, handler, image_file_paths):
+    handler.set_option("persistent_exiftool", True)
+    handler.extract(image_file_paths[0])
+    exiftool_process = handler.variables["exiftool_process"]
+    handler.close()
+    assert handler.variables["exiftool_process"] is None
+    assert exiftool_process.poll() is not None
+
+    handler.extract(image_file_paths[1])
+    logged_sections = fake_exiftool.return_logged_sections()
+    assert logged_sections[0]["pid"] != logged_sections[1]["pid"]
+#
+###
+#
+def test_handler_is_a_context_manager(fake_exiftool, image_file_paths):
+    with module_exiftool_python3.Handler() as handler:
+        handler.set_option("persistent_exiftool", True)
+        handler.extract(image_file_paths[0])
+        exiftool_process = handler.variables["exiftool_process"]
+    assert exiftool_process.poll() is not None
@@ -0,0 +1,77 @@
+#
+# Tests of the prepared metadata cache, sized by the
+# "prepared_metadata_cache_size" option.
+#
+from conftest import write_template
+
+file_names = [
+    "20221201075900-ncas-cam-3.jpg",
+    "20221201080000-ncas-cam-3.jpg",
+    "20221201080100-ncas-cam-9.jpg"]
+#
+###
+#
+def test_any_non_negative_integer_is_accepted(handler):
+    for cache_size in [0, 1, 37, 100000]:
+        handler.set_option("prepared_metadata_cache_size", cache_size)
+        assert handler.variables["no_general_error_has_been_registered"]
+        assert handler.options["prepared_metadata_cache_size"]["value"] == cache_size
+#
+###
+#
+def test_other_values_are_rejected(handler):
+    handler.set_option("prepared_metadata_cache_size", 16)
+    for cache_size in [-1, 1.5, "16", None, True]:
+        handler.set_option("prepared_metadata_cache_size", cache_size)
+        assert not handler.variables["no_general_error_has_been_registered"]
+        assert handler.options["prepared_metadata_cache_size"]["value"] == 16
+#
+###
+#
+def test_files_with_the_same_substitutions_share_an_entry(handler, tmp_path):
+    template_id = handler.load_a_template(write_template(tmp_path, "capture.yaml", [
+        "- template_id: capture",
+        "- XMP-dc:Title: \"Image from {site}\"",
+        "- XMP-xmp:CreateDate: \"{__capturetime__:%Y:%m:%d %H:%M:%S}\"",
+        "- XMP-dc:Source: \"{__instrument__}\""]))
+    handler.set_option("prepared_metadata_cache_size", 4)
+    file_substitutions = handler.return_file_name_substitutions(template_id, file_names)
+
+    prepared_metadata = []
+    for file_number in range(len(file_names)):
+        handler.prepare_metadata_from_template(
+            template_id, {"site": "Chilbolton"}, "live", file_substitutions[file_number])
+        prepared_metadata.append(handler.metadata["prepared"])
+
+    statistics = handler.return_prepared_metadata_cache_statistics()
+    assert (statistics["hits"], statistics["misses"], statistics["size"]) == (2, 1, 1)
+    assert [metadata["XMP-xmp:CreateDate"] for metadata in prepared_metadata] == [
+        "2022:12:01 07:59:00", "2022:12:01 08:00:00", "2022:12:01 08:01:00"]
+    assert [metadata["XMP-dc:Source"] for metadata in prepared_metadata] == [
+        "ncas-cam-3", "ncas-cam-3", "ncas-cam-9"]
+    assert all(metadata["XMP-dc:Title"] == "Image from Chilbolton" for metadata in prepared_metadata)
+#
+###
+#
+def test_different_substitutions_have_their_own_entries(handler, template_id):
+    handler.set_option("prepared_metadata_cache_size", 1)
+    file_substitutions = handler.return_file_name_substitutions(template_id, file_names[:1])[0]
+    for site in ["Chilbolton", "Halley", "Chilbolton"]:
+        handler.prepare_metadata_from_template(
+            template_id, {"site": site}, "live", file_substitutions)
+        assert handler.metadata["prepared"]["XMP-dc:Subject"] == ["cloud", site]
+
+    statistics = handler.return_prepared_metadata_cache_statistics()
+    assert (statistics["hits"], statistics["misses"], statistics["size"]) == (0, 3, 1)
+#
+###
+#
+def test_a_new_file_name_pattern_clears_the_cache(handler, template_id):
+    handler.set_option("prepared_metadata_cache_size", 4)
+    handler.prepare_metadata_from_template(
+        template_id, {"site": "Chilbolton"}, "live",
+        handler.return_file_name_substitutions(template_id, file_names[:1])[0])
+    assert handler.return_prepared_metadata_cache_statistics()["size"] == 1
+    assert handler.set_file_name_pattern(
+        r"^(?P<capturetime>\d{14})-(?P<instrument>.+)\.jpg$") == 0
+    assert handler.return_prepared_metadata_cache_statistics()["size"] == 0
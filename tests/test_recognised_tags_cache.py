@@ -0,0 +1,52 @@
+#
+# Tests of the cached recognised tags lookup tables.
+#
+import os
+
+from conftest import write_template
+#
+###
+#
+def return_lookup_tables(handler):
+    return dict(
+        (variable_name, handler.variables[variable_name])
+        for variable_name in handler.variables["recognised_tags_variable_names"])
+#
+###
+#
+def test_the_tables_are_cached_and_reused(handler, tmp_path):
+    source_file_path = write_template(tmp_path, "tags.dat", [
+        "# Recognised tags",
+        "+ XMP-dc:Subject",
+        "  XMP-dc:Title",
+        "  IPTC:Title"])
+    handler.load_recognised_tags(source_file_path)
+    built_tables = return_lookup_tables(handler)
+    assert os.path.isfile(str(tmp_path / "tags.cache"))
+    assert built_tables["tag_supports_multiple_values"] == {
+        "XMP-dc:Subject": True, "XMP-dc:Title": False, "IPTC:Title": False}
+    assert built_tables["group_names_for_ambiguous_short_tag_name"] == {
+        "Title": ["IPTC", "XMP-dc"]}
+
+    handler.variables["tag_supports_multiple_values"] = {}
+    assert handler.load_recognised_tags_from_cache(source_file_path)
+    assert return_lookup_tables(handler) == built_tables
+#
+###
+#
+def test_a_changed_file_is_read_again(handler, tmp_path):
+    source_file_path = write_template(tmp_path, "tags.dat", ["  XMP-dc:Title"])
+    handler.load_recognised_tags(source_file_path)
+    write_template(tmp_path, "tags.dat", ["  XMP-dc:Title", "  XMP-dc:Source"])
+    assert not handler.load_recognised_tags_from_cache(source_file_path)
+    handler.load_recognised_tags(source_file_path)
+    assert "XMP-dc:Source" in handler.variables["tag_supports_multiple_values"]
+#
+###
+#
+def test_a_damaged_cache_file_is_ignored(handler, tmp_path):
+    source_file_path = write_template(tmp_path, "tags.dat", ["  XMP-dc:Title"])
+    write_template(tmp_path, "tags.cache", ["not a cache"])
+    assert not handler.load_recognised_tags_from_cache(source_file_path)
+    handler.load_recognised_tags(source_file_path)
+    assert handler.variables["tag_supports_multiple_values"] == {"XMP-dc:Title": False}
@@ -0,0 +1,69 @@
+#
+# Tests of the substitution providers accepted by the batch embedding
+# methods.
+#
+def test_dictionaries_generators_and_callables_are_accepted(fake_exiftool, handler, template_id, image_file_paths):
+    substitutions_for_file = dict(
+        (file_path, {"site": "Chilbolton"}) for file_path in image_file_paths)
+
+    def generate_files_and_substitutions():
+        for file_path in image_file_paths:
+            yield file_path, {"site": "Chilbolton"}
+
+    for substitution_provider in [
+            substitutions_for_file,
+            generate_files_and_substitutions(),
+            generate_files_and_substitutions]:
+        assert handler.embed_many_from_template(
+            template_id, substitution_provider) == [0, 0, 0]
+#
+###
+#
+def test_a_provider_is_consumed_one_chunk_at_a_time(fake_exiftool, handler, template_id, image_file_paths):
+    handler.variables["maximum_number_of_files_per_chunk"] = 2
+    supplied_file_paths = []
+
+    def generate_files_and_substitutions():
+        for file_path in image_file_paths:
+            supplied_file_paths.append(file_path)
+            yield file_path, {"site": "Chilbolton"}
+
+    file_results = handler.embed_many_from_provider(
+        template_id, generate_files_and_substitutions())
+    assert supplied_file_paths == []
+    assert next(file_results) == (image_file_paths[0], 0)
+    assert supplied_file_paths == image_file_paths[:2]
+    assert list(file_results) == [(image_file_paths[1], 0), (image_file_paths[2], 0)]
+    assert len(fake_exiftool.return_write_sections()) == 2
+#
+###
+#
+def test_worker_processes_return_results_in_order(fake_exiftool, handler, template_id, image_file_paths):
+    handler.variables["maximum_number_of_files_per_chunk"] = 1
+    results = list(handler.embed_many_from_provider(
+        template_id,
+        ((file_path, {"site": "Chilbolton"}) for file_path in image_file_paths),
+        number_of_workers=2, should_return_results=True))
+    assert [result.file_path for result in results] == image_file_paths
+    assert [result.status for result in results] == ["embedded"] * 3
+#
+###
+#
+def test_each_set_of_substitution_keys_is_validated_once(fake_exiftool, handler, template_id, image_file_paths):
+    results = handler.embed_many_from_template(
+        template_id,
+        [(image_file_paths[0], {"site": "Chilbolton"}),
+         (image_file_paths[1], {"site": "Cardington"}),
+         (image_file_paths[2], {"location": "Chilbolton"})],
+        should_return_results=True)
+    assert [result.status for result in results] == ["embedded", "embedded", "failed"]
+    assert results[2].error_code == "metadata_not_prepared"
+    assert handler.variables["validated_substitution_key_sets"][template_id] == \
+        set([(frozenset(["site"]), frozenset(["__instrument__"]))])
+#
+###
+#
+def test_an_unknown_template_yields_nothing(handler, image_file_paths):
+    assert list(handler.embed_many_from_provider(
+        "unknown", [(image_file_paths[0], {})])) == []
+    assert not handler.variables["no_general_error_has_been_registered"]
@@ -0,0 +1,146 @@
+#
+# Tests of loading templates from a directory, with the template cache and
+# hot reload.
+#
+import json, os, subprocess, sys, time
+
+import pytest
+
+import module_exiftool_python3
+from conftest import repository_directory_path, write_template
+#
+###
+#
+def write_site_template(directory_path, file_name, template_id, title):
+    return write_template(directory_path, file_name, [
+        "- template_id: {}".format(template_id),
+        "- XMP-dc:Title: \"{}\"".format(title),
+        "- XMP-dc:Subject: [\"cloud\", \"{site}\"]",
+        "- XMP-dc:Rights: \"Copyright {__utcnow__:%Y}\""])
+#
+###
+#
+@pytest.fixture
+def template_directory_path(tmp_path):
+    template_directory_path = tmp_path / "templates"
+    template_directory_path.mkdir()
+    write_site_template(template_directory_path, "first_template.yaml", "first", "First")
+    write_site_template(template_directory_path, "second_template.yml", "second", "Second")
+    write_template(template_directory_path, "notes.txt", ["Not a template."])
+    return str(template_directory_path)
+#
+###
+#
+def return_prepared_metadata(handler, template_id):
+    handler.prepare_metadata_from_template(template_id, {"site": "Chilbolton"})
+    return handler.metadata["prepared"]
+#
+###
+#
+def fail_to_parse(file_path):
+    raise AssertionError("{} was parsed".format(file_path))
+#
+###
+#
+def test_templates_are_loaded_and_cached_as_json(handler, template_directory_path):
+    template_id_for_file_path = handler.load_templates_from_directory(
+        template_directory_path)
+    assert sorted(template_id_for_file_path.values()) == ["first", "second"]
+
+    cache_file_path = os.path.join(template_directory_path, "first_template.cache.json")
+    cache_file = open(cache_file_path, "r", encoding="utf8")
+    cached_details = json.load(cache_file)
+    cache_file.close()
+    assert cached_details["template_details"]["template_id"] == "first"
+    assert "compiled_per_file_entries" not in cached_details["template_details"]
+#
+###
+#
+def test_a_cached_template_is_used_without_parsing(handler, template_directory_path, monkeypatch):
+    handler.load_templates_from_directory(template_directory_path)
+    parsed_template_details = handler.variables["templates"]["first"]
+    parsed_metadata = return_prepared_metadata(handler, "first")
+
+    monkeypatch.setattr(module_exiftool_python3, "parse_template_file", fail_to_parse)
+    cached_handler = module_exiftool_python3.Handler()
+    cached_handler.set_option("verbosity_level", 0)
+    cached_handler.load_templates_from_directory(template_directory_path)
+    cached_template_details = cached_handler.variables["templates"]["first"]
+    for details_name in ["file_state", "compiled_dynamic_entries",
+                         "compiled_time_dependent_entries", "compiled_per_file_entries"]:
+        assert cached_template_details[details_name] == parsed_template_details[details_name]
+    assert type(cached_template_details["file_state"]) == tuple
+    parsed_metadata.pop("XMP-xmp:MetadataDate", None)
+    parsed_metadata.pop("XMP-xmp:ModifyDate", None)
+    cached_metadata = return_prepared_metadata(cached_handler, "first")
+    for full_tag_name in parsed_metadata:
+        assert cached_metadata[full_tag_name] == parsed_metadata[full_tag_name]
+#
+###
+#
+def test_a_touched_template_with_unchanged_content_is_not_parsed(handler, template_directory_path, monkeypatch):
+    handler.load_templates_from_directory(template_directory_path)
+    first_file_path = os.path.join(template_directory_path, "first_template.yaml")
+    os.utime(first_file_path, (time.time() + 10.0, time.time() + 10.0))
+
+    monkeypatch.setattr(module_exiftool_python3, "parse_template_file", fail_to_parse)
+    cached_handler = module_exiftool_python3.Handler()
+    cached_handler.set_option("verbosity_level", 0)
+    assert cached_handler.load_templates_from_directory(
+        template_directory_path)[first_file_path] == "first"
+    assert cached_handler.variables["templates"]["first"]["file_state"][:2] == \
+        (os.stat(first_file_path).st_mtime_ns, os.stat(first_file_path).st_size)
+#
+###
+#
+def test_a_warm_cache_is_loaded_without_importing_yaml(handler, template_directory_path):
+    handler.load_templates_from_directory(template_directory_path)
+    loading_script = "\n".join([
+        "import sys",
+        "sys.path.insert(0, {!r})".format(repository_directory_path),
+        "import module_exiftool_python3",
+        "handler = module_exiftool_python3.Handler()",
+        "template_id_for_file_path = handler.load_templates_from_directory({!r})".format(
+            template_directory_path),
+        "print(sorted(template_id_for_file_path.values()), 'yaml' in sys.modules)"])
+    output = subprocess.check_output([sys.executable, "-c", loading_script])
+    assert output.decode("utf8").split() == ["['first',", "'second']", "False"]
+#
+###
+#
+def test_changed_templates_are_reloaded(handler, template_directory_path):
+    handler.load_templates_from_directory(template_directory_path)
+    first_file_path = write_site_template(
+        template_directory_path, "first_template.yaml", "first", "Revised")
+    os.utime(first_file_path, (time.time() + 10.0, time.time() + 10.0))
+
+    handler.load_templates_from_directory(template_directory_path)
+    assert return_prepared_metadata(handler, "first")["XMP-dc:Title"] == "Revised"
+#
+###
+#
+def test_a_changed_identifier_unloads_the_former_template(handler, template_directory_path):
+    handler.load_templates_from_directory(template_directory_path)
+    first_file_path = write_site_template(
+        template_directory_path, "first_template.yaml", "renamed", "First")
+    os.utime(first_file_path, (time.time() + 10.0, time.time() + 10.0))
+    os.remove(os.path.join(template_directory_path, "second_template.yml"))
+
+    template_id_for_file_path = handler.load_templates_from_directory(
+        template_directory_path)
+    assert template_id_for_file_path == {first_file_path: "renamed"}
+    assert "first" not in handler.variables["templates"]
+    assert "first" not in handler.templates
+    assert "second" not in handler.variables["templates"]
+    assert return_prepared_metadata(handler, "renamed")["XMP-dc:Title"] == "First"
+#
+###
+#
+def test_a_template_that_cannot_be_parsed_is_reported(handler, template_directory_path):
+    broken_file_path = write_template(
+        template_directory_path, "broken_template.yaml", ["- template_id: [unclosed"])
+    template_id_for_file_path = handler.load_templates_from_directory(
+        template_directory_path)
+    assert template_id_for_file_path[broken_file_path] == ""
+    assert sorted(template_id_for_file_path.values()) == ["", "first", "second"]
+    assert not handler.variables["no_general_error_has_been_registered"]
@@ -0,0 +1,71 @@
+#
+# Tests of sharing one Handler between threads.
+#
+import threading
+from concurrent.futures import ThreadPoolExecutor
+#
+###
+#
+def test_per_call_variables_and_metadata_belong_to_each_thread(handler):
+    handler.variables["no_general_error_has_been_registered"] = False
+    handler.metadata["prepared"] = {"XMP-dc:Title": "Main thread"}
+    values_seen_by_thread = {}
+
+    def read_and_write_the_context():
+        values_seen_by_thread["no_general_error_has_been_registered"] = \
+            handler.variables["no_general_error_has_been_registered"]
+        values_seen_by_thread["prepared"] = dict(handler.metadata["prepared"])
+        values_seen_by_thread["templates"] = handler.variables["templates"]
+        handler.variables["no_general_error_has_been_registered"] = True
+        handler.metadata["prepared"] = {"XMP-dc:Title": "Other thread"}
+
+    other_thread = threading.Thread(target=read_and_write_the_context)
+    other_thread.start()
+    other_thread.join()
+
+    assert values_seen_by_thread["no_general_error_has_been_registered"] == True
+    assert values_seen_by_thread["prepared"] == {}
+    assert values_seen_by_thread["templates"] is handler.variables["templates"]
+    assert handler.variables["no_general_error_has_been_registered"] == False
+    assert handler.metadata["prepared"] == {"XMP-dc:Title": "Main thread"}
+#
+###
+#
+def test_threads_prepare_metadata_independently(handler, template_id):
+    file_substitutions = handler.return_file_name_substitutions(
+        template_id, ["20221201075900-ncas-cam-3.jpg"])[0]
+
+    def prepare_metadata(site):
+        for repetition_number in range(50):
+            handler.prepare_metadata_from_template(
+                template_id, {"site": site}, file_substitutions=file_substitutions)
+            if handler.metadata["prepared"]["XMP-dc:Subject"] != ["cloud", site]:
+                return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert all(executor.map(
+            prepare_metadata, ["Site {}".format(site_number) for site_number in range(8)]))
+#
+###
+#
+def test_threads_embed_through_one_persistent_process(fake_exiftool, handler, template_id, image_file_paths):
+    handler.set_option("persistent_exiftool", True)
+
+    def embed_and_extract(file_number):
+        exit_code = handler.embed_from_template(
+            template_id, {"site": "Site {}".format(file_number)},
+            image_file_paths[file_number])
+        handler.extract(image_file_paths[file_number])
+        return exit_code, handler.metadata["extracted"].get("SourceFile")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        outcomes = list(executor.map(embed_and_extract, range(3)))
+
+    assert outcomes == [(0, file_path) for file_path in image_file_paths]
+    for file_number, file_path in enumerate(image_file_paths):
+        assert fake_exiftool.return_stored_tags(file_path)["XMP-dc:Subject"] == \
+            ["cloud", "Site {}".format(file_number)]
+    assert len(set(
+        logged_section["pid"]
+        for logged_section in fake_exiftool.return_logged_sections())) == 1
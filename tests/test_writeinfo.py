@@ -0,0 +1,98 @@
+#
+# Tests of the writeinfo.py batch tagging command.
+#
+import os, shutil
+
+import pytest
+
+import module_exiftool_python3, writeinfo
+from conftest import write_template
+#
+###
+#
+@pytest.fixture
+def template_file_path(tmp_path):
+    return write_template(tmp_path, "writeinfo_template.yaml", [
+        "- template_id: writeinfo",
+        "- XMP-dc:Title: \"Camera image\"",
+        "- XMP-dc:Source: \"{__instrument__}\""])
+#
+###
+#
+def test_files_are_tagged_with_per_file_latencies(fake_exiftool, template_file_path, image_file_paths, capsys):
+    exit_code = writeinfo.main([
+        template_file_path, os.path.dirname(image_file_paths[0]),
+        "--batch-size", "2", "--option", "verbosity_level", "0"])
+    assert exit_code == 0
+    for file_path in image_file_paths:
+        assert fake_exiftool.return_stored_tags(file_path)["XMP-dc:Source"] == \
+            "ncas-cam-3"
+    assert "Tagged 3 of 3 files" in capsys.readouterr().out
+#
+###
+#
+def test_batches_are_shared_between_worker_processes(fake_exiftool, template_file_path, image_file_paths, capsys):
+    exit_code = writeinfo.main([
+        template_file_path, os.path.dirname(image_file_paths[0]),
+        "--jobs", "2", "--batch-size", "1", "--option", "verbosity_level", "0"])
+    assert exit_code == 0
+    for file_path in image_file_paths:
+        assert fake_exiftool.return_stored_tags(file_path)["XMP-dc:Source"] == \
+            "ncas-cam-3"
+    assert len(fake_exiftool.return_write_sections()) == 3
+    assert "Tagged 3 of 3 files" in capsys.readouterr().out
+#
+###
+#
+def test_failed_files_are_reported_with_their_error_codes(fake_exiftool, template_file_path, image_file_paths, capsys):
+    fake_exiftool.set_failing_writes("075901")
+    exit_code = writeinfo.main([
+        template_file_path, os.path.dirname(image_file_paths[0]),
+        "--option", "verbosity_level", "0"])
+    assert exit_code == 1
+    output = capsys.readouterr().out
+    assert 'Failed to tag "{}" (exiftool_failed).'.format(image_file_paths[1]) in output
+    assert "Tagged 2 of 3 files" in output
+#
+###
+#
+def test_a_dry_run_prepares_each_file_with_its_file_name_substitutions(fake_exiftool, template_file_path, image_file_paths, capsys):
+    exit_code = writeinfo.main([
+        template_file_path, os.path.dirname(image_file_paths[0]),
+        "--dry-run", "--option", "verbosity_level", "0"])
+    assert exit_code == 0
+    assert "3 of 3 files would be tagged with" in capsys.readouterr().out
+    assert fake_exiftool.return_logged_sections() == []
+
+    shutil.copyfile(
+        image_file_paths[0],
+        os.path.join(os.path.dirname(image_file_paths[0]), "unnamed.jpg"))
+    exit_code = writeinfo.main([
+        template_file_path, os.path.dirname(image_file_paths[0]),
+        "--dry-run", "--option", "verbosity_level", "0"])
+    assert exit_code == 1
+    assert "3 of 4 files would be tagged" in capsys.readouterr().out
+#
+###
+#
+def test_watching_closes_the_handler_and_journal_on_an_error(fake_exiftool, template_file_path, image_file_paths, tmp_path, monkeypatch):
+    closed_names = []
+
+    def fail_to_run(self, *arguments, **keyword_arguments):
+        raise RuntimeError("watcher failed")
+
+    monkeypatch.setattr(
+        module_exiftool_python3.DirectoryWatcher, "run", fail_to_run)
+    monkeypatch.setattr(
+        module_exiftool_python3.Handler, "close",
+        lambda self: closed_names.append("close"))
+    monkeypatch.setattr(
+        module_exiftool_python3.Handler, "close_journal",
+        lambda self: closed_names.append("close_journal"))
+
+    with pytest.raises(RuntimeError):
+        writeinfo.main([
+            template_file_path, os.path.dirname(image_file_paths[0]), "--watch",
+            "--journal", str(tmp_path / "journal.sqlite"),
+            "--option", "verbosity_level", "0"])
+    assert closed_names[-2:] == ["close", "close_journal"]
@@ -1,19 +1,211 @@
 #! /usr/bin/python3
+#
+# writeinfo
+#
+# Tags images with metadata from an ExifTool handler template. Each root is
+# a directory, which is searched recursively for JPEG files, or a glob
+# pattern. For example
+#
+#   writeinfo.py /opt/scripts/tag_photos/iceland_template.yaml \
+#       /data/ncas-cam-3/images/20221130/10 --jobs 4
+#
+# Files are tagged in batches, each with a single ExifTool process, and with
+# --jobs greater than 1 the batches are shared between worker processes. A
+# throughput summary is printed at the end. With --journal, files recorded
+# as tagged by an earlier run are skipped, so that an interrupted run can be
+# resumed. With --watch the roots are instead watched for new images, which
+# are tagged as they arrive.
+#
+import argparse, glob, os, sys, time
 
-import sys, datetime, os, errno
-from dateutil.parser import *
+import module_exiftool_python3
+#
+###
+#
+def return_image_file_paths(roots, file_name_extensions):
+    image_file_paths = []
+    for root in roots:
+        if os.path.isdir(root):
+            for directory_path, directory_names, file_names in os.walk(root):
+                directory_names.sort()
+                for file_name in sorted(file_names):
+                    if file_name.lower().endswith(file_name_extensions):
+                        image_file_paths.append(
+                            os.path.join(directory_path, file_name))
+        else:
+            for file_path in sorted(glob.glob(root, recursive=True)):
+                if os.path.isfile(file_path):
+                    image_file_paths.append(file_path)
 
+    return list(dict.fromkeys(
+        os.path.abspath(file_path) for file_path in image_file_paths))
+#
+###
+#
+def return_percentile(sorted_values, fraction):
+    return sorted_values[int(fraction * (len(sorted_values) - 1) + 0.5)]
+#
+###
+#
+def set_handler_options(handler, option_settings):
+    for option_name, option_text in option_settings:
+        option_value = option_text
+        if ((option_name in handler.options) and
+            ("minimum_value" in handler.options[option_name])):
+            try:
+                option_value = int(option_text)
+            except ValueError:
+                pass
+        elif option_name in handler.options:
+            for permissible_value in handler.options[option_name]["permissible_values"]:
+                if str(permissible_value) == option_text:
+                    option_value = permissible_value
+        handler.set_option(option_name, option_value)
+        if not handler.variables["no_general_error_has_been_registered"]:
+            return 1
+    return 0
+#
+###
+#
+def main(arguments=None):
+    parser = argparse.ArgumentParser(
+        description="Tag images with metadata from an ExifTool handler template.")
+    parser.add_argument(
+        "template_file_path",
+        help="path of the YAML template file")
+    parser.add_argument(
+        "roots", nargs="+",
+        help="directories to search for JPEG files, or glob patterns")
+    parser.add_argument(
+        "--jobs", type=int, default=1,
+        help="number of worker processes (default 1)")
+    parser.add_argument(
+        "--batch-size", type=int, default=100,
+        help="number of files tagged by each ExifTool process (default 100)")
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="prepare the metadata and list the files without tagging them")
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="watch the root directories and tag new images as they arrive")
+    parser.add_argument(
+        "--journal", metavar="JOURNAL_FILE_PATH",
+        help="SQLite journal of tagged files, which are skipped when a run is repeated")
+    parser.add_argument(
+        "--option", nargs=2, action="append", default=[],
+        metavar=("NAME", "VALUE"),
+        help="set a handler option, for example --option blind_write True")
+    arguments = parser.parse_args(arguments)
 
-import module_exiftool_python3
-handler = module_exiftool_python3.Handler()
-template_id = handler.load_a_template("/opt/scripts/tag_photos/iceland_template.yaml")
+    if arguments.jobs < 1 or arguments.batch_size < 1:
+        parser.error("--jobs and --batch-size must be positive integers")
+
+    handler = module_exiftool_python3.Handler()
+    if set_handler_options(handler, arguments.option) != 0:
+        return 1
+
+    template_id = handler.load_a_template(arguments.template_file_path)
+    if template_id == "":
+        return 1
+
+    if arguments.journal is not None:
+        if handler.open_journal(arguments.journal) != 0:
+            return 1
+
+    if arguments.watch:
+        if len(arguments.roots) != 1:
+            parser.error("--watch requires a single root directory")
+        try:
+            latency_statistics = module_exiftool_python3.DirectoryWatcher(
+                handler, template_id, arguments.roots[0]).run()
+        finally:
+            handler.close()
+            handler.close_journal()
+        print("Tagged {} files, failed to tag {}.".format(
+            latency_statistics["number_of_files_tagged"],
+            latency_statistics["number_of_files_failed"]))
+        if latency_statistics["number_of_files_tagged"] > 0:
+            print("Latency from writing to tagging p50 {:.3f} s, p99 {:.3f} s.".format(
+                latency_statistics["p50_seconds"],
+                latency_statistics["p99_seconds"]))
+        return 0
+
+    image_file_paths = return_image_file_paths(
+        arguments.roots, handler.variables["jpeg_file_name_extensions"])
+    if len(image_file_paths) == 0:
+        print("No image files were found.")
+        return 0
+
+    # The metadata are prepared for each file, with the substitutions taken
+    # from its file name, but no file is written.
+    if arguments.dry_run:
+        number_of_failures = 0
+        numbers_of_tags = set()
+        for file_path, file_substitutions in zip(
+                image_file_paths,
+                handler.return_file_name_substitutions(
+                    template_id, image_file_paths)):
+            handler.prepare_metadata_from_template(
+                template_id, {}, file_substitutions=file_substitutions)
+            if handler.metadata["prepared"] == {}:
+                number_of_failures += 1
+                print('Failed to prepare the metadata for "{}".'.format(
+                    file_path))
+            else:
+                numbers_of_tags.add(len(handler.metadata["prepared"]))
+                print(file_path)
+        print("{} of {} files would be tagged with {} tags from template \"{}\".".format(
+            len(image_file_paths) - number_of_failures,
+            len(image_file_paths),
+            " or ".join(str(number_of_tags) for number_of_tags in sorted(numbers_of_tags)) or "no",
+            template_id))
+        if number_of_failures > 0:
+            return 1
+        return 0
+
+    # The files are embedded in batches of --batch-size files, shared
+    # between --jobs worker processes.
+    handler.variables["maximum_number_of_files_per_chunk"] = arguments.batch_size
+    number_of_batches = -(-len(image_file_paths) // arguments.batch_size)
 
-handler.set_option("allow_tag_overwrites", True)
-handler.set_option("verbosity_level" , 2)
+    # The latency of each file is the time spent preparing its metadata,
+    # checking it for overwrites and writing it, as recorded in its
+    # EmbeddingResult.
+    latencies = []
+    number_of_failures = 0
+    start_time = time.perf_counter()
+    try:
+        for result in handler.embed_many_from_provider(
+                template_id,
+                ((file_path, {}) for file_path in image_file_paths),
+                number_of_workers=min(arguments.jobs, number_of_batches),
+                should_return_results=True):
+            latencies.append(
+                result.prepare_seconds + result.check_seconds +
+                result.write_seconds)
+            if result.status == "failed":
+                number_of_failures += 1
+                print('Failed to tag "{}" ({}).'.format(
+                    result.file_path, result.error_code))
+    finally:
+        handler.close()
+        handler.close_journal()
+    elapsed_time = time.perf_counter() - start_time
 
-files = sys.argv[1]
-for f in files:
-    print ("files")
-    #exit_code = handler.embed_from_template(template_id,{},"files")
-#exit_code = handler.embed_from_template(template_id,{},"testimage.jpg")
+    latencies.sort()
+    print("Tagged {} of {} files in {:.1f} s ({:.1f} files/s); per-file latency p50 {:.3f} s, p99 {:.3f} s.".format(
+        len(image_file_paths) - number_of_failures,
+        len(image_file_paths),
+        elapsed_time,
+        len(image_file_paths) / elapsed_time,
+        return_percentile(latencies, 0.50),
+        return_percentile(latencies, 0.99)))
 
+    if number_of_failures > 0:
+        return 1
+    return 0
+#
+###
+#
+if __name__ == "__main__":
+    sys.exit(main())